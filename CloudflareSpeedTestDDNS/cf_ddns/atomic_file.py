@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+# cf_ddns 目录单独部署到 VPS（/root/sp/cf_ddns），这里的脚本共用这个写文件函数：
+# 在同一目录下建唯一的临时文件，写完 fsync 后改名替换，读取方只会看到旧文件或完整的新文件；
+# 任何一步失败都删除临时文件后再抛出。data 为 str（按 UTF-8 写入）或 bytes
+def write_atomic(path, data):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp 建的文件只有属主可读，沿用原文件的权限，没有原文件时用 0644
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
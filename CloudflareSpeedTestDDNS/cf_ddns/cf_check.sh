@@ -141,19 +141,28 @@ if [ ! -e "$flag_file" ]; then
 	        exit 1
 	    fi
 	fi
+touch "$flag_file"
+echo "初始化完成！"
+fi
+
+# 使用内置 Python 测速代替 CloudflareST（参数和 result.csv 格式相同），不需要检测架构和下载程序
+if [ "$CFST_NATIVE" = "true" ]; then
+  CloudflareST="python3 ./cf_ddns/speed_test.py -parallel ${CFST_PARALLEL:-4} -bw ${CFST_BW:-0}"
+  echo "使用内置测速：并行 ${CFST_PARALLEL:-4} 个，带宽上限 ${CFST_BW:-0} MB/s"
+else
 # 检测CloudflareST是否安装
-LATEST_URL=https://api.github.com/repos/XIU2/CloudflareSpeedTest/releases/latest
+if [ ! -f ${CloudflareST} ]; then
+	LATEST_URL=https://api.github.com/repos/XIU2/CloudflareSpeedTest/releases/latest
 
-latest_version() {
-  curl --silent $LATEST_URL | grep "tag_name" | cut -d '"' -f 4
-}
+	latest_version() {
+	  curl --silent $LATEST_URL | grep "tag_name" | cut -d '"' -f 4
+	}
 
-VERSION=$(latest_version)
+	VERSION=$(latest_version)
 
-if [ -e ./cf_ddns/tmp/ ]; then
-	rm -rf ./cf_ddns/tmp/
-fi
-if [ ! -f ${CloudflareST} ]; then
+	if [ -e ./cf_ddns/tmp/ ]; then
+		rm -rf ./cf_ddns/tmp/
+	fi
 	get_arch=`uname -m`
 	if [[ $get_arch =~ "x86_64" ]];then
 	    echo "this is x86_64"
@@ -188,6 +197,4 @@ if [[ ! -x ${CloudflareST} ]]; then
 #   echo "${CloudflareST} 文件不可执行"
    chmod +x $CloudflareST
 fi
-touch "$flag_file"
-echo "初始化完成！"
 fi
@@ -4,6 +4,10 @@
 
 ipv4Regex="((25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])"
 
+if [ "$DDNS_NATIVE" = "true" ]; then
+  # 内置DDNS自己查询并缓存区域ID（.zone_cache.json），账号信息有误时由它报错，这里不再每次查询
+  echo "使用内置DDNS，区域ID由 ddns.py 查询并缓存"
+else
 #获取空间id
 zone_id=$(curl -s -X GET "https://api.cloudflare.com/client/v4/zones?name=$(echo ${hostname[0]} | cut -d "." -f 2-)" -H "X-Auth-Email: $x_email" -H "X-Auth-Key: $api_key" -H "Content-Type: application/json" | jq -r '.result[0].id')
 
@@ -21,6 +25,7 @@ if [ "$IP_TO_CF" = "1" ]; then
 else
   echo "未配置Cloudflare账号"
 fi
+fi
 
 # 获取域名填写数量
 num=${#hostname[*]}
@@ -215,7 +220,13 @@ fi
 # Split the hostname into subdomain and domain outside the loop
 subdomain=$(echo "$CDNhostname" | cut -d '.' -f 1)
 domain=$(echo "$CDNhostname" | cut -d '.' -f 2-)
-updateDNSRecords $subdomain $domain > $informlog
+if [ "$DDNS_NATIVE" = "true" ]; then
+  # 内置DDNS：按根域名查询区域ID并缓存，对比现有记录后只做必要的新增/修改/删除，并发执行
+  x_email="$x_email" api_key="$api_key" api_token="$api_token" zone_id="" \
+    python3 ./cf_ddns/ddns.py --provider cloudflare --zone "$domain" --per-host 5 "$CDNhostname" > $informlog
+else
+  updateDNSRecords $subdomain $domain > $informlog
+fi
 
 if [ "$IP_TO_HOSTS" = 1 ]; then
   if [ ! -f "/etc/hosts.old_cfstddns_bak" ]; then
@@ -128,6 +128,12 @@ else
   sleep ${sleepTime}s;
 fi
 
+# 内置DDNS：循环中只处理hosts，DNS记录在循环结束后一次性对比更新
+if [ "$DDNS_NATIVE" = "true" ] && [ "$IP_TO_DNSPOD" = 1 ]; then
+  ddns_native=1
+  IP_TO_DNSPOD=0
+fi
+
 # 开始循环
 echo "正在更新域名，请稍后...";
 x=0;
@@ -268,6 +274,11 @@ while [[ ${x} -lt $num ]]; do
     sleep 3s;
 done > $informlog
 
+if [ "$ddns_native" = 1 ]; then
+  IP_TO_DNSPOD=1
+  dnspod_token="$dnspod_token" python3 ./cf_ddns/ddns.py --provider dnspod --mode each --line "$RECORD_LINE" "${hostname[@]}" >> $informlog
+fi
+
 if [ "$IP_TO_HOSTS" = 1 ]; then
   if [ ! -f "/etc/hosts.old_cfstddns_bak" ]; then
     cp /etc/hosts /etc/hosts.old_cfstddns_bak
@@ -0,0 +1,323 @@
+import argparse
+import concurrent.futures
+import csv
+import ipaddress
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+
+from atomic_file import write_atomic
+
+# 把测速结果同步到 DNS（Cloudflare / DNSPod），代替逐个域名调用 curl + jq：
+#   1. 区域 ID 缓存在 .zone_cache.json 中，不必每次运行重新查询
+#   2. 每个区域只分页列出一次现有的 A/AAAA 记录
+#   3. 与期望的 IP 对比，只生成最少的新增 / 修改 / 删除操作（能改就不删了再建）
+#   4. 操作在限速下并发执行：先新增和修改，再删除，更新过程中域名始终有可用记录
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ZONE_CACHE_FILE = os.path.join(script_dir, ".zone_cache.json")
+CLOUDFLARE_API = "https://api.cloudflare.com/client/v4"
+DNSPOD_API = "https://dnsapi.cn"
+TIMEOUT = 10
+RECORD_TYPES = ("A", "AAAA")
+CLOUDFLARE_PAGE_SIZE = 1000
+DNSPOD_PAGE_SIZE = 3000
+DEFAULT_RATES = {"cloudflare": 4.0, "dnspod": 2.0}  # 每秒请求数；Cloudflare 全局限制约 1200 次/5 分钟
+TTL = 60
+
+class DDNSError(Exception):
+    pass
+
+# 全局请求限速：所有并发线程共享，按固定间隔放行
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+def record_type(ip):
+    return "AAAA" if ipaddress.ip_address(ip).version == 6 else "A"
+
+# 区域 ID 缓存：{提供商: {根域名: 区域 ID}}
+def load_zone_cache(path=None):
+    try:
+        with open(path or ZONE_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_zone_cache(cache, path=None):
+    write_atomic(path or ZONE_CACHE_FILE, json.dumps(cache))
+
+# 提供商接口：
+#   zone_for(hostname)          → 区域标识（Cloudflare 为 zone_id，DNSPod 为根域名）
+#   list_records(zone)          → [{"id", "name"(完整域名), "type", "content"}]，只含 A/AAAA
+#   create(zone, name, type, content) / update(zone, record, content) / delete(zone, record)
+class CloudflareProvider:
+    name = "cloudflare"
+
+    def __init__(self, email=None, api_key=None, api_token=None, zone_id=None, api_base=CLOUDFLARE_API,
+                 zone_cache=None, limiter=None, zone_name=None):
+        self.api_base = api_base.rstrip('/')
+        self.zone_id = zone_id
+        self.zone_name = zone_name.rstrip('.') if zone_name else None
+        self.zone_cache = zone_cache if zone_cache is not None else {}
+        self.limiter = limiter or RateLimiter(0)
+        self.session = requests.Session()
+        if api_token:
+            self.session.headers['Authorization'] = f'Bearer {api_token}'
+        else:
+            self.session.headers.update({'X-Auth-Email': email or '', 'X-Auth-Key': api_key or ''})
+
+    def _request(self, method, path, **kwargs):
+        for attempt in range(3):
+            self.limiter.wait()
+            response = self.session.request(method, f"{self.api_base}{path}", timeout=TIMEOUT, **kwargs)
+            if response.status_code == 429 and attempt < 2:
+                time.sleep(float(response.headers.get('Retry-After') or 2 ** attempt))
+                continue
+            break
+        try:
+            data = response.json()
+        except ValueError:
+            raise DDNSError(f"{method} {path} 返回无效内容. HTTP 状态码: {response.status_code}")
+        if not data.get('success'):
+            raise DDNSError(f"{method} {path} 失败: {data.get('errors')}")
+        return data
+
+    # 指定了根域名（zone_name）时只查询它，否则从最长的后缀开始逐级查询，命中后写入缓存
+    def zone_for(self, hostname):
+        if self.zone_id:
+            return self.zone_id
+        cache = self.zone_cache.setdefault(self.name, {})
+        labels = hostname.rstrip('.').split('.')
+        suffixes = [self.zone_name] if self.zone_name else ['.'.join(labels[i:]) for i in range(len(labels) - 1)]
+        for suffix in suffixes:
+            if suffix in cache:
+                return cache[suffix]
+        for suffix in suffixes:
+            result = self._request('GET', '/zones', params={'name': suffix})['result']
+            if result:
+                cache[suffix] = result[0]['id']
+                return cache[suffix]
+        raise DDNSError(f"找不到 {hostname} 所在的区域，检查cloudflare账号信息填写是否正确!")
+
+    def list_records(self, zone):
+        records = []
+        page = 1
+        while True:
+            data = self._request('GET', f"/zones/{zone}/dns_records",
+                                 params={'per_page': CLOUDFLARE_PAGE_SIZE, 'page': page})
+            records += [{"id": r['id'], "name": r['name'], "type": r['type'], "content": r['content']}
+                        for r in data['result'] if r['type'] in RECORD_TYPES]
+            if page >= (data.get('result_info') or {}).get('total_pages', 1):
+                return records
+            page += 1
+
+    def create(self, zone, name, rtype, content):
+        self._request('POST', f"/zones/{zone}/dns_records",
+                      json={'type': rtype, 'name': name, 'content': content, 'ttl': TTL, 'proxied': False})
+
+    def update(self, zone, record, content):
+        self._request('PATCH', f"/zones/{zone}/dns_records/{record['id']}", json={'content': content})
+
+    def delete(self, zone, record):
+        self._request('DELETE', f"/zones/{zone}/dns_records/{record['id']}")
+
+class DnspodProvider:
+    name = "dnspod"
+
+    def __init__(self, token, line="默认", api_base=DNSPOD_API, limiter=None):
+        self.token = token
+        self.line = line
+        self.api_base = api_base.rstrip('/')
+        self.limiter = limiter or RateLimiter(0)
+        self.session = requests.Session()
+
+    def _request(self, action, allow=("1",), **params):
+        self.limiter.wait()
+        params.update(login_token=self.token, format='json')
+        response = self.session.post(f"{self.api_base}/{action}", data=params, timeout=TIMEOUT)
+        try:
+            data = response.json()
+        except ValueError:
+            raise DDNSError(f"{action} 返回无效内容. HTTP 状态码: {response.status_code}")
+        status = data.get('status') or {}
+        if str(status.get('code')) not in allow:
+            raise DDNSError(f"{action} 失败: {status.get('message')}")
+        return data
+
+    # 根域名取最后两级，eu.org 下取最后三级
+    def zone_for(self, hostname):
+        labels = hostname.rstrip('.').split('.')
+        keep = 3 if labels[-2:] == ['eu', 'org'] else 2
+        return '.'.join(labels[-keep:])
+
+    def _sub_domain(self, zone, name):
+        return '@' if name == zone else name[:-len(zone) - 1]
+
+    def list_records(self, zone):
+        records = []
+        offset = 0
+        while True:
+            # 状态码 10 表示该域名下没有记录
+            data = self._request('Record.List', allow=("1", "10"), domain=zone, offset=offset, length=DNSPOD_PAGE_SIZE)
+            page = data.get('records') or []
+            for r in page:
+                if r['type'] in RECORD_TYPES and r.get('line', self.line) == self.line:
+                    name = zone if r['name'] == '@' else f"{r['name']}.{zone}"
+                    records.append({"id": r['id'], "name": name, "type": r['type'], "content": r['value']})
+            offset += len(page)
+            total = int((data.get('info') or {}).get('records_num') or 0)
+            if not page or offset >= total:
+                return records
+
+    def create(self, zone, name, rtype, content):
+        self._request('Record.Create', domain=zone, sub_domain=self._sub_domain(zone, name),
+                      record_type=rtype, record_line=self.line, value=content)
+
+    def update(self, zone, record, content):
+        self._request('Record.Modify', domain=zone, record_id=record['id'], sub_domain=self._sub_domain(zone, record['name']),
+                      record_type=record['type'], record_line=self.line, value=content)
+
+    def delete(self, zone, record):
+        self._request('Record.Remove', domain=zone, record_id=record['id'])
+
+# 计算一个域名的最少变更：内容已正确的记录保留；多余的旧记录优先改成缺少的 IP，剩下的再删除或新增
+# 返回 [(操作, 完整域名, 记录或 None, 新内容或 None)]
+def plan_changes(name, existing, desired):
+    ops = []
+    for rtype in RECORD_TYPES:
+        want = [ip for ip in dict.fromkeys(desired) if record_type(ip) == rtype]
+        stale = []
+        kept = set()
+        for record in existing:
+            if record['name'].lower() != name.lower() or record['type'] != rtype:
+                continue
+            if record['content'] in want and record['content'] not in kept:
+                kept.add(record['content'])
+            else:
+                stale.append(record)
+        missing = [ip for ip in want if ip not in kept]
+        for record, ip in zip(stale, missing):
+            ops.append(("update", name, record, ip))
+        for record in stale[len(missing):]:
+            ops.append(("delete", name, record, None))
+        for ip in missing[len(stale):]:
+            ops.append(("create", name, None, ip))
+    return ops
+
+def apply_changes(provider, zone, ops, workers):
+    def run(op):
+        action, name, record, content = op
+        try:
+            if action == "create":
+                provider.create(zone, name, record_type(content), content)
+                return True, f"{name}成功指向IP地址{content}"
+            if action == "update":
+                provider.update(zone, record, content)
+                return True, f"{name}由{record['content']}更新为{content}"
+            provider.delete(zone, record)
+            return True, f"成功删除DNS记录{name} {record['content']}"
+        except (DDNSError, requests.RequestException) as e:
+            return False, f"{name} {action} 失败: {e}"
+
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for phase in (("create", "update"), ("delete",)):
+            results += executor.map(run, [op for op in ops if op[0] in phase])
+    return results
+
+# assignments: {完整域名: [IP, ...]}；每个区域只列出一次记录
+def sync(provider, assignments, workers=4):
+    zones = {}
+    for name in assignments:
+        zones.setdefault(provider.zone_for(name), []).append(name)
+    results = []
+    for zone, names in zones.items():
+        existing = provider.list_records(zone)
+        ops = [op for name in names for op in plan_changes(name, existing, assignments[name])]
+        if not ops:
+            results += [(True, f"{name}记录无需更新") for name in names]
+            continue
+        results += apply_changes(provider, zone, ops, workers)
+    return results
+
+# 读取测速结果：跳过标题行和下载速度为 0 的 IP
+def load_result_ips(path):
+    ips = []
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = csv.reader(f)
+        next(rows, None)
+        for row in rows:
+            if len(row) < 6:
+                continue
+            if row[5].strip() in ("0.00", "0"):
+                print(f"{row[0]}测速为0，跳过更新DNS，检查配置是否能正常测速！")
+                continue
+            ips.append(row[0].strip())
+    return ips
+
+# each：第 N 个域名指向第 N 个 IP；all：每个域名都指向前 per_host 个 IP
+def build_assignments(hostnames, ips, mode, per_host):
+    if mode == "each":
+        return {name: [ip] for name, ip in zip(hostnames, ips)}
+    return {name: ips[:per_host] for name in hostnames}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按测速结果更新 Cloudflare / DNSPod 的 DNS 记录')
+    parser.add_argument('hostnames', nargs='+', help='需要 DDNS 的完整域名')
+    parser.add_argument('--provider', choices=("cloudflare", "dnspod"), default="cloudflare")
+    parser.add_argument('--zone', help='Cloudflare 根域名，区域 ID 按它查询并缓存（默认按域名后缀逐级查询）')
+    parser.add_argument('--result', default=os.path.join(script_dir, 'result.csv'))
+    parser.add_argument('--mode', choices=("all", "each"), default="all")
+    parser.add_argument('--per-host', type=int, default=5, help='mode=all 时每个域名指向的 IP 数')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, help='每秒请求数上限（默认 cloudflare 4、dnspod 2）')
+    parser.add_argument('--line', default=os.getenv('RECORD_LINE') or "默认", help='DNSPod 线路')
+    parser.add_argument('--api-base', help='API 地址（测试时可指向本地模拟服务）')
+    args = parser.parse_args(argv)
+
+    limiter = RateLimiter(args.rate if args.rate is not None else DEFAULT_RATES[args.provider])
+    zone_cache = load_zone_cache()
+    if args.provider == "cloudflare":
+        provider = CloudflareProvider(os.getenv('x_email'), os.getenv('api_key'), os.getenv('api_token'),
+                                      os.getenv('zone_id'), args.api_base or CLOUDFLARE_API, zone_cache, limiter,
+                                      args.zone)
+    else:
+        provider = DnspodProvider(os.getenv('dnspod_token'), args.line, args.api_base or DNSPOD_API, limiter)
+
+    try:
+        ips = load_result_ips(args.result)
+    except FileNotFoundError:
+        print(f"CSV文件{args.result}不存在")
+        return 1
+    if not ips:
+        print("没有可用的优选IP，跳过更新DNS")
+        return 1
+    try:
+        results = sync(provider, build_assignments(args.hostnames, ips, args.mode, args.per_host), args.workers)
+    except (DDNSError, requests.RequestException) as e:
+        print(f"更新DNS失败: {e}")
+        return 1
+    finally:
+        save_zone_cache(zone_cache)
+    for _, message in results:
+        print(message)
+    return 0 if all(ok for ok, _ in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import base64
+import hashlib
+
+import requests
+
+# 通过 Git Data API 把多个文件放进一次提交：
+#   读取分支引用 → 读取提交的树 → 本地计算每个文件的 blob SHA 并与树中对比
+#   → 只为有变化的文件创建新树 → 创建提交 → 更新分支引用
+# 内容全部未变化时只有三次读取请求，不产生任何写入和提交
+GITHUB_API = "https://api.github.com"
+TIMEOUT = 30
+FILE_MODE = "100644"
+
+class PublishError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+# 与 `git hash-object` 相同：sha1("blob <长度>\0" + 内容)
+def git_blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+class GitHubPublisher:
+    def __init__(self, repo, token, branch=None, api_base=GITHUB_API, session=None):
+        self.repo = repo
+        self.branch = branch
+        self.api_base = api_base.rstrip('/')
+        self.session = session or requests.Session()
+        self.session.headers.update({
+            'Authorization': f'token {token}',
+            'Accept': 'application/vnd.github+json',
+        })
+
+    def _request(self, method, path, **kwargs):
+        response = self.session.request(method, f"{self.api_base}/repos/{self.repo}{path}", timeout=TIMEOUT, **kwargs)
+        if response.status_code >= 400:
+            raise PublishError(f"{method} {path} 失败. HTTP 状态码: {response.status_code} {response.text[:200]}", response.status_code)
+        return response.json()
+
+    def _branch(self):
+        if not self.branch:
+            self.branch = self._request('GET', '')['default_branch']
+        return self.branch
+
+    # 远端树中 {路径: blob SHA}；要发布的路径含子目录时才递归获取
+    # 仓库很大时 API 返回的树会被截断（truncated），缺少的路径再逐级读取目录树查找
+    def _remote_blobs(self, tree_sha, paths):
+        tree = self._request('GET', f"/git/trees/{tree_sha}", params={'recursive': '1'} if any('/' in p for p in paths) else None)
+        blobs = {item['path']: item['sha'] for item in tree.get('tree', []) if item.get('type') == 'blob'}
+        if tree.get('truncated'):
+            listings = {}
+            for path in paths:
+                if path not in blobs:
+                    sha = self._lookup_path(tree_sha, path, listings)
+                    if sha:
+                        blobs[path] = sha
+        return blobs
+
+    # 按路径逐级读取目录树（不递归），读过的目录按树 SHA 缓存在 listings 中；不存在时返回 None
+    def _lookup_path(self, tree_sha, path, listings):
+        sha = tree_sha
+        parts = path.split('/')
+        for depth, name in enumerate(parts):
+            if sha not in listings:
+                listings[sha] = {item['path']: item for item in self._request('GET', f"/git/trees/{sha}").get('tree', [])}
+            item = listings[sha].get(name)
+            if not item or item.get('type') != ('blob' if depth == len(parts) - 1 else 'tree'):
+                return None
+            sha = item['sha']
+        return sha
+
+    def _tree_entry(self, path, data):
+        try:
+            return {'path': path, 'mode': FILE_MODE, 'type': 'blob', 'content': data.decode('utf-8')}
+        except UnicodeDecodeError:
+            blob = self._request('POST', '/git/blobs', json={'content': base64.b64encode(data).decode('ascii'), 'encoding': 'base64'})
+            return {'path': path, 'mode': FILE_MODE, 'type': 'blob', 'sha': blob['sha']}
+
+    # files: {仓库中的路径: bytes}；返回 (新提交 SHA 或 None, 有变化的路径列表)
+    def publish(self, files, message, retries=1):
+        branch = self._branch()
+        for attempt in range(retries + 1):
+            head = self._request('GET', f"/git/ref/heads/{branch}")['object']['sha']
+            base_tree = self._request('GET', f"/git/commits/{head}")['tree']['sha']
+            remote = self._remote_blobs(base_tree, files)
+            changed = [path for path, data in files.items() if remote.get(path) != git_blob_sha(data)]
+            if not changed:
+                return None, []
+            tree = self._request('POST', '/git/trees', json={
+                'base_tree': base_tree,
+                'tree': [self._tree_entry(path, files[path]) for path in changed],
+            })
+            commit = self._request('POST', '/git/commits', json={'message': message, 'tree': tree['sha'], 'parents': [head]})
+            try:
+                self._request('PATCH', f"/git/refs/heads/{branch}", json={'sha': commit['sha'], 'force': False})
+            except PublishError as e:
+                # 期间分支被其他提交推进（非快进，422），基于最新的提交重新计算
+                if e.status != 422 or attempt == retries:
+                    raise
+                continue
+            return commit['sha'], changed
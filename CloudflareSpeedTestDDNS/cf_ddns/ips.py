@@ -1,37 +1,296 @@
-import requests
+import argparse
+import concurrent.futures
+import hashlib
+import ipaddress
+import json
 import os
+import sys
+import time
+
+import requests
+
+from atomic_file import write_atomic
 
-# 定义URL和目标文件路径
+# 下载候选 IP 列表（Fission_ip.txt）并生成 ip.txt：
+#   1. 边下载边写入 ip.txt.part（分块写入，下载缓冲大小固定），中断后用 Range + If-Range 续传
+#   2. 每收到一块就按行校验、规范化、去重，写入 ip.txt.tmp，并可立即交给测速（--probe）；
+#      去重需要记住已出现的条目，这部分内存与不重复的条目数成正比（约每条 100 字节）
+#   3. 下载完成后校验长度（Content-Length/Content-Range）、可选的 SHA-256 和有效行比例，全部通过才替换 ip.txt
+#   4. 本地文件存在时发送条件请求，内容未变化时服务器返回 304，无需重新下载
 url = "https://raw.githubusercontent.com/lijboy/CloudflareCDNFission/main/Fission_ip.txt"
 script_dir = os.path.dirname(os.path.abspath(__file__))  # 获取脚本所在目录
 target_file = os.path.join(script_dir, "ip.txt")  # 使用绝对路径
+CACHE_NAME = ".ip_txt_cache.json"  # 与输出文件同目录，保存上次下载的 ETag/Last-Modified、SHA-256 和续传信息
 
-try:
-    # 发送GET请求获取内容
-    response = requests.get(url)
-    response.raise_for_status()  # 如果请求不成功，将引发异常
-
-    # 获取内容
-    content = response.text
-    
-    # 将内容写入文件
-    with open(target_file, 'w', encoding='utf-8') as file:
-        file.write(content)
-    
-    print(f"内容已成功写入 {target_file}")
-    
-    # 验证文件是否被创建和写入
-    if os.path.exists(target_file):
-        print(f"文件已成功创建。大小: {os.path.getsize(target_file)} 字节")
-    else:
-        print("文件未能成功创建")
+CHUNK_SIZE = 64 * 1024
+# Range 偏移按收到的字节计算，必须是未压缩的原始内容；requests 默认带 gzip/deflate，这里显式要求不压缩
+NO_COMPRESSION = {'Accept-Encoding': 'identity'}
+TIMEOUT = 30
+RETRIES = 3
+
+class IntegrityError(Exception):
+    pass
+
+# 读取上次下载的缓存信息
+def load_cache_info(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+def save_cache_info(cache_file, info):
+    write_atomic(cache_file, json.dumps(info))
+
+# 单个 IP 规范为压缩写法，网段规范为网络地址/前缀；# 之后的内容忽略；无效行返回 None
+def normalize_line(line):
+    entry = line.split('#', 1)[0].strip()
+    if not entry:
+        return None
+    try:
+        if '/' in entry:
+            network = ipaddress.ip_network(entry, strict=False)
+            return str(network.network_address) if network.num_addresses == 1 else str(network)
+        return str(ipaddress.ip_address(entry))
+    except ValueError:
+        return None
+
+# 把任意切分的字节块还原成完整的行，跨块的半行留到下一块
+class LineSplitter:
+    def __init__(self):
+        self.rest = b''
+
+    def feed(self, chunk):
+        lines = (self.rest + chunk).split(b'\n')
+        self.rest = lines.pop()
+        return [line.decode('utf-8', 'replace') for line in lines]
+
+    def close(self):
+        rest, self.rest = self.rest, b''
+        return [rest.decode('utf-8', 'replace')] if rest else []
+
+def _is_encoded(response):
+    return response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+
+def _expected_total(response, offset):
+    if response.status_code == 206:
+        content_range = response.headers.get('Content-Range', '')
+        total = content_range.rsplit('/', 1)[-1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length')
+    return offset + int(length) if length and length.isdigit() and not _is_encoded(response) else None
+
+class CandidateDownload:
+    def __init__(self, source_url, target, expected_sha256=None, on_candidate=None):
+        self.url = source_url
+        self.target = target
+        self.part_path = f"{target}.part"
+        self.tmp_path = f"{target}.tmp"
+        self.cache_file = os.path.join(os.path.dirname(os.path.abspath(target)), CACHE_NAME)
+        self.expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        self.on_candidate = on_candidate
+        self.notified = set()
+        self.stats = {"bytes": 0, "resumed_from": 0, "valid": 0, "invalid": 0, "duplicates": 0, "unchanged": False}
+        self._reset()
 
-except requests.RequestException as e:
-    print(f"请求错误: {e}")
-except IOError as e:
-    print(f"IO错误: {e}")
-except Exception as e:
-    print(f"发生未知错误: {e}")
+    def _reset(self):
+        self.hasher = hashlib.sha256()
+        self.splitter = LineSplitter()
+        self.seen = set()
+        self.offset = 0
+        self.out = None
+        self.stats.update(valid=0, invalid=0, duplicates=0)
+
+    def _handle_line(self, line):
+        entry = normalize_line(line)
+        if entry is None:
+            if line.split('#', 1)[0].strip():
+                self.stats["invalid"] += 1
+            return
+        if entry in self.seen:
+            self.stats["duplicates"] += 1
+            return
+        self.seen.add(entry)
+        self.stats["valid"] += 1
+        self.out.write(entry + '\n')
+        if self.on_candidate and entry not in self.notified:
+            self.notified.add(entry)
+            self.on_candidate(entry)
+
+    def _consume(self, chunk):
+        self.hasher.update(chunk)
+        self.offset += len(chunk)
+        for line in self.splitter.feed(chunk):
+            self._handle_line(line)
+
+    def _restart(self):
+        self._reset()
+        self.out = open(self.tmp_path, 'w', encoding='utf-8')
+        open(self.part_path, 'wb').close()
+
+    # 先处理上次中断时已下载的部分，返回可用于续传的校验值（ETag 或 Last-Modified）
+    def _replay_partial(self, info):
+        partial = info.get('partial') or {}
+        validator = partial.get('etag') or partial.get('last_modified')
+        self.out = open(self.tmp_path, 'w', encoding='utf-8')
+        if not (os.path.exists(self.part_path) and partial.get('url') == self.url and validator):
+            open(self.part_path, 'wb').close()
+            return None
+        with open(self.part_path, 'rb') as part:
+            for chunk in iter(lambda: part.read(CHUNK_SIZE), b''):
+                self._consume(chunk)
+        self.stats["resumed_from"] = self.offset
+        return validator if self.offset else None
+
+    def run(self, session):
+        info = load_cache_info(self.cache_file)
+        try:
+            validator = self._replay_partial(info)
+            total = None
+            for attempt in range(RETRIES):
+                headers = dict(NO_COMPRESSION)
+                if validator and self.offset:
+                    headers['Range'] = f"bytes={self.offset}-"
+                    headers['If-Range'] = validator
+                elif os.path.exists(self.target) and info.get('url') == self.url:
+                    if info.get('etag'):
+                        headers['If-None-Match'] = info['etag']
+                    if info.get('last_modified'):
+                        headers['If-Modified-Since'] = info['last_modified']
+                try:
+                    response = session.get(self.url, headers=headers, stream=True, timeout=TIMEOUT)
+                    if response.status_code == 304:
+                        self.stats["unchanged"] = True
+                        self._discard(keep_part=False)
+                        return self.stats
+                    if response.status_code == 416:
+                        # 已下载部分与服务器不一致，从头下载
+                        validator = None
+                        self._restart()
+                        continue
+                    response.raise_for_status()
+                    if response.status_code == 200 and self.offset:
+                        print("服务器未接受续传（内容已变化或不支持 Range），从头下载")
+                        self._restart()
+                    total = _expected_total(response, self.offset)
+                    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                    if _is_encoded(response):
+                        # 服务器仍返回了压缩内容：解压后的字节数不能作为 Range 偏移，本次不支持续传
+                        validator = None
+                    info['partial'] = {'url': self.url, 'etag': response.headers.get('ETag'),
+                                       'last_modified': response.headers.get('Last-Modified')} if validator else None
+                    save_cache_info(self.cache_file, info)
+                    with open(self.part_path, 'ab') as part:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            part.write(chunk)
+                            self._consume(chunk)
+                    if total is not None and self.offset < total:
+                        raise requests.exceptions.ChunkedEncodingError(f"连接提前结束（{self.offset}/{total}）")
+                    break
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == RETRIES - 1:
+                        raise
+                    print(f"下载中断（已收到 {self.offset} 字节），{2 ** attempt}s 后续传: {e}")
+                    time.sleep(2 ** attempt)
+            for line in self.splitter.close():
+                self._handle_line(line)
+            # ip.txt.tmp 是边下载边写的，无法整体交给 write_atomic；同样先 fsync 再改名
+            self.out.flush()
+            os.fsync(self.out.fileno())
+            self.out.close()
+            self._verify(total)
+        except IntegrityError:
+            # 校验失败说明已下载的内容不可用，连同 .part 一起删除，下次从头下载
+            self._discard(keep_part=False)
+            raise
+        except BaseException:
+            # 网络错误时保留 .part 供下次续传
+            self._discard(keep_part=True)
+            raise
+
+        os.replace(self.tmp_path, self.target)
+        os.remove(self.part_path)
+        info.pop('partial', None)
+        info.update(url=self.url, etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'), sha256=self.hasher.hexdigest())
+        save_cache_info(self.cache_file, info)
+        self.stats["bytes"] = self.offset
+        return self.stats
+
+    def _discard(self, keep_part):
+        if self.out and not self.out.closed:
+            self.out.close()
+        for path in (self.tmp_path,) if keep_part else (self.tmp_path, self.part_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _verify(self, total):
+        if total is not None and self.offset != total:
+            raise IntegrityError(f"长度不符：收到 {self.offset} 字节，应为 {total} 字节")
+        digest = self.hasher.hexdigest()
+        if self.expected_sha256 and digest != self.expected_sha256:
+            raise IntegrityError(f"SHA-256 不符：{digest}")
+        # 返回的是错误页面等内容时有效行会很少，保留原有 ip.txt
+        if not self.stats["valid"] or self.stats["invalid"] > self.stats["valid"]:
+            raise IntegrityError(f"有效行过少：有效 {self.stats['valid']} 行，无效 {self.stats['invalid']} 行")
+
+# 边下载边测速：每得到一个候选就提交一次 TCP 延迟测试，网段取其中一个地址
+def start_probe(port, workers):
+    sys.path.insert(0, script_dir)
+    from speed_test import tcp_ping
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    futures = []
+    started = time.perf_counter()
+
+    def on_candidate(entry):
+        ip = entry
+        if '/' in entry:
+            network = ipaddress.ip_network(entry)
+            ip = str(next(network.hosts(), network.network_address))
+        if not futures:
+            print(f"收到第一个候选（{(time.perf_counter() - started) * 1000:.0f}ms），开始测速")
+        futures.append(executor.submit(tcp_ping, ip, port, 1))
+
+    def finish(top=10):
+        executor.shutdown(wait=True)
+        results = [f.result() for f in futures]
+        alive = sorted((r for r in results if r["latency"] is not None), key=lambda r: r["latency"])
+        print(f"测速完成：可连接 {len(alive)}/{len(results)} 个")
+        for r in alive[:top]:
+            print(f"{r['ip']}\t{r['latency']:.1f}ms")
+
+    return on_candidate, finish
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='下载候选 IP 列表并生成 ip.txt（流式、可续传、带完整性校验）')
+    parser.add_argument('--url', default=url)
+    parser.add_argument('--output', default=target_file)
+    parser.add_argument('--sha256', default=os.getenv('IP_TXT_SHA256'), help='期望的 SHA-256（可选）')
+    parser.add_argument('--probe', action='store_true', help='边下载边对候选做 TCP 延迟测试')
+    parser.add_argument('--probe-port', type=int, default=443)
+    parser.add_argument('--probe-workers', type=int, default=64)
+    parser.add_argument('--strict', action='store_true', help='下载或校验失败时以退出码 1 结束（默认与以前一样总是返回 0）')
+    args = parser.parse_args(argv)
+
+    on_candidate, finish = start_probe(args.probe_port, args.probe_workers) if args.probe else (None, None)
+    download = CandidateDownload(args.url, args.output, args.sha256, on_candidate)
+    try:
+        with requests.Session() as session:
+            stats = download.run(session)
+    except (requests.RequestException, IntegrityError, OSError) as e:
+        print(f"下载失败，保留原有文件: {e}")
+        return 1 if args.strict else 0
+    finally:
+        if finish:
+            finish()
+    if stats["unchanged"]:
+        print(f"内容未变化（304），沿用已有文件 {args.output}")
+    else:
+        resumed = f"，从 {stats['resumed_from']} 字节处续传" if stats["resumed_from"] else ""
+        print(f"内容已成功写入 {args.output}：{stats['bytes']} 字节{resumed}，有效 {stats['valid']} 行，"
+              f"无效 {stats['invalid']} 行，重复 {stats['duplicates']} 行")
+    print(f"文件大小: {os.path.getsize(args.output)} 字节" if os.path.exists(args.output) else "文件未能成功创建")
+    return 0
 
-# 打印文件的绝对路径
-print(f"预期的文件保存位置: {target_file}")
+if __name__ == '__main__':
+    sys.exit(main())
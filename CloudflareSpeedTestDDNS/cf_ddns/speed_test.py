@@ -0,0 +1,270 @@
+import argparse
+import concurrent.futures
+import csv
+import io
+import ipaddress
+import os
+import random
+import socket
+import ssl
+import sys
+import threading
+import time
+from urllib.parse import urljoin, urlparse
+
+from atomic_file import write_atomic
+
+# 内置下载测速，参数与 CloudflareST 保持一致，可直接替换 cf_ddns_*.sh 中的 $CloudflareST：
+#   1. 对候选 IP 做 TCP 延迟测试（-t 次，-n 线程），按 -tl/-tll/-tlr 过滤后按延迟排序
+#   2. 从延迟最低的开始并行下载测速（-dn 个），所有下载共享一个全局带宽上限，速度稳定后提前结束
+#   3. 输出与 CloudflareST 相同格式的 result.csv，upload_to_github.py 和 DDNS 脚本可直接使用
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_URL = "https://cf.xiu2.xyz/url"
+CSV_HEADER = ["IP 地址", "已发送", "已接收", "丢包率", "平均延迟", "下载速度 (MB/s)"]
+CHUNK_SIZE = 64 * 1024
+RATE_WINDOW = 0.5                # 计算瞬时速度的窗口（秒）
+STABLE_WINDOWS = 4               # 连续多少个窗口速度波动很小即视为稳定
+STABLE_TOLERANCE = 0.1           # 窗口速度的相对波动阈值
+MIN_DOWNLOAD_TIME = 2.0          # 至少下载多少秒才允许提前结束
+MAX_REDIRECTS = 5                # 测试地址（如默认的 cf.xiu2.xyz/url）会重定向，最多跟随几次
+
+# 全局令牌桶：所有下载线程共享，限制总带宽
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.burst = max(rate * 0.1, CHUNK_SIZE)  # 只允许很小的突发，避免开头超出上限
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+# 读取候选列表：单个 IP 原样使用，CIDR 网段中每个 /24（IPv6 为每个网段）随机取一个 IP
+def load_candidates(path):
+    candidates = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = line.split('#')[0].strip()
+            if not entry:
+                continue
+            try:
+                if '/' not in entry:
+                    candidates.append(str(ipaddress.ip_address(entry)))
+                    continue
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                continue
+            if network.version == 4 and network.prefixlen < 24:
+                subnets = network.subnets(new_prefix=24)
+            else:
+                subnets = [network]
+            for subnet in subnets:
+                offset = random.randrange(subnet.num_addresses) if subnet.num_addresses > 2 else 0
+                candidates.append(str(subnet.network_address + offset))
+    return list(dict.fromkeys(candidates))
+
+def tcp_ping(ip, port, count, timeout=1.0):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            with socket.create_connection((ip, port), timeout=timeout):
+                samples.append((time.perf_counter() - start) * 1000)
+        except OSError:
+            pass
+    return {
+        "ip": ip,
+        "sent": count,
+        "received": len(samples),
+        "loss": 1 - len(samples) / count if count else 1.0,
+        "latency": sum(samples) / len(samples) if samples else None,
+        "speed": 0.0,
+    }
+
+def _read_headers(sock):
+    data = b''
+    while b'\r\n\r\n' not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError("连接在响应头之前关闭")
+        data += chunk
+        if len(data) > 65536:
+            raise ConnectionError("响应头过大")
+    head, _, rest = data.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, rest
+
+def _request(ip, url, port, timeout):
+    parsed = urlparse(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    sock = socket.create_connection((ip, port), timeout=timeout)
+    try:
+        if parsed.scheme == 'https':
+            context = ssl.create_default_context()
+            sock = context.wrap_socket(sock, server_hostname=parsed.hostname)
+        request = (f"GET {path} HTTP/1.1\r\nHost: {parsed.netloc}\r\nUser-Agent: Mozilla/5.0\r\n"
+                   f"Accept: */*\r\nConnection: close\r\n\r\n")
+        sock.sendall(request.encode())
+        status, headers, body = _read_headers(sock)
+    except BaseException:
+        sock.close()
+        raise
+    return sock, status, headers, body
+
+# 跟随 3xx 重定向，和 CloudflareST 一样每一跳都直连同一个候选 IP（SNI/Host 换成新地址的域名）；
+# 协议改变时端口改用新协议的默认端口。返回 (连接, 已读到的响应体)，非 200 直接报错
+def _open_download(ip, url, port, timeout):
+    scheme = urlparse(url).scheme
+    for _ in range(MAX_REDIRECTS + 1):
+        sock, status, headers, body = _request(ip, url, port, timeout)
+        if status == 200:
+            return sock, body
+        sock.close()
+        if status not in (301, 302, 303, 307, 308) or not headers.get('location'):
+            raise ConnectionError(f"测试地址返回 HTTP {status}（{url}）")
+        url = urljoin(url, headers['location'])
+        parsed = urlparse(url)
+        if parsed.port:
+            port = parsed.port
+        elif parsed.scheme != scheme:
+            port = 443 if parsed.scheme == 'https' else 80
+        scheme = parsed.scheme
+    raise ConnectionError(f"重定向超过 {MAX_REDIRECTS} 次")
+
+# 通过指定 IP 下载测试地址：TCP 直连该 IP，TLS 的 SNI 和 HTTP Host 固定为测试地址的域名
+def download_speed(ip, url, port, max_seconds, bucket, timeout=5.0):
+    sock, body = _open_download(ip, url, port, timeout)
+    try:
+        bucket.consume(len(body))
+        start = time.perf_counter()
+        total = len(body)
+        window_start, window_bytes = start, total
+        rates = []
+        while True:
+            now = time.perf_counter()
+            if now - start >= max_seconds:
+                break
+            chunk = sock.recv(CHUNK_SIZE)
+            if not chunk:
+                break
+            # 按实际收到的字节数扣令牌，短读不会多扣
+            bucket.consume(len(chunk))
+            total += len(chunk)
+            window_bytes += len(chunk)
+            now = time.perf_counter()
+            if now - window_start >= RATE_WINDOW:
+                rates.append(window_bytes / (now - window_start))
+                window_start, window_bytes = now, 0
+                recent = rates[-STABLE_WINDOWS:]
+                if (now - start >= MIN_DOWNLOAD_TIME and len(recent) == STABLE_WINDOWS
+                        and (max(recent) - min(recent)) <= STABLE_TOLERANCE * (sum(recent) / len(recent))):
+                    break
+        elapsed = time.perf_counter() - start
+        return total / elapsed / 1024 / 1024 if elapsed > 0 else 0.0
+    finally:
+        sock.close()
+
+def write_result_csv(results, path):
+    buf = io.StringIO(newline='')
+    writer = csv.writer(buf)
+    writer.writerow(CSV_HEADER)
+    for r in results:
+        writer.writerow([r["ip"], r["sent"], r["received"], f"{r['loss']:.2f}",
+                         f"{r['latency']:.2f}", f"{r['speed']:.2f}"])
+    write_atomic(path, buf.getvalue())
+
+def run(args):
+    candidates = load_candidates(args.f)
+    print(f"开始延迟测速（{len(candidates)} 个 IP，端口 {args.tp}，{args.t} 次，{args.n} 线程）")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.n) as executor:
+        pings = list(executor.map(lambda ip: tcp_ping(ip, args.tp, args.t), candidates))
+    passed = [p for p in pings if p["latency"] is not None and args.tll <= p["latency"] <= args.tl and p["loss"] <= args.tlr]
+    passed.sort(key=lambda p: (p["loss"], p["latency"]))
+    print(f"延迟测速完成，符合条件 {len(passed)} 个")
+
+    tested = []
+    qualified = []
+    if args.dd or not passed:
+        results = passed
+    else:
+        bucket = TokenBucket(args.bw * 1024 * 1024)
+        pending = iter(passed)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.parallel) as executor:
+            futures = {}
+            # 按延迟顺序逐个补充下载任务，凑够 -dn 个达到 -sl 下限的 IP 即停止
+            while True:
+                while len(futures) < args.parallel and len(qualified) + len(futures) < args.dn:
+                    item = next(pending, None)
+                    if item is None:
+                        break
+                    futures[executor.submit(download_speed, item["ip"], args.url, args.tp, args.dt, bucket)] = item
+                if not futures:
+                    break
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    item = futures.pop(future)
+                    try:
+                        item["speed"] = future.result()
+                    except (OSError, ValueError, IndexError) as e:
+                        print(f"{item['ip']} 下载测速失败: {e}")
+                        item["speed"] = 0.0
+                    tested.append(item)
+                    print(f"{item['ip']}\t延迟 {item['latency']:.2f}ms\t下载速度 {item['speed']:.2f}MB/s")
+                    if item["speed"] >= args.sl:
+                        qualified.append(item)
+        results = qualified or tested
+        results.sort(key=lambda r: r["speed"], reverse=True)
+
+    write_result_csv(results, args.o)
+    print(f"测速完毕，结果已写入 {args.o}（{len(results)} 个）")
+    for r in results[:args.p]:
+        print(f"{r['ip']}\t{r['sent']}\t{r['received']}\t{r['loss']:.2f}\t{r['latency']:.2f}\t{r['speed']:.2f}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='内置下载测速（兼容 CloudflareST 参数）')
+    parser.add_argument('-n', type=int, default=200, help='延迟测速线程数')
+    parser.add_argument('-t', type=int, default=4, help='单个 IP 延迟测速次数')
+    parser.add_argument('-dn', type=int, default=10, help='下载测速数量')
+    parser.add_argument('-dt', type=float, default=10, help='单个 IP 下载测速最长时间（秒）')
+    parser.add_argument('-tp', type=int, default=443, help='测速端口')
+    parser.add_argument('-url', default=DEFAULT_URL, help='下载测速地址')
+    parser.add_argument('-tl', type=float, default=9999, help='平均延迟上限（ms）')
+    parser.add_argument('-tll', type=float, default=0, help='平均延迟下限（ms）')
+    parser.add_argument('-tlr', type=float, default=1.0, help='丢包几率上限')
+    parser.add_argument('-sl', type=float, default=0, help='下载速度下限（MB/s）')
+    parser.add_argument('-p', type=int, default=10, help='显示结果数量')
+    parser.add_argument('-f', default=os.path.join(script_dir, 'ip.txt'), help='候选 IP 文件')
+    parser.add_argument('-o', default=os.path.join(script_dir, 'result.csv'), help='结果文件')
+    parser.add_argument('-dd', action='store_true', help='禁用下载测速')
+    parser.add_argument('-parallel', type=int, default=4, help='同时进行的下载测速数量')
+    parser.add_argument('-bw', type=float, default=0, help='所有下载测速合计的带宽上限（MB/s，0 为不限）')
+    # 以下参数为兼容 CloudflareST 的 HTTPing 模式而接受，内置测速只做 TCP 延迟测试
+    parser.add_argument('-httping', action='store_true')
+    parser.add_argument('-httping-code', dest='httping_code')
+    parser.add_argument('-cfcolo')
+    args = parser.parse_args(argv)
+    if args.httping or args.cfcolo:
+        print("提示：内置测速不支持 HTTPing/地区码过滤，已按 TCP 延迟测速")
+    return run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,18 @@
 import requests
-import base64
 from datetime import datetime
 import os
 
+from github_publisher import GITHUB_API, GitHubPublisher, PublishError
+
 # 配置文件路径
 config_path = '/pac/config.conf'
 
 # 初始化变量
 github_token = None
 github_repo = None
+github_branch = None
+github_api = GITHUB_API
+github_publish_files = ''
 bot_token = None
 chat_id = None
 
@@ -35,6 +39,12 @@ try:
                 github_token = value
             elif key == 'github_repo':
                 github_repo = value
+            elif key == 'github_branch':
+                github_branch = value
+            elif key == 'github_api':
+                github_api = value or GITHUB_API
+            elif key == 'github_publish_files':
+                github_publish_files = value
             elif key == 'telegramBotToken':
                 bot_token = value
             elif key == 'telegramBotUserId':
@@ -43,6 +53,9 @@ try:
     # 如果需要通过环境变量覆盖配置文件中的值，可以在这里进行处理
     github_token = os.getenv('github_token') or github_token
     github_repo = os.getenv('github_repo') or github_repo
+    github_branch = os.getenv('github_branch') or github_branch
+    github_api = os.getenv('github_api') or github_api
+    github_publish_files = os.getenv('github_publish_files') or github_publish_files
     bot_token = os.getenv('bot_token') or bot_token
     chat_id = os.getenv('chat_id') or chat_id
 
@@ -104,47 +117,38 @@ def send_to_telegram(file_path, message):
     except requests.exceptions.RequestException as e:
         print(f"Failed to send file and message to Telegram: {e}")
 
-# 获取文件的 SHA 值
-def get_file_sha(repo, path, token):
-    try:
-        url = f"https://api.github.com/repos/{repo}/contents/{path}"
-        headers = {'Authorization': f'token {token}'}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # 检查响应状态码
-        return response.json().get('sha')
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to get SHA from GitHub: {e}")
-        return None
-
-# 上传文件到 GitHub，并发送到 Telegram
+# 要发布的文件：ips.txt 固定发布为 github_file_name，
+# 其余文件由 github_publish_files 配置，格式为 "本地文件:仓库路径,本地文件:仓库路径"（本地路径相对脚本目录），例如
+#   github_publish_files=result.csv:ceshi_result.csv,ips.json:ceshi_ip.json
+def publish_targets(file_path):
+    targets = {github_file_name: file_path}
+    for item in github_publish_files.split(','):
+        local, _, remote = item.strip().partition(':')
+        if local:
+            targets[remote.strip() or os.path.basename(local)] = os.path.join(script_dir_path, local.strip())
+    return targets
+
+# 上传文件到 GitHub（所有文件一次提交，内容未变化时不提交），并发送到 Telegram
 def upload_to_github_and_telegram(file_path, message):
     try:
-        with open(file_path, 'r') as file:
-            content = file.read()
-        github_file_path = github_file_name  # GitHub 中的文件路径，只是文件名
-        sha = get_file_sha(github_repo, github_file_path, github_token)
-        url = f'https://api.github.com/repos/{github_repo}/contents/{github_file_path}'
-        headers = {
-            'Authorization': f'token {github_token}',
-            'Content-Type': 'application/json'
-        }
-        data = {
-            'message': message,
-            'content': base64.b64encode(content.encode()).decode('utf-8'),
-            'sha': sha if sha else None  # 添加 sha 值，如果文件存在则用于覆盖
-        }
-        response = requests.put(url, json=data, headers=headers)
-        response.raise_for_status()  # 检查响应状态码
-        if response.status_code in (201, 200):
-            success_message = f"❇️上传优选IP到Github脚本执行完毕\n❇执行时间：{current_time} \n❇文件 {github_file_name} 已成功上传到 GitHub 仓库 {github_repo} 中"
-            print(success_message)
-            send_to_telegram(file_path, success_message)  # 发送成功信息到 Telegram
-        else:
-            error_message = f"❇️上传优选IP到Github脚本执行完毕\n❇执行时间：{current_time} \n❇文件 {github_file_name} 上传到 GitHub 仓库 {github_repo} 失败. HTTP 状态码: {response.status_code}"
-            print(error_message)
-            send_to_telegram(file_path, error_message)  # 发送失败信息到 Telegram
-    except FileNotFoundError:
-        print(f"File not found: {file_path}")
+        files = {}
+        for remote_path, local_path in publish_targets(file_path).items():
+            with open(local_path, 'rb') as file:
+                files[remote_path] = file.read()
+        publisher = GitHubPublisher(github_repo, github_token, github_branch, github_api)
+        commit_sha, changed = publisher.publish(files, message)
+        if not commit_sha:
+            print(f"❇文件 {', '.join(files)} 内容未变化，跳过提交")
+            return
+        success_message = f"❇️上传优选IP到Github脚本执行完毕\n❇执行时间：{current_time} \n❇文件 {', '.join(changed)} 已在一次提交（{commit_sha[:7]}）中上传到 GitHub 仓库 {github_repo}"
+        print(success_message)
+        send_to_telegram(file_path, success_message)  # 发送成功信息到 Telegram
+    except FileNotFoundError as e:
+        print(f"File not found: {e.filename}")
+    except (PublishError, requests.exceptions.RequestException) as e:
+        error_message = f"❇️上传优选IP到Github脚本执行完毕\n❇执行时间：{current_time} \n❇文件 {github_file_name} 上传到 GitHub 仓库 {github_repo} 失败: {e}"
+        print(error_message)
+        send_to_telegram(file_path, error_message)  # 发送失败信息到 Telegram
     except Exception as e:
         print(f"An error occurred: {e}")
 
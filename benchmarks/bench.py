@@ -0,0 +1,198 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import ip_scraper
+from stub_server import ROUTES, StubServer, load_fixture, parse_endpoint_options
+
+# 放大样例数据：HTML 表格复制数据行，文本/Markdown 复制数据行
+def scale_fixture(text, factor):
+    if factor <= 1:
+        return text
+    match = re.search(r'(<tbody>)(.*?)(</tbody>)', text, re.S)
+    if match:
+        return text[:match.start(2)] + match.group(2) * factor + text[match.end(2):]
+    head, rows = text.splitlines()[:2], text.splitlines()[2:]
+    if '|' not in text:
+        head, rows = [], text.splitlines()
+    return '\n'.join(head + rows * factor) + '\n'
+
+def time_call(func, repeat, *args):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+    }
+
+def bench_parsers(repeat, scale):
+    fixtures = {name: load_fixture(name).decode('utf-8') for _, name, _ in ROUTES.values()}
+    cases = {
+        "parse_wetest_html[v4]": (ip_scraper.parse_wetest_html, 'wetest_cloudflare_v4.html'),
+        "parse_wetest_html[v6]": (ip_scraper.parse_wetest_html, 'wetest_cloudflare_v6.html'),
+        "parse_ip164746_html": (ip_scraper.parse_ip164746_html, 'ip164746.html'),
+        "parse_hostmonit_text": (ip_scraper.parse_hostmonit_text, 'hostmonit_v4.md'),
+        "parse_vps789_api": (ip_scraper.parse_vps789_api, 'vps789_cfIpApi.json'),
+        "parse_vps789_top20": (ip_scraper.parse_vps789_top20, 'vps789_cfIpTop20.json'),
+        "parse_text_ips": (ip_scraper.parse_text_ips, 'ipdb_bestcf.txt'),
+    }
+    results = {}
+    for name, (func, fixture) in cases.items():
+        text = fixtures[fixture]
+        if not fixture.endswith('.json'):
+            text = scale_fixture(text, scale)
+        results[name] = time_call(func, repeat, text)
+        results[name]["bytes"] = len(text.encode('utf-8'))
+    return results
+
+def bench_fetchers(server, repeat):
+    cases = {
+        "fetch_wetest_ips": (ip_scraper.fetch_wetest_ips, ip_scraper.WETEST_URLS[0]),
+        "fetch_ip164746": (ip_scraper.fetch_ip164746, ip_scraper.IP164746_URL),
+        "fetch_hostmonit_ips": (ip_scraper.fetch_hostmonit_ips, ip_scraper.HOSTMONIT_URLS[0]),
+        "fetch_vps789_api": (ip_scraper.fetch_vps789_api, ip_scraper.VPS789_API_URL),
+        "fetch_vps789_top20": (ip_scraper.fetch_vps789_top20, ip_scraper.VPS789_TOP20_URL),
+        "fetch_text_ips": (ip_scraper.fetch_text_ips, ip_scraper.IPDB_URL),
+    }
+    results = {}
+    for name, (func, url) in cases.items():
+        results[name] = time_call(func, repeat, url)
+    ip_scraper.close_sessions()
+    return results
+
+def bench_dedup(repeat, size):
+    rng = random.Random(1)
+    pool = [f"104.{rng.randint(16, 31)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(int(size * 0.7))]
+    lines = [f"{rng.choice(pool)}#{rng.choice(['HKG', 'LAX', 'FRA'])}-移动" for _ in range(size)]
+    result = time_call(ip_scraper.dedup_entries, repeat, lines)
+    result["lines"] = size
+    return {"dedup_entries": result}
+
+def bench_full_run(repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as warm_dir:
+        for label in ("cold", "warm"):
+            samples = []
+            for _ in range(repeat):
+                with contextlib.ExitStack() as stack:
+                    run_dir = warm_dir if label == "warm" else stack.enter_context(tempfile.TemporaryDirectory())
+                    samples.append(_timed_full_run(run_dir))
+            results[f"extract_fastest_ips[{label}]"] = {
+                "repeat": repeat,
+                "min_ms": round(min(samples), 3),
+                "median_ms": round(statistics.median(samples), 3),
+                "mean_ms": round(statistics.mean(samples), 3),
+            }
+    return results
+
+def _timed_full_run(run_dir):
+    cwd = os.getcwd()
+    os.chdir(run_dir)
+    try:
+        start = time.perf_counter()
+        ip_scraper.extract_fastest_ips()
+        return (time.perf_counter() - start) * 1000
+    finally:
+        os.chdir(cwd)
+
+# 与基准结果比较中位数，超过阈值视为性能回退
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("median_ms"):
+            continue
+        change = current["median_ms"] / previous["median_ms"] - 1
+        current["change"] = round(change, 4)
+        if change > threshold:
+            regressions.append(f"{name}: {previous['median_ms']}ms -> {current['median_ms']}ms ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='ip_scraper 基准测试（使用本地替身服务器和录制样例）')
+    parser.add_argument('--repeat', type=int, default=20, help='解析/去重每项重复次数')
+    parser.add_argument('--run-repeat', type=int, default=3, help='完整运行的重复次数')
+    parser.add_argument('--scale', type=int, default=1, help='解析基准中把样例数据行放大的倍数')
+    parser.add_argument('--dedup-size', type=int, default=100000)
+    parser.add_argument('--latency', action='append', default=[], metavar='GROUP=SECONDS', help='为来源分组注入延迟')
+    parser.add_argument('--fail', action='append', default=[], metavar='GROUP=RATE[:500|reset|hang]', help='为来源分组注入故障')
+    parser.add_argument('--only', default='parsers,fetchers,dedup,full', help='要运行的基准项，逗号分隔')
+    parser.add_argument('--output', help='结果 JSON 文件（默认输出到标准输出）')
+    parser.add_argument('--baseline', help='用于比较的历史结果 JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='中位数变慢超过该比例视为回退')
+    args = parser.parse_args()
+
+    for key in ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "GEOIP_DB"):
+        os.environ.pop(key, None)
+    only = set(args.only.split(','))
+    server = StubServer(endpoints=parse_endpoint_options(args.latency, args.fail)).start()
+    server.point_scraper(ip_scraper)
+    results = {}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log), tempfile.TemporaryDirectory() as work_dir:
+            cwd = os.getcwd()
+            os.chdir(work_dir)
+            try:
+                if 'parsers' in only:
+                    results.update(bench_parsers(args.repeat, args.scale))
+                if 'dedup' in only:
+                    results.update(bench_dedup(args.repeat, args.dedup_size))
+                if 'fetchers' in only:
+                    results.update(bench_fetchers(server, args.repeat))
+            finally:
+                os.chdir(cwd)
+            if 'full' in only:
+                results.update(bench_full_run(args.run_repeat))
+    finally:
+        server.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "table_backend": ip_scraper.table_backend(),
+            "scale": args.scale,
+            "endpoints": server.endpoints,
+            "stub_hits": server.hits,
+        },
+        "results": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    for line in regressions:
+        print(f"⚠️ 性能回退 {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地替身服务器：用录制的样例数据模拟各采集来源，可为每个来源单独设置延迟和故障注入
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 路径 -> (来源分组, 样例文件, Content-Type)
+ROUTES = {
+    '/wetest/cloudflare/address_v4.html': ('wetest', 'wetest_cloudflare_v4.html', 'text/html; charset=utf-8'),
+    '/wetest/cloudflare/address_v6.html': ('wetest', 'wetest_cloudflare_v6.html', 'text/html; charset=utf-8'),
+    '/wetest/cloudfront/address_v4.html': ('wetest', 'wetest_cloudfront_v4.html', 'text/html; charset=utf-8'),
+    '/wetest/cloudfront/address_v6.html': ('wetest', 'wetest_cloudfront_v6.html', 'text/html; charset=utf-8'),
+    '/ip164746/': ('ip164746', 'ip164746.html', 'text/html; charset=utf-8'),
+    '/hostmonit/CloudFlareYes': ('hostmonit', 'hostmonit_v4.md', 'text/plain; charset=utf-8'),
+    '/hostmonit/CloudFlareYesV6': ('hostmonit', 'hostmonit_v6.md', 'text/plain; charset=utf-8'),
+    '/vps789/cfIpApi': ('vps789', 'vps789_cfIpApi.json', 'application/json'),
+    '/vps789/cfIpTop20': ('vps789', 'vps789_cfIpTop20.json', 'application/json'),
+    '/ipdb/bestcf': ('ipdb', 'ipdb_bestcf.txt', 'text/plain; charset=utf-8'),
+}
+IPINFO_ROUTE = re.compile(r'^/ipinfo/([^/]+)/json$')
+GROUPS = sorted({group for group, _, _ in ROUTES.values()} | {'ipinfo'})
+FAIL_MODES = ('500', 'reset', 'hang')
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+        return f.read()
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _route(self):
+        path = self.path.split('?', 1)[0]
+        if path in ROUTES:
+            group, fixture, content_type = ROUTES[path]
+            return group, self.server.fixtures[fixture], content_type
+        match = IPINFO_ROUTE.match(path)
+        if match:
+            body = json.dumps({"ip": match.group(1), "country": self.server.country}).encode()
+            return 'ipinfo', body, 'application/json'
+        return None, None, None
+
+    def do_GET(self):
+        group, body, content_type = self._route()
+        if group is None:
+            self.send_error(404)
+            return
+        self.server.record(group)
+        config = self.server.endpoints.get(group, {})
+        if config.get('latency'):
+            time.sleep(config['latency'])
+        if config.get('fail_rate') and random.random() < config['fail_rate']:
+            mode = config.get('fail_mode', '500')
+            if mode == 'reset':
+                self.close_connection = True
+                self.connection.close()
+                return
+            if mode == 'hang':
+                time.sleep(config.get('hang', 30))
+                self.close_connection = True
+                return
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, endpoints=None, country='US', fixtures=None):
+        super().__init__((host, port), StubHandler)
+        self.endpoints = endpoints or {}
+        self.country = country
+        self.fixtures = fixtures or {name: load_fixture(name) for _, name, _ in ROUTES.values()}
+        self.hits = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, group):
+        with self._lock:
+            self.hits[group] = self.hits.get(group, 0) + 1
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return self.base_url + path
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    # 把 ip_scraper 的各来源地址指向本替身服务器
+    def point_scraper(self, scraper):
+        scraper.IP164746_URL = self.url('/ip164746/')
+        scraper.WETEST_URLS = [self.url(p) for p in ROUTES if p.startswith('/wetest/')]
+        scraper.HOSTMONIT_URLS = [self.url('/hostmonit/CloudFlareYes'), self.url('/hostmonit/CloudFlareYesV6')]
+        scraper.VPS789_API_URL = self.url('/vps789/cfIpApi')
+        scraper.VPS789_TOP20_URL = self.url('/vps789/cfIpTop20')
+        scraper.IPDB_URL = self.url('/ipdb/bestcf')
+        scraper.IPINFO_URL = self.base_url + '/ipinfo/{ip}/json'
+        # 样例中的域名条目（如 cdn.anycast.example）不做真实 DNS 查询，基准保持离线、结果稳定
+        scraper.RESOLVE_ENABLED = False
+
+# 解析 "分组=值" 形式的参数，例如 wetest=0.2 或 hostmonit=1.0:reset
+def parse_endpoint_options(latencies=(), failures=()):
+    endpoints = {}
+    for item in latencies:
+        group, value = item.split('=', 1)
+        endpoints.setdefault(group, {})['latency'] = float(value)
+    for item in failures:
+        group, value = item.split('=', 1)
+        rate, _, mode = value.partition(':')
+        if mode and mode not in FAIL_MODES:
+            raise ValueError(f"未知的故障模式: {mode}")
+        endpoints.setdefault(group, {}).update({'fail_rate': float(rate), 'fail_mode': mode or '500'})
+    unknown = set(endpoints) - set(GROUPS)
+    if unknown:
+        raise ValueError(f"未知的来源分组: {', '.join(sorted(unknown))}（可选：{', '.join(GROUPS)}）")
+    return endpoints
+
+def main():
+    parser = argparse.ArgumentParser(description='ip_scraper 本地替身服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', action='append', default=[], metavar='GROUP=SECONDS')
+    parser.add_argument('--fail', action='append', default=[], metavar='GROUP=RATE[:500|reset|hang]')
+    args = parser.parse_args()
+    server = StubServer(args.host, args.port, parse_endpoint_options(args.latency, args.fail))
+    print(f"替身服务器已启动：{server.base_url}（来源分组：{', '.join(GROUPS)}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import time
+
+import output_writer
+
+# 并发 DNS 解析：直接发送 DNS 报文（UDP，截断时改用 TCP），A 和 AAAA 同时查询，
+# 按应答中的 TTL 缓存在内存中，并保存到磁盘供下次运行使用；否定应答（不存在/无记录）按 SOA 的 TTL 缓存
+# 服务器地址可配置，测试时可指向本地的 DNS 桩服务
+DNS_PORT = 53
+DNS_TIMEOUT = 2.0                # 单次查询超时（秒）
+DNS_ATTEMPTS = 2                 # 每个服务器的尝试次数
+DNS_CONCURRENCY = 64             # 同时进行的查询数
+MIN_TTL = 60                     # 缓存时间下限（秒），避免 TTL 很短的记录每次都重新查询
+MAX_TTL = 24 * 3600              # 缓存时间上限（秒）
+NEGATIVE_TTL = 300               # 否定应答没有 SOA 时的缓存时间（秒）
+FALLBACK_TTL = 300               # 所有服务器都失败、改用系统解析时的缓存时间（秒）
+FALLBACK_SERVERS = ["223.5.5.5", "1.1.1.1"]
+
+TYPE_A = 1
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_AAAA = 28
+RCODE_NXDOMAIN = 3
+
+class DNSError(Exception):
+    pass
+
+def system_nameservers(path="/etc/resolv.conf"):
+    servers = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    servers.append(parts[1])
+    except OSError:
+        pass
+    return servers or FALLBACK_SERVERS
+
+# "1.1.1.1"、"1.1.1.1:5353"、"[::1]:5353" → (主机, 端口)
+def parse_server(text):
+    text = text.strip()
+    if text.startswith('['):
+        host, _, port = text[1:].partition(']')
+        return host, int(port.lstrip(':') or DNS_PORT)
+    if text.count(':') == 1:
+        host, port = text.split(':')
+        return host, int(port)
+    return text, DNS_PORT
+
+def build_query(name, qtype, query_id):
+    header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)   # RD=1
+    qname = b''.join(bytes([len(label)]) + label for label in (part.encode('idna') for part in name.rstrip('.').split('.')))
+    return header + qname + b'\0' + struct.pack('!HH', qtype, 1)
+
+def _read_name(data, offset):
+    labels = []
+    jumped = False
+    end = offset
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if not jumped:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            jumped = True
+            continue
+        if length == 0:
+            if not jumped:
+                end = offset + 1
+            return '.'.join(labels).lower(), end
+        labels.append(data[offset + 1:offset + 1 + length].decode('ascii', 'replace'))
+        offset += length + 1
+    raise DNSError("域名压缩指针循环")
+
+# 解析应答：返回 (地址列表, TTL, 是否截断)；地址为空时 TTL 取自 SOA（否定缓存）
+def parse_response(data, query_id, qtype):
+    if len(data) < 12:
+        raise DNSError("应答过短")
+    rid, flags, qdcount, ancount, nscount, _ = struct.unpack('!HHHHHH', data[:12])
+    if rid != query_id:
+        raise DNSError("应答 ID 不匹配")
+    truncated = bool(flags & 0x0200)
+    rcode = flags & 0x000F
+    if rcode not in (0, RCODE_NXDOMAIN):
+        raise DNSError(f"服务器返回错误 rcode={rcode}")
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = _read_name(data, offset)
+        offset += 4
+    addresses = []
+    ttls = []
+    negative_ttl = None
+    for index in range(ancount + nscount):
+        _, offset = _read_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack('!HHIH', data[offset:offset + 10])
+        offset += 10
+        rdata = data[offset:offset + rdlength]
+        if index < ancount:
+            if rtype == qtype == TYPE_A and rdlength == 4:
+                addresses.append(socket.inet_ntop(socket.AF_INET, rdata))
+                ttls.append(ttl)
+            elif rtype == qtype == TYPE_AAAA and rdlength == 16:
+                addresses.append(socket.inet_ntop(socket.AF_INET6, rdata))
+                ttls.append(ttl)
+            elif rtype == TYPE_CNAME:
+                ttls.append(ttl)
+        elif rtype == TYPE_SOA:
+            _, soa_offset = _read_name(data, offset)
+            _, soa_offset = _read_name(data, soa_offset)
+            minimum = struct.unpack('!I', data[soa_offset + 16:soa_offset + 20])[0]
+            negative_ttl = min(ttl, minimum)
+        offset += rdlength
+    if addresses:
+        return list(dict.fromkeys(addresses)), min(ttls), truncated
+    return [], negative_ttl if negative_ttl is not None else NEGATIVE_TTL, truncated
+
+class _UDPQuery(asyncio.DatagramProtocol):
+    def __init__(self, future):
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+class DNSCache:
+    def __init__(self, path=None, min_ttl=MIN_TTL, max_ttl=MAX_TTL):
+        self.path = path
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.entries = self._load()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    # 返回缓存的地址列表（否定缓存为 []），未命中或已过期返回 None
+    def get(self, name, qtype, now=None):
+        entry = self.entries.get(f"{name}/{qtype}")
+        now = now if now is not None else time.time()
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, name, qtype, addresses, ttl, now=None):
+        now = now if now is not None else time.time()
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        self.entries[f"{name}/{qtype}"] = [now + ttl, addresses]
+
+    def save(self, now=None):
+        if not self.path:
+            return
+        now = now if now is not None else time.time()
+        self.entries = {key: entry for key, entry in self.entries.items() if entry[0] > now}
+        output_writer.write_atomic(self.path, json.dumps(self.entries, separators=(',', ':')))
+
+class Resolver:
+    def __init__(self, servers=None, cache=None, timeout=DNS_TIMEOUT, attempts=DNS_ATTEMPTS,
+                 concurrency=DNS_CONCURRENCY, system_fallback=True):
+        self.servers = [parse_server(s) if isinstance(s, str) else s for s in (servers or system_nameservers())]
+        self.cache = cache if cache is not None else DNSCache()
+        self.timeout = timeout
+        self.attempts = attempts
+        self.concurrency = concurrency
+        self.system_fallback = system_fallback
+        self.failures = 0
+        self._inflight = {}
+
+    async def _udp(self, server, packet):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(lambda: _UDPQuery(future), remote_addr=server)
+        try:
+            transport.sendto(packet)
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            transport.close()
+
+    async def _tcp(self, server, packet):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*server), self.timeout)
+        try:
+            writer.write(struct.pack('!H', len(packet)) + packet)
+            length = struct.unpack('!H', await asyncio.wait_for(reader.readexactly(2), self.timeout))[0]
+            return await asyncio.wait_for(reader.readexactly(length), self.timeout)
+        finally:
+            writer.close()
+
+    async def query(self, name, qtype):
+        for attempt in range(self.attempts):
+            for server in self.servers:
+                query_id = random.getrandbits(16)
+                packet = build_query(name, qtype, query_id)
+                try:
+                    addresses, ttl, truncated = parse_response(await self._udp(server, packet), query_id, qtype)
+                    if truncated:
+                        addresses, ttl, _ = parse_response(await self._tcp(server, packet), query_id, qtype)
+                    return addresses, ttl
+                except (OSError, asyncio.TimeoutError, DNSError, struct.error, IndexError, asyncio.IncompleteReadError):
+                    continue
+        raise DNSError(f"{name} 解析失败")
+
+    async def _system(self, name, qtype):
+        family = socket.AF_INET if qtype == TYPE_A else socket.AF_INET6
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(name, None, family=family, type=socket.SOCK_STREAM)
+        except OSError:
+            return []
+        return list(dict.fromkeys(info[4][0] for info in infos))
+
+    # 同一域名同时被多处请求时只查询一次
+    async def _lookup(self, name, qtype, semaphore):
+        cached = self.cache.get(name, qtype)
+        if cached is not None:
+            return cached
+        key = (name, qtype)
+        if key not in self._inflight:
+            self._inflight[key] = asyncio.ensure_future(self._fetch(name, qtype, semaphore))
+        try:
+            return await asyncio.shield(self._inflight[key])
+        finally:
+            if self._inflight.get(key) is not None and self._inflight[key].done():
+                del self._inflight[key]
+
+    # 只有查询本身失败（超时、SERVFAIL 等）时才改用系统解析，结果同样缓存；
+    # 不存在/无记录是服务器的明确答复，按否定缓存处理，不再查系统解析
+    async def _fetch(self, name, qtype, semaphore):
+        async with semaphore:
+            try:
+                addresses, ttl = await self.query(name, qtype)
+            except DNSError:
+                self.failures += 1
+                if not self.system_fallback:
+                    return []
+                addresses, ttl = await self._system(name, qtype), FALLBACK_TTL
+        self.cache.put(name, qtype, addresses, ttl)
+        return addresses
+
+    async def resolve(self, name, semaphore=None):
+        semaphore = semaphore or asyncio.Semaphore(self.concurrency)
+        try:
+            return [str(ipaddress.ip_address(name))]
+        except ValueError:
+            pass
+        name = name.strip().rstrip('.').lower()
+        v4, v6 = await asyncio.gather(self._lookup(name, TYPE_A, semaphore), self._lookup(name, TYPE_AAAA, semaphore))
+        return v4 + v6
+
+    # 返回 {域名: [IPv4..., IPv6...]}，解析不到的域名对应空列表
+    async def resolve_all(self, names):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        unique = list(dict.fromkeys(names))
+        results = await asyncio.gather(*(self.resolve(name, semaphore) for name in unique))
+        return dict(zip(unique, results))
+
+def resolve(names, **kwargs):
+    return asyncio.run(Resolver(**kwargs).resolve_all(names))
+
+def read_hostnames(path):
+    # 支持 "域名#备注"、"域名 # 备注" 和 "user:pass@域名:端口" 格式
+    names = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = line.split('#', 1)[0].strip()
+            if not entry:
+                continue
+            host = entry.rpartition('@')[2]
+            if host.startswith('['):
+                host = host[1:].partition(']')[0]
+            elif host.count(':') == 1:
+                host = host.partition(':')[0]
+            names.append(host)
+    return names
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='并发解析域名列表（A/AAAA），结果按 TTL 缓存')
+    parser.add_argument('files', nargs='+', help='域名列表文件，如 domain.txt、proxy、socks')
+    parser.add_argument('--server', action='append', help='DNS 服务器，可重复，如 1.1.1.1 或 127.0.0.1:5353（默认读取 /etc/resolv.conf）')
+    parser.add_argument('--cache', default=os.path.join('.cache', 'dns_cache.json'))
+    parser.add_argument('--timeout', type=float, default=DNS_TIMEOUT)
+    args = parser.parse_args(argv)
+    names = [name for path in args.files for name in read_hostnames(path)]
+    cache = DNSCache(args.cache)
+    resolver = Resolver(args.server, cache, timeout=args.timeout)
+    start = time.perf_counter()
+    results = asyncio.run(resolver.resolve_all(names))
+    cache.save()
+    for name, addresses in results.items():
+        print(f"{name}\t{' '.join(addresses) if addresses else '解析失败'}")
+    print(f"解析 {len(results)} 个域名，用时 {time.perf_counter() - start:.2f}s，"
+          f"缓存命中 {cache.hits} 次，查询 {cache.misses} 次，失败 {resolver.failures} 次")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import struct
+import sys
+
+import dns_resolver
+import output_writer
+import prober
+
+# socks / proxy 列表的存活与延迟检测：
+#   socks：每个条目（user:pass@host:port）完整走一遍 SOCKS5 握手——协商认证方式、用户名密码认证、CONNECT 到测试目标
+#   proxy：每个 ProxyIP 域名（可带 :端口）做 TCP 连接 + TLS 握手（复用 prober）
+# 每个条目采样多次，统计丢包率、延迟中位数和抖动，按 丢包率→延迟 排序后输出只含存活条目的列表和统计 JSON
+SOCKS_TIMEOUT = 5.0              # 单次握手超时（秒）
+SOCKS_TARGET = "www.cloudflare.com:443"   # CONNECT 的目标，验证代理确实能转发
+PROXY_PORT = 443
+CHECK_SAMPLES = 3
+CHECK_CONCURRENCY = 64
+STATS_FILE = "endpoint_stats.json"
+
+SOCKS_VERSION = 5
+AUTH_NONE = 0x00
+AUTH_USERPASS = 0x02
+AUTH_REJECTED = 0xFF
+
+class SocksError(Exception):
+    pass
+
+def _split_host_port(text, default_port):
+    if text.startswith('['):
+        host, _, rest = text[1:].partition(']')
+        return host, int(rest.lstrip(':') or default_port)
+    if text.count(':') == 1:
+        host, port = text.split(':')
+        return host, int(port)
+    return text, default_port
+
+# 每行一个条目，# 之后为备注；返回 [{"line", "entry", "host", "port", "username", "password"}]
+def read_endpoints(path, default_port):
+    endpoints = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = line.split('#', 1)[0].strip()
+            if not entry:
+                continue
+            credentials, _, address = entry.rpartition('@')
+            username, _, password = credentials.partition(':')
+            try:
+                host, port = _split_host_port(address, default_port)
+            except ValueError:
+                print(f"⚠️ 无法解析的条目: {entry}")
+                continue
+            endpoints.append({"line": line.rstrip('\n'), "entry": entry, "host": host, "port": port,
+                              "username": username or None, "password": password})
+    return endpoints
+
+def _encode_target(target):
+    host, port = _split_host_port(target, 443)
+    encoded = host.encode('idna')
+    return b'\x03' + bytes([len(encoded)]) + encoded + struct.pack('!H', port)
+
+# 一次完整的 SOCKS5 握手，返回 (TCP 连接耗时, 握手总耗时)，单位毫秒
+async def socks_once(address, endpoint, target=SOCKS_TARGET, timeout=SOCKS_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(address, endpoint["port"]), timeout)
+    connect_ms = (loop.time() - start) * 1000
+
+    async def exchange(data, size):
+        writer.write(data)
+        await writer.drain()
+        return await reader.readexactly(size)
+
+    async def handshake():
+        methods = bytes([AUTH_NONE, AUTH_USERPASS]) if endpoint["username"] else bytes([AUTH_NONE])
+        version, method = await exchange(bytes([SOCKS_VERSION, len(methods)]) + methods, 2)
+        if version != SOCKS_VERSION:
+            raise SocksError("不是 SOCKS5 服务")
+        if method == AUTH_REJECTED or method not in methods:
+            raise SocksError("认证方式被拒绝")
+        if method == AUTH_USERPASS:
+            username = endpoint["username"].encode()
+            password = endpoint["password"].encode()
+            _, status = await exchange(bytes([1, len(username)]) + username + bytes([len(password)]) + password, 2)
+            if status != 0:
+                raise SocksError("用户名或密码错误")
+        reply = await exchange(bytes([SOCKS_VERSION, 1, 0]) + _encode_target(target), 4)
+        if reply[1] != 0:
+            raise SocksError(f"CONNECT 失败（REP={reply[1]}）")
+        # 读完绑定地址，确认应答完整
+        if reply[3] == 1:
+            await reader.readexactly(4 + 2)
+        elif reply[3] == 4:
+            await reader.readexactly(16 + 2)
+        else:
+            await reader.readexactly((await reader.readexactly(1))[0] + 2)
+
+    try:
+        await asyncio.wait_for(handshake(), timeout)
+    finally:
+        writer.close()
+    return connect_ms, (loop.time() - start) * 1000
+
+def summarize(endpoint, address, connect_samples, samples, attempts, error=None):
+    received = len(samples)
+    result = {
+        "entry": endpoint["entry"],
+        "host": endpoint["host"],
+        "port": endpoint["port"],
+        "address": address,
+        "sent": attempts,
+        "received": received,
+        "loss": round(1 - received / attempts, 4) if attempts else 1.0,
+        "connect_ms": round(statistics.median(connect_samples), 2) if connect_samples else None,
+        "latency_ms": None,
+        "jitter_ms": None,
+        "tls_failed": False,
+        "error": None if received else error,
+    }
+    if samples:
+        result["latency_ms"] = round(statistics.median(samples), 2)
+        result["jitter_ms"] = round(statistics.pstdev(samples), 2) if len(samples) > 1 else 0.0
+    return result
+
+async def check_socks(endpoint, address, semaphore, samples=CHECK_SAMPLES, target=SOCKS_TARGET, timeout=SOCKS_TIMEOUT):
+    connect_samples = []
+    handshake_samples = []
+    error = None
+    for attempt in range(samples):
+        if attempt:
+            await asyncio.sleep(prober.PROBE_INTERVAL)
+        async with semaphore:
+            try:
+                connect_ms, total_ms = await socks_once(address, endpoint, target, timeout)
+            except SocksError as e:
+                error = str(e)
+                continue
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                error = type(e).__name__ if isinstance(e, asyncio.TimeoutError) else str(e) or type(e).__name__
+                continue
+        connect_samples.append(connect_ms)
+        handshake_samples.append(total_ms)
+    return summarize(endpoint, address, connect_samples, handshake_samples, samples, error)
+
+# ProxyIP：TCP 连接 + TLS 握手，延迟取两者之和；TLS 全部失败视为不可用
+async def check_proxy(endpoint, address, semaphore, samples=CHECK_SAMPLES, timeout=prober.PROBE_TIMEOUT,
+                      ssl_context=None, sni=prober.PROBE_SNI):
+    result = await prober.probe_ip(address, semaphore, samples, endpoint["port"], timeout, ssl_context, sni)
+    summary = summarize(endpoint, address, [], [], samples)
+    summary.update(received=result["received"], loss=result["loss"], connect_ms=result["latency_ms"],
+                   jitter_ms=result["jitter_ms"], tls_failed=result["tls_failed"])
+    if result["latency_ms"] is None:
+        summary["error"] = "连接失败"
+    elif result["tls_ms"] is None:
+        summary["error"] = "TLS 握手失败"
+    else:
+        summary["latency_ms"] = round(result["latency_ms"] + result["tls_ms"], 2)
+    return summary
+
+async def check_all(socks_endpoints, proxy_endpoints, samples=CHECK_SAMPLES, concurrency=CHECK_CONCURRENCY,
+                    socks_target=SOCKS_TARGET, timeout=SOCKS_TIMEOUT, resolver=None, sni=prober.PROBE_SNI):
+    resolver = resolver or dns_resolver.Resolver()
+    hosts = [endpoint["host"] for endpoint in socks_endpoints + proxy_endpoints]
+    resolved = await resolver.resolve_all(hosts)
+    semaphore = asyncio.Semaphore(concurrency)
+    ssl_context = prober._make_ssl_context()
+
+    async def unresolved(endpoint):
+        return summarize(endpoint, None, [], [], samples, "解析失败")
+
+    def first_address(endpoint):
+        addresses = resolved.get(endpoint["host"]) or []
+        return addresses[0] if addresses else None
+
+    socks_jobs = [check_socks(e, first_address(e), semaphore, samples, socks_target, timeout) if first_address(e)
+                  else unresolved(e) for e in socks_endpoints]
+    proxy_jobs = [check_proxy(e, first_address(e), semaphore, samples, timeout, ssl_context, sni) if first_address(e)
+                  else unresolved(e) for e in proxy_endpoints]
+    results = await asyncio.gather(*socks_jobs, *proxy_jobs)
+    return results[:len(socks_jobs)], results[len(socks_jobs):]
+
+# 存活条目按 丢包率→延迟→抖动 排序，保留原始行（含备注）
+def ranked_alive(endpoints, results):
+    alive = [(prober.rank_key(result), endpoint["line"]) for endpoint, result in zip(endpoints, results)
+             if result["latency_ms"] is not None and result["error"] is None]
+    alive.sort(key=lambda item: item[0])
+    return [line for _, line in alive]
+
+def print_results(kind, results):
+    for result in sorted(results, key=prober.rank_key):
+        if result["error"]:
+            print(f"❌ {kind} {result['entry']}\t{result['error']}")
+            continue
+        print(f"✅ {kind} {result['entry']}\t延迟 {result['latency_ms']:.1f}ms\t连接 {result['connect_ms'] or 0:.1f}ms\t"
+              f"丢包 {result['loss']:.0%}\t抖动 {result['jitter_ms'] or 0:.1f}ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='socks / proxy 列表存活与延迟检测')
+    parser.add_argument('--socks', default='socks', help='SOCKS5 列表（user:pass@host:port）')
+    parser.add_argument('--proxy', default='proxy', help='ProxyIP 列表（host 或 host:port）')
+    parser.add_argument('--samples', type=int, default=CHECK_SAMPLES)
+    parser.add_argument('--concurrency', type=int, default=CHECK_CONCURRENCY)
+    parser.add_argument('--timeout', type=float, default=SOCKS_TIMEOUT)
+    parser.add_argument('--socks-target', default=SOCKS_TARGET, help='SOCKS5 CONNECT 的目标 host:port')
+    parser.add_argument('--sni', default=prober.PROBE_SNI, help='ProxyIP TLS 握手使用的 SNI')
+    parser.add_argument('--dns-server', action='append', help='DNS 服务器（默认读取 /etc/resolv.conf）')
+    parser.add_argument('--stats', default=STATS_FILE, help='统计结果 JSON')
+    parser.add_argument('--suffix', default='_alive.txt', help='存活列表文件名后缀，如 socks → socks_alive.txt')
+    args = parser.parse_args(argv)
+
+    socks_endpoints = read_endpoints(args.socks, 1080) if os.path.exists(args.socks) else []
+    proxy_endpoints = read_endpoints(args.proxy, PROXY_PORT) if os.path.exists(args.proxy) else []
+    if not socks_endpoints and not proxy_endpoints:
+        print("⚠️ 没有可检测的条目")
+        return 1
+    cache = dns_resolver.DNSCache(os.path.join('.cache', 'dns_cache.json'))
+    resolver = dns_resolver.Resolver(args.dns_server, cache)
+    socks_results, proxy_results = asyncio.run(check_all(
+        socks_endpoints, proxy_endpoints, args.samples, args.concurrency, args.socks_target, args.timeout, resolver, args.sni))
+    try:
+        cache.save()
+    except OSError as e:
+        print(f"⚠️ DNS 缓存写入失败: {e}")
+
+    print_results("socks", socks_results)
+    print_results("proxy", proxy_results)
+    for path, endpoints, results in ((args.socks, socks_endpoints, socks_results), (args.proxy, proxy_endpoints, proxy_results)):
+        if not endpoints:
+            continue
+        alive = ranked_alive(endpoints, results)
+        output_writer.write_atomic(f"{path}{args.suffix}", '\n'.join(alive) + '\n' if alive else '')
+        print(f"📄 {path}{args.suffix}：存活 {len(alive)}/{len(endpoints)}")
+    output_writer.write_atomic(args.stats, json.dumps(
+        {"socks": socks_results, "proxy": proxy_results}, ensure_ascii=False, indent=2) + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import bisect
+import csv
+import ipaddress
+import mmap
+import struct
+import sys
+
+import output_writer
+
+# 离线 GeoIP/ASN 区间表
+# CSV 每行：起始IP,结束IP,国家代码[,ASN]（也支持 CIDR,国家代码[,ASN]），IPv4/IPv6 可混排
+# 预编译为二进制文件后通过 mmap 加载，按区间起点二分查找
+#
+# 文件布局（整数均为大端）：
+#   头部   : MAGIC(8) + IPv4条数(4) + IPv6条数(4)
+#   每个表 : 起点[n]*宽度 + 终点[n]*宽度 + 国家代码[n]*2 + ASN[n]*4
+#   IPv4 表宽度 4 字节，IPv6 表宽度 16 字节
+MAGIC = b'IPGEO1\0\0'
+HEADER = struct.Struct('>8sII')
+
+class _FixedWidthKeys:
+    # 把 mmap 中的一段定长大端整数当作有序序列，供 bisect 直接比较 bytes
+    def __init__(self, buf, offset, count, width):
+        self.buf = buf
+        self.offset = offset
+        self.count = count
+        self.width = width
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        start = self.offset + index * self.width
+        return self.buf[start:start + self.width]
+
+class _RangeTable:
+    def __init__(self, buf, offset, count, width):
+        self.count = count
+        self.starts = _FixedWidthKeys(buf, offset, count, width)
+        offset += count * width
+        self.ends = _FixedWidthKeys(buf, offset, count, width)
+        offset += count * width
+        self.countries = _FixedWidthKeys(buf, offset, count, 2)
+        offset += count * 2
+        self.asns = _FixedWidthKeys(buf, offset, count, 4)
+        self.size = offset + count * 4
+
+    def lookup(self, key):
+        index = bisect.bisect_right(self.starts, key) - 1
+        if index < 0 or self.ends[index] < key:
+            return None
+        country = self.countries[index].decode('ascii').strip()
+        asn = int.from_bytes(self.asns[index], 'big')
+        return country or None, asn or None
+
+class GeoIPDatabase:
+    def __init__(self, path):
+        self._mm = None
+        self._file = open(path, 'rb')
+        try:
+            try:
+                self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"空的 GeoIP 数据库文件: {path}")
+            self._load(path)
+        except BaseException:
+            self.close()
+            raise
+
+    # 校验头部和两张表的长度与文件大小一致，截断或损坏的文件直接报错，而不是返回错误的查询结果
+    def _load(self, path):
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"GeoIP 数据库文件不完整（{len(self._mm)} 字节）: {path}")
+        magic, n4, n6 = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是有效的 GeoIP 数据库文件: {path}")
+        expected = HEADER.size + n4 * (4 * 2 + 6) + n6 * (16 * 2 + 6)
+        if expected != len(self._mm):
+            raise ValueError(f"GeoIP 数据库大小不符（应为 {expected} 字节，实际 {len(self._mm)} 字节）: {path}")
+        self.v4 = _RangeTable(self._mm, HEADER.size, n4, 4)
+        self.v6 = _RangeTable(self._mm, self.v4.size, n6, 16)
+
+    def lookup(self, ip):
+        try:
+            ip_obj = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        table = self.v4 if ip_obj.version == 4 else self.v6
+        return table.lookup(ip_obj.packed)
+
+    def country(self, ip):
+        hit = self.lookup(ip)
+        return hit[0] if hit else None
+
+    def asn(self, ip):
+        hit = self.lookup(ip)
+        return hit[1] if hit else None
+
+    def __len__(self):
+        return self.v4.count + self.v6.count
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _parse_range(row):
+    if '/' in row[0]:
+        network = ipaddress.ip_network(row[0].strip(), strict=False)
+        return network[0], network[-1], row[1:]
+    start = ipaddress.ip_address(row[0].strip())
+    end = ipaddress.ip_address(row[1].strip())
+    if start.version != end.version or end < start:
+        raise ValueError("区间无效")
+    return start, end, row[2:]
+
+def _parse_asn(value):
+    value = value.strip().upper()
+    if value.startswith('AS'):
+        value = value[2:]
+    return int(value) if value.isdigit() else 0
+
+def read_ranges(csv_path):
+    ranges = {4: [], 6: []}
+    skipped = 0
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            try:
+                start, end, rest = _parse_range(row)
+            except (ValueError, IndexError):
+                skipped += 1
+                continue
+            country = rest[0].strip().upper()[:2] if rest else ''
+            asn = _parse_asn(rest[1]) if len(rest) > 1 else 0
+            ranges[start.version].append((start.packed, end.packed, country, asn))
+    return ranges, skipped
+
+def _pack_table(rows):
+    rows.sort(key=lambda r: r[0])
+    return b''.join([
+        b''.join(r[0] for r in rows),
+        b''.join(r[1] for r in rows),
+        b''.join(r[2].encode('ascii', 'replace').ljust(2) for r in rows),
+        b''.join(struct.pack('>I', r[3] & 0xFFFFFFFF) for r in rows),
+    ])
+
+def build_database(csv_path, out_path):
+    ranges, skipped = read_ranges(csv_path)
+    output_writer.write_atomic(out_path, HEADER.pack(MAGIC, len(ranges[4]), len(ranges[6]))
+                               + _pack_table(ranges[4]) + _pack_table(ranges[6]))
+    return len(ranges[4]), len(ranges[6]), skipped
+
+def main(argv):
+    if len(argv) >= 3 and argv[0] == 'build':
+        n4, n6, skipped = build_database(argv[1], argv[2])
+        print(f"✅ 已生成 {argv[2]}：IPv4 区间 {n4} 个，IPv6 区间 {n6} 个，跳过无效行 {skipped} 个")
+        return 0
+    if len(argv) >= 3 and argv[0] == 'lookup':
+        with GeoIPDatabase(argv[1]) as db:
+            for ip in argv[2:]:
+                hit = db.lookup(ip)
+                print(f"{ip}\t{hit[0] if hit else '-'}\t{('AS%d' % hit[1]) if hit and hit[1] else '-'}")
+        return 0
+    print("用法：python geoip_db.py build <ranges.csv> <geoip.bin>")
+    print("      python geoip_db.py lookup <geoip.bin> <ip> [ip ...]")
+    return 2
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
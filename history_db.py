@@ -0,0 +1,149 @@
+import math
+import os
+import sqlite3
+import sys
+import time
+
+# IP 观测历史（SQLite）
+# observations 表记录每次采集到的 (ip, 来源, 延迟, 速度, 地区码, 运营商, 时间)，只追加不回读
+# scores 表按 IP 保存时间衰减评分，插入观测时增量更新，排名时无需扫描历史
+#
+# 衰减评分：score(t) = Σ w_i * exp(-λ (t - t_i))
+# 为了让排名可以直接走索引，保存的是与时间无关的 log_score = ln(Σ w_i * exp(λ t_i))，
+# 任意时刻 t 的评分为 exp(log_score - λ t)，同一时刻各 IP 的先后顺序与 log_score 一致
+HALF_LIFE_HOURS = 24.0           # 评分半衰期（小时）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    ip TEXT NOT NULL,
+    source TEXT NOT NULL,
+    latency_ms REAL,
+    speed_mb REAL,
+    colo TEXT,
+    carrier TEXT,
+    observed_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_observations_ip ON observations (ip, observed_at);
+CREATE INDEX IF NOT EXISTS idx_observations_time ON observations (observed_at);
+CREATE TABLE IF NOT EXISTS scores (
+    ip TEXT PRIMARY KEY,
+    log_score REAL NOT NULL,
+    observations INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    label TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scores_rank ON scores (log_score DESC);
+"""
+
+UPSERT_SCORE = """
+INSERT INTO scores (ip, log_score, observations, first_seen, last_seen, label)
+VALUES (?, ?, 1, ?, ?, ?)
+ON CONFLICT (ip) DO UPDATE SET
+    log_score = logaddexp(log_score, excluded.log_score),
+    observations = observations + 1,
+    last_seen = MAX(last_seen, excluded.last_seen),
+    label = COALESCE(excluded.label, label)
+"""
+
+def logaddexp(a, b):
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log1p(math.exp(low - high))
+
+# 单条观测的权重：出现一次记 1 分，速度越快、延迟越低额外加分
+def observation_weight(latency_ms=None, speed_mb=None):
+    weight = 1.0
+    if speed_mb:
+        weight += min(speed_mb, 50.0) / 10
+    if latency_ms is not None:
+        weight += 100.0 / (100.0 + latency_ms)
+    return weight
+
+class HistoryStore:
+    def __init__(self, path, half_life_hours=HALF_LIFE_HOURS):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.decay = math.log(2) / (half_life_hours * 3600)
+        self.conn = sqlite3.connect(path)
+        self.conn.create_function('logaddexp', 2, logaddexp, deterministic=True)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    # observations: 可迭代的 dict，键为 ip/source/latency_ms/speed_mb/colo/carrier/label
+    def record(self, observations, observed_at=None):
+        observed_at = int(observed_at if observed_at is not None else time.time())
+        rows = []
+        scores = []
+        for obs in observations:
+            latency_ms, speed_mb = obs.get('latency_ms'), obs.get('speed_mb')
+            rows.append((obs['ip'], obs['source'], latency_ms, speed_mb,
+                         obs.get('colo'), obs.get('carrier'), observed_at))
+            log_score = math.log(observation_weight(latency_ms, speed_mb)) + self.decay * observed_at
+            scores.append((obs['ip'], log_score, observed_at, observed_at, obs.get('label')))
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO observations (ip, source, latency_ms, speed_mb, colo, carrier, observed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self.conn.executemany(UPSERT_SCORE, scores)
+        return len(rows)
+
+    # 按当前评分从高到低返回 (ip, score, observations, label)，只取 since 之后出现过的 IP
+    def ranked(self, limit=None, since=0, exclude=(), now=None):
+        now = now if now is not None else time.time()
+        exclude = set(exclude)
+        cursor = self.conn.execute(
+            'SELECT ip, log_score, observations, label FROM scores '
+            'WHERE last_seen >= ? ORDER BY log_score DESC', (int(since),))
+        results = []
+        for ip, log_score, count, label in cursor:
+            if ip in exclude:
+                continue
+            results.append((ip, math.exp(log_score - self.decay * now), count, label))
+            if limit and len(results) >= limit:
+                break
+        cursor.close()
+        return results
+
+    # 删除过旧的观测明细，以及此后再没出现过的 IP 的评分（衰减到这时已接近 0，不会再进入排名）
+    # 返回 (删除的观测条数, 删除的评分条数)
+    def prune(self, before):
+        with self.conn:
+            observations = self.conn.execute('DELETE FROM observations WHERE observed_at < ?', (int(before),)).rowcount
+            scores = self.conn.execute('DELETE FROM scores WHERE last_seen < ?', (int(before),)).rowcount
+        return observations, scores
+
+    def stats(self):
+        observations = self.conn.execute('SELECT COUNT(*) FROM observations').fetchone()[0]
+        ips = self.conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+        return {"observations": observations, "ips": ips}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main(argv):
+    if len(argv) >= 1 and argv[0] in ('top', 'stats') and len(argv) >= 2:
+        with HistoryStore(argv[1]) as store:
+            if argv[0] == 'stats':
+                stats = store.stats()
+                print(f"观测 {stats['observations']} 条，IP {stats['ips']} 个")
+                return 0
+            limit = int(argv[2]) if len(argv) >= 3 else 20
+            for ip, score, count, label in store.ranked(limit):
+                print(f"{ip}\t评分 {score:.2f}\t出现 {count} 次\t{label or '-'}")
+        return 0
+    print("用法：python history_db.py top <history.sqlite3> [数量]")
+    print("      python history_db.py stats <history.sqlite3>")
+    return 2
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,33 +1,430 @@
 import requests
-from bs4 import BeautifulSoup
 import os
+import sys
+import random
 import re
 import concurrent.futures
+import asyncio
+import dns_resolver
+import argparse
 import datetime
+import functools
+import gzip
+import importlib
+import hashlib
 import ipaddress
+import json
+import statistics
+import time
+import threading
+import socket
+import sqlite3
+import urllib3
+import geoip_db
+import history_db
+import ipset
+import output_writer
+import prober
+import source_health
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
 
-try:
-    import cloudscraper
-except ImportError:
-    cloudscraper = None
+# bs4、lxml、cloudscraper 较重，只在需要它们的来源运行时才导入（见来源注册表中的 prepare）
+_optional_modules = {}
+
+def optional_import(name):
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+IP164746_URL = "https://ip.164746.xyz/"
+WETEST_URLS = [
+    "https://www.wetest.vip/page/cloudflare/address_v4.html",
+    "https://www.wetest.vip/page/cloudflare/address_v6.html",
+    "https://www.wetest.vip/page/cloudfront/address_v4.html",
+    "https://www.wetest.vip/page/cloudfront/address_v6.html",
+]
+HOSTMONIT_URLS = [
+    "https://stock.hostmonit.com/CloudFlareYes",
+    "https://stock.hostmonit.com/CloudFlareYesV6"
+]
+VPS789_API_URL = "https://vps789.com/openApi/cfIpApi"
+VPS789_TOP20_URL = "https://vps789.com/openApi/cfIpTop20"
+IPDB_URL = "https://ipdb.api.030101.xyz/?type=bestcf&country=true"
+IPINFO_URL = "https://ipinfo.io/{ip}/json"
+
+PROBE_ENABLED = os.getenv("PROBE", "0") == "1"   # 开启后用本地 TCP/TLS 测得的延迟重新排序并标注
+PROBE_SAMPLES = int(os.getenv("PROBE_SAMPLES", prober.PROBE_SAMPLES))
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", prober.PROBE_CONCURRENCY))
+
+FETCH_MAX_WORKERS = 16           # 抓取线程池大小（所有来源共用）
+MAX_CONNECTIONS_PER_HOST = 4     # 同一主机的并发请求上限
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", 6))   # 同时抓取的来源数，其余按调度顺序排队
+
+# ==================== 时间预算 ====================
+# 整次运行有总期限，每个来源（含国家代码查询）有各自的时间预算，超出即放弃，已完成的来源照常输出
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE", 120))   # 抓取阶段总期限（秒）
+# 各来源的时间预算和保留条数在注册表中声明，可用 SOURCE_BUDGETS=hostmonit=60,wetest=20、SOURCE_ROWS=hostmonit=5 覆盖
+SOURCE_BUDGETS = {k.strip(): float(v) for k, _, v in (item.partition('=') for item in os.getenv("SOURCE_BUDGETS", "").split(',')) if v}
+SOURCE_ROWS = {k.strip(): int(v) for k, _, v in (item.partition('=') for item in os.getenv("SOURCE_ROWS", "").split(',')) if v}
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", 4.0))
+RETRY_ATTEMPTS = 3               # 连接错误、超时、429/5xx 最多尝试次数
+RETRY_BASE_DELAY = 0.5           # 重试退避基数（秒），按 2 的幂增长并加随机抖动
+RETRY_STATUS = {429, 500, 502, 503, 504}
+BUDGET_EXCEEDED = "超出时间预算"
+
+CACHE_DIR = '.cache'
+CLEARANCE_FILE = os.path.join(CACHE_DIR, 'cloudscraper_clearance.json')
+CLEARANCE_TTL = 6 * 3600         # Cloudflare 验证 Cookie 未声明过期时间时的保存时长（秒）
+
+SOURCE_HEALTH_FILE = os.path.join(CACHE_DIR, 'source_health.json')
+BREAKER_PROBE_BUDGET = 8.0       # 熔断试探时的时间预算（秒）
+BREAKER_SKIPPED = "熔断跳过"
+
+HISTORY_ENABLED = os.getenv("HISTORY", "1") != "0"   # 关闭后 89.txt 只按本次采集结果输出
+HISTORY_DB_FILE = os.getenv("HISTORY_DB", os.path.join(CACHE_DIR, 'history.sqlite3'))
+HISTORY_HALF_LIFE_HOURS = float(os.getenv("HISTORY_HALF_LIFE_HOURS", history_db.HALF_LIFE_HOURS))
+HISTORY_MAX_AGE_HOURS = float(os.getenv("HISTORY_MAX_AGE_HOURS", 24))   # 只输出最近这段时间内出现过的IP
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", 30))  # 观测明细及久未出现的 IP 评分保留天数
+HISTORY_TOP = int(os.getenv("HISTORY_TOP", 0))                          # 输出条数，0 表示与本次去重后的条数相同
+
+RESOLVE_ENABLED = os.getenv("RESOLVE_HOSTNAMES", "1") != "0"   # 解析域名条目，用真实 IP 去重、排除和测速
+DNS_CACHE_FILE = os.path.join(CACHE_DIR, 'dns_cache.json')
+DNS_SERVERS = [s.strip() for s in os.getenv("DNS_SERVERS", "").split(',') if s.strip()]   # 为空时读取 /etc/resolv.conf
+
+EXCLUDE_FILE = os.getenv("EXCLUDE_FILE", "exclude.txt")   # 每行一个 IP/CIDR/区间，命中的条目不输出
+
+OUTPUT_BASENAME = os.getenv("OUTPUT_BASENAME", "89")
+OUTPUT_FORMATS = [fmt.strip() for fmt in os.getenv("OUTPUT_FORMATS", "txt,json,csv,yaml").split(',') if fmt.strip()]
+CLASH_PROXY_TEMPLATE = os.getenv("CLASH_PROXY_TEMPLATE", "")   # JSON，Clash 节点模板（type/port/uuid/servername 等），为空时不生成 YAML
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_clearance_lock = threading.Lock()   # 多个 hostmonit 请求并发完成时，串行读改写验证会话文件
+
+# ==================== 运行指标 ====================
+# 每个来源（按 URL）记录：DNS/连接/传输耗时、响应大小、解析耗时、国家代码查询耗时、重试次数和条目数
+RUN_REPORT_FILE = os.getenv("RUN_REPORT", "run_report.json")
+PROMETHEUS_TEXTFILE = os.getenv("PROMETHEUS_TEXTFILE", "")   # 设置后额外输出 Prometheus textfile
+
+run_metrics = {}
+_metrics_lock = threading.Lock()
+_dns_timed_hosts = set()
+_timing = threading.local()
+
+def source_name(url):
+    source = source_for(url)
+    return source.label(url) if source else urlparse(url).hostname or url
+
+def source_group(url):
+    source = source_for(url)
+    return source.name if source else urlparse(url).hostname or url
+
+def reset_run_metrics():
+    with _metrics_lock:
+        run_metrics.clear()
+        _dns_timed_hosts.clear()
+
+def _metrics_entry(url):
+    entry = run_metrics.get(url)
+    if entry is None:
+        entry = run_metrics[url] = {
+            "source": source_name(url), "url": url, "requests": 0, "retries": 0,
+            "dns_ms": 0.0, "connect_ms": 0.0, "transfer_ms": 0.0, "parse_ms": 0.0, "geo_ms": 0.0,
+            "total_ms": 0.0, "bytes": 0, "items": 0, "hedged": 0, "cache_hit": False, "status": None, "error": None
+        }
+    return entry
+
+# 数值类指标累加
+def add_metrics(url, **values):
+    with _metrics_lock:
+        entry = _metrics_entry(url)
+        for key, value in values.items():
+            entry[key] += value
+
+def set_metrics(url, **values):
+    with _metrics_lock:
+        _metrics_entry(url).update(values)
+
+# 每次运行中每个主机只单独测一次 DNS 解析耗时
+def measure_dns(url):
+    parsed = urlparse(url)
+    with _metrics_lock:
+        if parsed.hostname in _dns_timed_hosts:
+            return 0.0
+        _dns_timed_hosts.add(parsed.hostname)
+    start = time.perf_counter()
+    try:
+        socket.getaddrinfo(parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80), type=socket.SOCK_STREAM)
+    except OSError:
+        pass
+    return (time.perf_counter() - start) * 1000
+
+# 统计新建连接（TCP + TLS 握手）耗时；抓取在单个工作线程内完成，用线程局部变量累计
+class _TimedConnectionMixin:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _timing.connect_ms = getattr(_timing, 'connect_ms', 0.0) + (time.perf_counter() - start) * 1000
+
+class TimedHTTPConnection(_TimedConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_TimedConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+def instrument_session(session):
+    for adapter in session.adapters.values():
+        poolmanager = getattr(adapter, 'poolmanager', None)
+        if poolmanager is not None:
+            poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+    return session
+
+def build_run_report(started_at, duration_ms):
+    with _metrics_lock:
+        sources = [dict(entry) for entry in run_metrics.values()]
+    for entry in sources:
+        for key in ("dns_ms", "connect_ms", "transfer_ms", "parse_ms", "geo_ms", "total_ms"):
+            entry[key] = round(entry[key], 2)
+    return {
+        "started_at": started_at,
+        "duration_ms": round(duration_ms, 2),
+        "sources": sorted(sources, key=lambda e: e["total_ms"], reverse=True),
+        "totals": {
+            "bytes": sum(e["bytes"] for e in sources),
+            "items": sum(e["items"] for e in sources),
+            "retries": sum(e["retries"] for e in sources),
+            "hedged": sum(e["hedged"] for e in sources),
+            "parse_ms": round(sum(e["parse_ms"] for e in sources), 2),
+            "geo_ms": round(sum(e["geo_ms"] for e in sources), 2),
+        },
+        "http_cache": dict(http_cache_stats),
+    }
+
+def _prom_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+def format_prometheus(report):
+    lines = [
+        "# HELP ip_scraper_run_duration_seconds Wall time of the last scrape run.",
+        "# TYPE ip_scraper_run_duration_seconds gauge",
+        f"ip_scraper_run_duration_seconds {report['duration_ms'] / 1000:.3f}",
+        "# HELP ip_scraper_run_timestamp_seconds Unix time the last scrape run finished.",
+        "# TYPE ip_scraper_run_timestamp_seconds gauge",
+        f"ip_scraper_run_timestamp_seconds {time.time():.0f}",
+        "# HELP ip_scraper_source_stage_seconds Time spent per source and stage in the last run.",
+        "# TYPE ip_scraper_source_stage_seconds gauge",
+    ]
+    for entry in report["sources"]:
+        label = _prom_label(entry["source"])
+        for stage in ("dns", "connect", "transfer", "parse", "geo", "total"):
+            lines.append(f'ip_scraper_source_stage_seconds{{source="{label}",stage="{stage}"}} {entry[stage + "_ms"] / 1000:.4f}')
+    for metric, key, help_text in (
+        ("ip_scraper_source_response_bytes", "bytes", "Response body size per source."),
+        ("ip_scraper_source_items", "items", "Entries extracted per source."),
+        ("ip_scraper_source_retries", "retries", "Retries per source."),
+        ("ip_scraper_source_hedged", "hedged", "Hedged duplicate requests per source."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for entry in report["sources"]:
+            lines.append(f'{metric}{{source="{_prom_label(entry["source"])}"}} {entry[key]}')
+    lines.append("# HELP ip_scraper_source_up Whether the source returned at least one entry.")
+    lines.append("# TYPE ip_scraper_source_up gauge")
+    for entry in report["sources"]:
+        lines.append(f'ip_scraper_source_up{{source="{_prom_label(entry["source"])}"}} {1 if entry["items"] else 0}')
+    return "\n".join(lines) + "\n"
+
+def write_run_report(report, path=RUN_REPORT_FILE, prometheus_path=PROMETHEUS_TEXTFILE):
+    try:
+        if path:
+            output_writer.write_atomic(path, json.dumps(report, ensure_ascii=False, indent=2))
+        if prometheus_path:
+            output_writer.write_atomic(prometheus_path, format_prometheus(report))
+    except OSError as e:
+        print(f"⚠️ 运行报告写入失败: {e}")
+
+# TG 说明中的耗时摘要：总耗时 + 最慢的几个来源
+def format_latency_summary(report, top=3):
+    slowest = [f"{e['source']} {e['total_ms'] / 1000:.1f}s" for e in report["sources"][:top]]
+    return f"⏱️ 总耗时 {report['duration_ms'] / 1000:.1f}s｜最慢：{'、'.join(slowest) or '无'}"
 
 def get_client(use_cloudscraper=False):
-    if use_cloudscraper and cloudscraper:
+    cloudscraper = optional_import("cloudscraper") if use_cloudscraper else None
+    if cloudscraper:
         return cloudscraper.create_scraper(browser={'browser': 'chrome', 'platform': 'windows', 'mobile': False})
     return requests.Session()
 
-def get_ip_country_code(ip):
+def load_clearance(path=CLEARANCE_FILE):
     try:
-        ip_obj = ipaddress.ip_address(ip)
-        if ip_obj.version == 6:
-            return "IPv6"
-        url = f"https://ipinfo.io/{ip}/json"
-        response = requests.get(url, timeout=8)
-        response.raise_for_status()
-        country = response.json().get("country")
-        return country if country and country != "XX" else "CF"
-    except:
-        return "CF"
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def restore_clearance(session, host, path=CLEARANCE_FILE):
+    entry = load_clearance(path).get(host)
+    if not entry or entry.get("expires", 0) <= time.time():
+        return False
+    if entry.get("user_agent"):
+        session.headers['User-Agent'] = entry["user_agent"]
+    for cookie in entry.get("cookies", []):
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+    print(f"🍪 复用 {host} 的 Cloudflare 验证会话")
+    return True
+
+# 保存 cloudscraper 通过验证后的 Cookie 和 User-Agent，后续请求（包括下次运行）可跳过验证
+def save_clearance(session, response, path=CLEARANCE_FILE):
+    host = urlparse(response.url).hostname
+    cookies = [c for c in session.cookies if host and host.endswith(c.domain.lstrip('.'))]
+    if not cookies:
+        return
+    expires = time.time() + CLEARANCE_TTL
+    clearance = next((c for c in cookies if c.name == 'cf_clearance' and c.expires), None)
+    if clearance:
+        expires = min(expires, clearance.expires)
+    entry = {
+        "user_agent": response.request.headers.get('User-Agent') or session.headers.get('User-Agent'),
+        "cookies": [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path} for c in cookies],
+        "expires": expires
+    }
+    with _clearance_lock:
+        data = {h: e for h, e in load_clearance(path).items() if e.get("expires", 0) > time.time()}
+        data[host] = entry
+        try:
+            output_writer.write_atomic(path, json.dumps(data, ensure_ascii=False))
+        except OSError as e:
+            print(f"⚠️ 验证会话保存失败: {e}")
+
+# 每个主机共用一个 keep-alive 会话；cloudscraper 会话额外恢复已保存的验证 Cookie
+def get_session(url, use_cloudscraper=False):
+    host = urlparse(url).hostname
+    use_cloudscraper = bool(use_cloudscraper and optional_import("cloudscraper"))
+    key = (host, use_cloudscraper)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = get_client(use_cloudscraper)
+            if use_cloudscraper:
+                restore_clearance(session, host)
+            else:
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=FETCH_MAX_WORKERS)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+            _sessions[key] = instrument_session(session)
+    return session
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+GEO_CACHE_FILE = os.path.join(CACHE_DIR, 'geo_cache.json')
+GEO_CACHE_TTL = 7 * 24 * 3600      # 国家代码缓存有效期（秒）
+GEO_CACHE_MAX_ENTRIES = 5000       # 超出后按最近使用时间淘汰（LRU）
+GEO_MAX_WORKERS = 8
+GEOIP_DB_FILE = os.getenv("GEOIP_DB", os.path.join(CACHE_DIR, 'geoip.bin'))  # 由 geoip_db.py build 生成
+
+def lookup_ip_country(ip, timeout=8):
+    url = IPINFO_URL.format(ip=ip)
+    response = get_session(url).get(url, timeout=timeout)
+    response.raise_for_status()
+    country = response.json().get("country")
+    return country if country and country != "XX" else "CF"
+
+def load_geo_cache(path=GEO_CACHE_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_geo_cache(cache, path=GEO_CACHE_FILE, max_entries=GEO_CACHE_MAX_ENTRIES):
+    if len(cache) > max_entries:
+        recent = sorted(cache.items(), key=lambda kv: kv[1].get("used", 0), reverse=True)
+        cache = dict(recent[:max_entries])
+    try:
+        output_writer.write_atomic(path, json.dumps(cache, ensure_ascii=False, separators=(',', ':')))
+    except OSError as e:
+        print(f"⚠️ 国家代码缓存写入失败: {e}")
+
+def open_geoip_db(path=GEOIP_DB_FILE):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        db = geoip_db.GeoIPDatabase(path)
+        print(f"🗂️ 已加载离线 GeoIP 数据库 {path}（{len(db)} 个区间）")
+        return db
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 离线 GeoIP 数据库加载失败: {e}")
+        return None
+
+# 批量查询国家代码：优先离线库，其次缓存，剩余IP并发请求 ipinfo.io，成功结果写回缓存
+def get_ip_country_codes(ips, cache=None, geo_db=None, max_workers=GEO_MAX_WORKERS, ttl=GEO_CACHE_TTL, deadline=None):
+    if cache is None:
+        cache = {}
+    now = time.time()
+    results = {}
+    pending = []
+    hits = offline_hits = 0
+    for ip in dict.fromkeys(ips):
+        try:
+            is_v6 = ipaddress.ip_address(ip).version == 6
+        except ValueError:
+            results[ip] = "CF"
+            continue
+        country = geo_db.country(ip) if geo_db else None
+        if country:
+            results[ip] = country
+            offline_hits += 1
+            continue
+        if is_v6:
+            results[ip] = "IPv6"
+            continue
+        entry = cache.get(ip)
+        if entry and now - entry.get("ts", 0) < ttl:
+            entry["used"] = now
+            results[ip] = entry["cc"]
+            hits += 1
+        else:
+            pending.append(ip)
+
+    # 超过期限后剩余的IP不再联网查询，按查询失败处理
+    def lookup(ip):
+        timeout = 8
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                return ip, None
+        try:
+            return ip, lookup_ip_country(ip, timeout)
+        except Exception:
+            return ip, None
+
+    if pending:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            for ip, country in executor.map(lookup, pending):
+                if country is None:
+                    results[ip] = "CF"
+                    continue
+                results[ip] = country
+                cache[ip] = {"cc": country, "ts": now, "used": now}
+    print(f"🌍 国家代码：离线命中 {offline_hits} 个，缓存命中 {hits} 个，联网查询 {len(pending)} 个")
+    return results
 
 def parse_speed(speed_str):
     if not speed_str:
@@ -47,145 +444,360 @@ def parse_latency(latency_str):
         return float(match.group(1))
     return 999999
 
-def fetch_text_ips(url):
+# 条件请求缓存：按 URL 保存 ETag/Last-Modified 和解析结果，服务器返回 304 时直接复用上次的解析结果
+HTTP_CACHE_FILE = os.path.join(CACHE_DIR, 'http_cache.json')
+HTTP_CACHE_VERSION = 2           # 解析逻辑变化时加一，使旧的解析结果失效
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+http_cache_stats = {"hit": 0, "miss": 0, "bytes_saved": 0, "bytes_downloaded": 0}
+
+def reset_http_cache_stats():
+    with _http_cache_lock:
+        for key in http_cache_stats:
+            http_cache_stats[key] = 0
+
+def load_http_cache(path=HTTP_CACHE_FILE):
+    global _http_cache
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != HTTP_CACHE_VERSION:
+            raise ValueError("缓存版本不匹配")
+        _http_cache = data.get("entries", {})
+    except (OSError, ValueError, AttributeError):
+        _http_cache = {}
+    return _http_cache
+
+def save_http_cache(path=HTTP_CACHE_FILE):
+    if _http_cache is None:
+        return
+    try:
+        with _http_cache_lock:
+            text = json.dumps({"version": HTTP_CACHE_VERSION, "entries": _http_cache}, ensure_ascii=False)
+        output_writer.write_atomic(path, text)
+    except OSError as e:
+        print(f"⚠️ HTTP 缓存写入失败: {e}")
+
+def _restore_tuples(result):
+    if isinstance(result, list):
+        return [tuple(item) if isinstance(item, list) else item for item in result]
+    return result
+
+# 当前线程所执行抓取任务的截止时间（time.monotonic()），由调度器设置
+def remaining_budget():
+    deadline = getattr(_timing, 'deadline', None)
+    return None if deadline is None else deadline - time.monotonic()
+
+# 连接错误、超时和 429/5xx 按指数退避加随机抖动重试；单次超时和退避等待都不超过剩余预算
+def get_with_retry(session, url, **kwargs):
+    timeout = kwargs.pop('timeout', None)
+    for attempt in range(RETRY_ATTEMPTS):
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            raise requests.Timeout(BUDGET_EXCEEDED)
+        try:
+            request_timeout = timeout if remaining is None else min(timeout or remaining, remaining)
+            response = session.get(url, timeout=request_timeout, **kwargs)
+            if response.status_code not in RETRY_STATUS or attempt == RETRY_ATTEMPTS - 1:
+                return response
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == RETRY_ATTEMPTS - 1:
+                raise
+            response = None
+        delay = random.uniform(0, RETRY_BASE_DELAY * 2 ** (attempt + 1))
+        remaining = remaining_budget()
+        if remaining is not None and delay >= remaining:
+            if response is not None:
+                return response
+            raise requests.Timeout(BUDGET_EXCEEDED)
+        add_metrics(url, retries=1)
+        time.sleep(delay)
+
+def fetch_cached(session, url, parse, detect_encoding=False, headers=None, **kwargs):
+    cache = _http_cache if _http_cache is not None else load_http_cache()
+    headers = dict(headers or {})
+    entry = cache.get(url)
+    if entry:
+        if entry.get("etag"):
+            headers['If-None-Match'] = entry["etag"]
+        if entry.get("last_modified"):
+            headers['If-Modified-Since'] = entry["last_modified"]
+    dns_ms = measure_dns(url)
+    _timing.connect_ms = 0.0
+    start = time.perf_counter()
+    try:
+        response = get_with_retry(session, url, headers=headers, **kwargs)
+    except Exception as e:
+        set_metrics(url, error=str(e)[:200])
+        raise
+    finally:
+        request_ms = (time.perf_counter() - start) * 1000
+        add_metrics(url, requests=1, dns_ms=dns_ms, connect_ms=_timing.connect_ms,
+                    transfer_ms=max(0.0, request_ms - _timing.connect_ms))
+    set_metrics(url, status=response.status_code)
+    if response.status_code == 304 and entry:
+        set_metrics(url, cache_hit=True)
+        with _http_cache_lock:
+            http_cache_stats["hit"] += 1
+            http_cache_stats["bytes_saved"] += entry.get("size", 0)
+        return _restore_tuples(entry["result"]), response
     try:
-        response = requests.get(url, timeout=15)
         response.raise_for_status()
-        return [line.strip() for line in response.text.split('\n')
-                if line.strip() and (re.match(r'^\d+\.\d+\.\d+\.\d+$', line.strip()) or ':' in line.strip())]
+    except requests.HTTPError as e:
+        set_metrics(url, error=str(e)[:200])
+        raise
+    if detect_encoding:
+        response.encoding = response.apparent_encoding
+    start = time.perf_counter()
+    result = parse(response.text)
+    size = len(response.content)
+    add_metrics(url, parse_ms=(time.perf_counter() - start) * 1000, bytes=size)
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    with _http_cache_lock:
+        http_cache_stats["miss"] += 1
+        http_cache_stats["bytes_downloaded"] += size
+        if etag or last_modified:
+            cache[url] = {"etag": etag, "last_modified": last_modified, "size": size, "result": result}
+        else:
+            cache.pop(url, None)
+    return result, response
+
+def format_http_cache_stats():
+    return (f"命中 {http_cache_stats['hit']} 次，未命中 {http_cache_stats['miss']} 次，"
+            f"下载 {http_cache_stats['bytes_downloaded'] / 1024:.1f}KB，节省约 {http_cache_stats['bytes_saved'] / 1024:.1f}KB")
+
+def parse_text_ips(text):
+    return [line.strip() for line in text.split('\n')
+            if line.strip() and (re.match(r'^\d+\.\d+\.\d+\.\d+$', line.strip()) or ':' in line.strip())]
+
+def fetch_text_ips(url):
+    try:
+        return fetch_cached(get_session(url), url, parse_text_ips, timeout=15)[0]
     except:
         return []
 
+IPV4_PATTERN = re.compile(r'(\d{1,3}(?:\.\d{1,3}){3})')
+IP_PATTERN = re.compile(r'((?:\d{1,3}\.){3}\d{1,3}|(?:[0-9a-fA-F]{0,4}:){2,}[0-9a-fA-F]{0,4})')
+SPEED_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(MB|KB)/s', re.I)
+LATENCY_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(毫秒|ms)', re.I)
+COLO_PATTERN = re.compile(r'[A-Z]{3}')
+CARRIERS = ["移动", "联通", "电信"]
+SCHEMA_SAMPLE_ROWS = 5           # 用前几行数据推断各字段所在列
+
+# 与 bs4 的 get_text 保持一致：跳过注释以及 script/style/template 中的文本
+@functools.lru_cache(maxsize=None)
+def _cell_text_xpath():
+    return optional_import("lxml.etree").XPath(
+        './/text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::template)]')
+
+def _table_rows_lxml(html):
+    doc = optional_import("lxml.html").fromstring(html)
+    table = next(doc.iter('table'), None)
+    if table is None:
+        return None
+    rows = []
+    xpath = _cell_text_xpath()
+    for tr in list(table.iter('tr'))[1:]:
+        rows.append([" ".join(t.strip() for t in xpath(td) if t.strip()) for td in tr.iter('td')])
+    return rows
+
+def _table_rows_bs4(html):
+    bs4 = optional_import("bs4")
+    if bs4 is None:
+        raise ImportError("解析表格需要安装 lxml 或 beautifulsoup4")
+    table = bs4.BeautifulSoup(html, 'html.parser').find('table')
+    if not table:
+        return None
+    return [[td.get_text(" ", strip=True) for td in tr.find_all('td')] for tr in table.find_all('tr')[1:]]
+
+# 表格解析后端：装有 lxml 时使用 C 解析器，否则回退到 bs4；首次调用时才导入
+def table_backend():
+    if optional_import("lxml.etree") and optional_import("lxml.html"):
+        return "lxml"
+    return "bs4" if optional_import("bs4") else None
+
+# 提取页面第一个表格中（跳过表头行）每行各单元格的文本
+def extract_table_rows(html):
+    if table_backend() == "lxml":
+        try:
+            return _table_rows_lxml(html)
+        except (ValueError, optional_import("lxml.etree").ParserError):
+            pass
+    return _table_rows_bs4(html)
+
+def _match_ip(text):
+    match = IP_PATTERN.search(text)
+    return match.group(1) if match else None
+
+def _match_ipv4(text):
+    match = IPV4_PATTERN.search(text)
+    return match.group(1) if match else None
+
+def _match_speed(text):
+    match = SPEED_PATTERN.search(text)
+    return match.group(0) if match else None
+
+def _match_latency(text):
+    match = LATENCY_PATTERN.search(text)
+    return match.group(0) if match else None
+
+def _match_colo(text):
+    match = COLO_PATTERN.fullmatch(text.strip())
+    return match.group(0) if match else None
+
+# 根据前几行推断每个字段位于哪一列：只有各样本行中"第一个匹配的列"一致时才锁定该列
+def detect_columns(rows, matchers, sample=SCHEMA_SAMPLE_ROWS):
+    columns = {}
+    sampled = [cols for cols in rows if cols][:sample]
+    for field, matcher in matchers.items():
+        found = {next((i for i, text in enumerate(cols) if matcher(text)), None) for cols in sampled}
+        if len(found) == 1 and None not in found:
+            columns[field] = found.pop()
+    return columns
+
+# 与原逻辑一致取每行第一个匹配的列：推断出的列之前没有匹配时直接取该列，否则逐列查找
+def pick_field(cols, matcher, index):
+    if index is not None and index < len(cols) and not any(matcher(text) for text in cols[:index]):
+        value = matcher(cols[index])
+        if value:
+            return value
+    for text in cols:
+        value = matcher(text)
+        if value:
+            return value
+    return None
+
+def parse_ip164746_html(html):
+    rows = extract_table_rows(html)
+    if rows is None:
+        return []
+    matchers = {"ip": _match_ipv4, "speed": _match_speed}
+    columns = detect_columns(rows, matchers)
+    ip_data = []
+    for cols in rows:
+        ip = pick_field(cols, _match_ipv4, columns.get("ip"))
+        speed = pick_field(cols, _match_speed, columns.get("speed"))
+        if ip and speed:
+            ip_data.append((ip, speed))
+    return sorted(ip_data, key=lambda x: parse_speed(x[1]), reverse=True)
+
 def fetch_ip164746(url):
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        response = requests.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding
-        soup = BeautifulSoup(response.text, 'html.parser')
-        table = soup.find('table')
-        if not table:
-            return []
-        ip_data = []
-        for row in table.find_all('tr')[1:]:
-            cols = row.find_all('td')
-            row_text = [c.get_text(" ", strip=True) for c in cols]
-            ip = None
-            speed = None
-            for text in row_text:
-                if not ip:
-                    ip_match = re.search(r'(\d{1,3}(?:\.\d{1,3}){3})', text)
-                    if ip_match:
-                        ip = ip_match.group(1)
-                if not speed:
-                    speed_match = re.search(r'(\d+(?:\.\d+)?)\s*(MB|KB)/s', text, re.I)
-                    if speed_match:
-                        speed = speed_match.group(0)
-            if ip and speed:
-                ip_data.append((ip, speed))
-        return sorted(ip_data, key=lambda x: parse_speed(x[1]), reverse=True)[:5]
+        return fetch_cached(get_session(url), url, parse_ip164746_html, detect_encoding=True, headers=headers, timeout=20)[0]
     except:
         return []
 
+def parse_wetest_html(html):
+    rows = extract_table_rows(html)
+    if rows is None:
+        return []
+    carriers = CARRIERS
+    grouped = {carrier: [] for carrier in carriers}
+    matchers = {"ip": _match_ip, "speed": _match_speed, "latency": _match_latency, "colo": _match_colo}
+    columns = detect_columns(rows, matchers)
+    for cols in rows:
+        carrier = next((c for c in carriers if any(c in col for col in cols)), None)
+        if not carrier:
+            continue
+        ip = pick_field(cols, _match_ip, columns.get("ip"))
+        latency = pick_field(cols, _match_latency, columns.get("latency"))
+        if ip and latency:
+            speed = pick_field(cols, _match_speed, columns.get("speed"))
+            datacenter = pick_field(cols, _match_colo, columns.get("colo"))
+            grouped[carrier].append({
+                "ip": ip,
+                "speed": speed or "0KB/s",
+                "latency": latency,
+                "name": f"{datacenter or 'UNK'}-{carrier}"
+            })
+    results = []
+    for carrier in carriers:
+        items = grouped.get(carrier, [])
+        if items:
+            items.sort(key=lambda x: (parse_latency(x["latency"]), -parse_speed(x["speed"])))
+            best = items[0]
+            results.append((best["ip"], best["name"]))
+    return results
+
 def fetch_wetest_ips(url):
     headers = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://www.wetest.vip/', 'Accept-Language': 'zh-CN,zh;q=0.9'}
     try:
-        response = requests.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding
-        soup = BeautifulSoup(response.text, 'html.parser')
-        table = soup.find('table')
-        if not table:
-            return []
-        carriers = ["移动", "联通", "电信"]
-        grouped = {carrier: [] for carrier in carriers}
-        for row in table.find_all('tr')[1:]:
-            cols = [td.get_text(" ", strip=True) for td in row.find_all('td')]
-            carrier = next((c for c in carriers if any(c in col for col in cols)), None)
-            if not carrier:
-                continue
-            ip = speed = latency = datacenter = None
-            for text in cols:
-                if not ip:
-                    ip_match = re.search(r'((?:\d{1,3}\.){3}\d{1,3}|(?:[0-9a-fA-F]{0,4}:){2,}[0-9a-fA-F]{0,4})', text)
-                    if ip_match:
-                        ip = ip_match.group(1)
-                if not speed:
-                    speed_match = re.search(r'(\d+(?:\.\d+)?)\s*(MB|KB)/s', text, re.I)
-                    if speed_match:
-                        speed = speed_match.group(0)
-                if not latency:
-                    latency_match = re.search(r'(\d+(?:\.\d+)?)\s*(毫秒|ms)', text, re.I)
-                    if latency_match:
-                        latency = latency_match.group(0)
-                if not datacenter:
-                    dc_match = re.fullmatch(r'[A-Z]{3}', text.strip())
-                    if dc_match:
-                        datacenter = dc_match.group(0)
-            if ip and latency:
-                grouped[carrier].append({
-                    "ip": ip,
-                    "speed": speed or "0KB/s",
-                    "latency": latency,
-                    "name": f"{datacenter or 'UNK'}-{carrier}"
-                })
-        results = []
-        for carrier in carriers:
-            items = grouped.get(carrier, [])
-            if items:
-                items.sort(key=lambda x: (parse_latency(x["latency"]), -parse_speed(x["speed"])))
-                best = items[0]
-                results.append((best["ip"], best["name"]))
-        return results
+        return fetch_cached(get_session(url), url, parse_wetest_html, detect_encoding=True, headers=headers, timeout=20)[0]
     except:
         return []
 
-def fetch_vps789_ips():
+def parse_vps789_api(text):
     cf_api_ips = []
-    cf_top_ips = []
-    url_api = "https://vps789.com/openApi/cfIpApi"
-    url_top20 = "https://vps789.com/openApi/cfIpTop20"
+    data = json.loads(text)
+    if data.get("code") == 0:
+        carrier_map = {"CM": "移动", "CU": "联通", "CT": "电信"}
+        for carrier_code, items in data.get("data", {}).items():
+            carrier_name = carrier_map.get(carrier_code, carrier_code)
+            if items:
+                item = items[0]
+                ip = item.get("ip")
+                if ip:
+                    cf_api_ips.append((ip, carrier_name))
+    return cf_api_ips
+
+def fetch_vps789_api(url=VPS789_API_URL):
     try:
-        response = requests.get(url_api, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("code") == 0:
-            carrier_map = {"CM": "移动", "CU": "联通", "CT": "电信"}
-            for carrier_code, items in data.get("data", {}).items():
-                carrier_name = carrier_map.get(carrier_code, carrier_code)
-                if items:
-                    item = items[0]
-                    ip = item.get("ip")
-                    if ip:
-                        cf_api_ips.append((ip, carrier_name))
+        return fetch_cached(get_session(url), url, parse_vps789_api, timeout=15)[0]
     except Exception as e:
         print(f"❌ vps789 cfIpApi 失败: {e}")
+        return []
+
+def parse_vps789_top20(text):
+    cf_top_ips = []
+    data = json.loads(text)
+    if data.get("code") == 0:
+        good_list = data.get("data", {}).get("good", [])[:3]
+        seen = set()
+        for item in good_list:
+            entry = item.get("ip")
+            if not entry or entry in seen:
+                continue
+            seen.add(entry)
+            cf_top_ips.append((entry, "优选"))
+    return cf_top_ips
 
+def fetch_vps789_top20(url=VPS789_TOP20_URL):
     try:
-        response = requests.get(url_top20, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("code") == 0:
-            good_list = data.get("data", {}).get("good", [])[:3]
-            seen = set()
-            for item in good_list:
-                entry = item.get("ip")
-                if not entry or entry in seen:
-                    continue
-                seen.add(entry)
-                cf_top_ips.append((entry, "优选"))
+        return fetch_cached(get_session(url), url, parse_vps789_top20, timeout=15)[0]
     except Exception as e:
         print(f"❌ vps789 cfIpTop20 失败: {e}")
+        return []
 
-    all_vps = cf_api_ips + cf_top_ips
-    print(f"✅ vps789 双API成功获取 {len(all_vps)} 个条目")
-    return {
-        "all": all_vps,
-        "cfIpApi_count": len(cf_api_ips),
-        "cfIpTop20_count": len(cf_top_ips),
-        "cfIpApi_url": url_api,
-        "cfIpTop20_url": url_top20
-    }
+# 注册表中每个 URL 单独抓取，按 URL 分派到对应的 API；两个 API 的合计在采集完成后打印
+def fetch_vps789_ips(url):
+    return fetch_vps789_top20(url) if url == VPS789_TOP20_URL else fetch_vps789_api(url)
+
+def parse_hostmonit_text(text):
+    records = []
+    for line in text.splitlines():
+        line = line.strip()
+        if '|' not in line or '---' in line or 'Line' in line or 'IP' in line.upper():
+            continue
+        parts = [p.strip() for p in line.split('|') if p.strip()]
+        if len(parts) < 6:
+            continue
+        carrier = parts[0]
+        ip = next((p for p in parts if re.match(r'(\d{1,3}\.){3}\d{1,3}|:', p)), None)
+        latency = next((p for p in parts if 'ms' in p.lower()), None)
+        speed = next((p for p in parts if re.search(r'KB/s|MB/s', p, re.I)), None)
+        colo = next((p for p in parts if re.fullmatch(r'[A-Z]{3}', p)), None)
+        if ip and latency:
+            records.append({
+                "ip": ip,
+                "speed": speed or "0KB/s",
+                "latency": latency,
+                "name": f"{colo or 'HM'}-{carrier}"
+            })
+    records.sort(key=lambda x: (parse_latency(x["latency"]), -parse_speed(x["speed"])))
+    return [(x["ip"], x["name"]) for x in records]
 
 def fetch_hostmonit_ips(url):
     headers = {
@@ -193,36 +805,14 @@ def fetch_hostmonit_ips(url):
         'Accept': 'text/html,application/xhtml+xml,*/*',
         'Referer': 'https://stock.hostmonit.com/'
     }
-    client = get_client(True)
+    client = get_session(url, use_cloudscraper=True)
     try:
-        response = client.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
-        text = response.text
-        records = []
-        for line in text.splitlines():
-            line = line.strip()
-            if '|' not in line or '---' in line or 'Line' in line or 'IP' in line.upper():
-                continue
-            parts = [p.strip() for p in line.split('|') if p.strip()]
-            if len(parts) < 6:
-                continue
-            carrier = parts[0]
-            ip = next((p for p in parts if re.match(r'(\d{1,3}\.){3}\d{1,3}|:', p)), None)
-            latency = next((p for p in parts if 'ms' in p.lower()), None)
-            speed = next((p for p in parts if re.search(r'KB/s|MB/s', p, re.I)), None)
-            colo = next((p for p in parts if re.fullmatch(r'[A-Z]{3}', p)), None)
-            if ip and latency:
-                records.append({
-                    "ip": ip,
-                    "speed": speed or "0KB/s",
-                    "latency": latency,
-                    "name": f"{colo or 'HM'}-{carrier}"
-                })
-        records.sort(key=lambda x: (parse_latency(x["latency"]), -parse_speed(x["speed"])))
-        selected = records[:2]
+        selected, response = fetch_cached(client, url, parse_hostmonit_text, headers=headers, timeout=20)
+        if optional_import("cloudscraper"):
+            save_clearance(client, response)
         if selected:
             print(f"✅ hostmonit 成功: {url}（{len(selected)}个）")
-            return [(x["ip"], x["name"]) for x in selected]
+            return selected
         else:
             print(f"⚠️ hostmonit 解析到0个")
             return []
@@ -230,6 +820,290 @@ def fetch_hostmonit_ips(url):
         print(f"❌ {url} 处理错误: {e}")
         return []
 
+# ==================== 来源注册表 ====================
+# 每个来源声明自己的 URL 列表、抓取函数（含解析）、每个 URL 保留的条数、条目标注方式、时间预算和是否对冲；
+# prepare 在该来源第一次抓取前运行，用来按需导入较重的依赖。新增来源只需 register_source，
+# 抓取引擎、历史记录、统计和通知都会自动包含它
+# urls 是函数而不是列表，运行时才读取 URL 常量（基准测试会把它们指向本地替身服务器）
+class Source:
+    def __init__(self, name, urls, fetch, label, entry=None, rows=None, budget=30, hedge=False,
+                 needs_geo=False, merged=False, prepare=None):
+        self.name = name
+        self.urls = urls
+        self.fetch = fetch
+        self.label = label               # url -> 日志、统计中显示的名称
+        self.entry = entry or named_entry   # (条目, 国家代码表) -> "IP#标注"
+        self.rows = rows                 # 每个 URL 最多保留几条，None 为不限
+        self.budget = budget             # 时间预算（秒）
+        self.hedge = hedge               # 较慢但重要的来源：超过 HEDGE_DELAY 未返回时再发一份相同请求，取先成功的
+        self.needs_geo = needs_geo       # 是否需要查询国家代码
+        self.merged = merged             # 多个 URL 在历史记录和异常列表中算作同一个来源
+        self.prepare = prepare
+
+    def row_budget(self):
+        return SOURCE_ROWS.get(self.name, self.rows)
+
+    def time_budget(self):
+        return SOURCE_BUDGETS.get(self.name, self.budget)
+
+SOURCES = {}
+
+def register_source(source):
+    SOURCES[source.name] = source
+    return source
+
+def source_for(url):
+    return next((source for source in SOURCES.values() if url in source.urls()), None)
+
+# names 为空时返回全部来源（按注册顺序，即条目输出顺序）
+def select_sources(names=None):
+    if not names:
+        return list(SOURCES.values())
+    unknown = [name for name in names if name not in SOURCES]
+    if unknown:
+        raise ValueError(f"未知的来源: {', '.join(unknown)}（可选：{', '.join(SOURCES)}）")
+    return [source for name, source in SOURCES.items() if name in names]
+
+def named_entry(item, countries):
+    ip, name = item
+    return f"{ip}#{name}"
+
+def country_entry(ip, countries):
+    return f"{ip}#{countries[ip]}"
+
+def country_speed_entry(item, countries):
+    ip, speed = item
+    return f"{ip}#{countries[ip]}-{speed}"
+
+register_source(Source(
+    "ip164746", lambda: [IP164746_URL], fetch_ip164746, lambda url: "ip.164746.xyz",
+    entry=country_speed_entry, rows=5, hedge=True, needs_geo=True, prepare=table_backend))
+register_source(Source(
+    "wetest", lambda: WETEST_URLS, fetch_wetest_ips,
+    lambda url: f"wetest {url.split('/')[-2]}/{url.split('/')[-1].replace('.html', '')}", prepare=table_backend))
+register_source(Source(
+    "vps789", lambda: [VPS789_API_URL, VPS789_TOP20_URL],
+    fetch_vps789_ips,
+    lambda url: f"vps789 {url.rstrip('/').split('/')[-1]}", budget=20, merged=True))
+register_source(Source(
+    "hostmonit", lambda: HOSTMONIT_URLS, fetch_hostmonit_ips, lambda url: f"hostmonit {url.split('/')[-1]}",
+    rows=2, budget=45, prepare=lambda: optional_import("cloudscraper")))
+register_source(Source(
+    "ipdb", lambda: [IPDB_URL], fetch_text_ips, lambda url: "ipdb.api",
+    entry=country_entry, hedge=True, needs_geo=True))
+
+# 解析所有域名条目（IP 条目跳过），返回 {域名: [IPv4..., IPv6...]}
+def resolve_entries(lines, cache):
+    names = [entry for entry in (line.split('#')[0].strip() for line in lines) if entry and ipset.ip_key(entry) is None]
+    if not names:
+        return {}
+    resolver = dns_resolver.Resolver(DNS_SERVERS or None, cache)
+    start = time.perf_counter()
+    resolved = asyncio.run(resolver.resolve_all(names))
+    failed = sum(1 for addresses in resolved.values() if not addresses)
+    print(f"🧭 域名解析：{len(resolved)} 个，失败 {failed} 个，缓存命中 {cache.hits} 次，"
+          f"用时 {(time.perf_counter() - start) * 1000:.0f}ms")
+    return resolved
+
+# 按规范化的整数地址去重（同一 IPv6 地址的不同写法视为重复）；
+# 域名条目按解析出的地址去重（全部地址都已出现过时视为重复），解析不到时按小写字符串去重
+def dedup_entries(lines, resolved=None):
+    resolved = resolved or {}
+    seen = ipset.IPSet()
+    seen_names = set()
+    deduped = []
+    duplicates = []
+    for line in lines:
+        entry = line.split('#')[0].strip()
+        key = ipset.ip_key(entry)
+        if key is not None:
+            is_new = seen.add_new(*key)
+        else:
+            is_new = entry.lower() not in seen_names
+            seen_names.add(entry.lower())
+            keys = [ipset.ip_key(address) for address in resolved.get(entry, ())]
+            if is_new and keys:
+                is_new = any([seen.add_new(*address_key) for address_key in keys])
+        if is_new:
+            deduped.append(line)
+        else:
+            duplicates.append(entry)
+    return deduped, duplicates
+
+def load_exclusions(path=EXCLUDE_FILE):
+    if not path or not os.path.exists(path):
+        return None
+    excluded = ipset.IPSet.from_file(path)
+    print(f"🚫 已加载排除列表 {path}（{excluded.range_count()} 个区间，无效行 {excluded.skipped} 个）")
+    return excluded
+
+# 域名条目的所有解析地址都在排除列表中时才排除
+def apply_exclusions(lines, excluded, resolved=None):
+    if not excluded:
+        return lines
+    resolved = resolved or {}
+
+    def is_excluded(entry):
+        addresses = resolved.get(entry)
+        if addresses:
+            return all(address in excluded for address in addresses)
+        return entry in excluded
+    return [line for line in lines if not is_excluded(line.split('#')[0].strip())]
+
+SCRAPED_SPEED_SUFFIX = re.compile(r'-\d+(?:\.\d+)?\s*(?:MB|KB)/s$', re.I)
+LATENCY_SUFFIX = re.compile(r'-\d+(?:\.\d+)?\s*ms$', re.I)   # 上次测速（或来源自带）的延迟，换成本次实测值
+
+# 用本地探测结果重新排序并把标签中抓取来的速度换成实测延迟；全部不可达的条目被剔除
+def rerank_by_probe(lines, results):
+    alive = []
+    for line in lines:
+        entry, _, label = line.partition('#')
+        result = results.get(entry.strip())
+        if not result or result["latency_ms"] is None:
+            continue
+        label = LATENCY_SUFFIX.sub('', SCRAPED_SPEED_SUFFIX.sub('', label))
+        alive.append((prober.rank_key(result), f"{entry}#{label}-{result['latency_ms']:.0f}ms"))
+    alive.sort(key=lambda item: item[0])
+    return [line for _, line in alive]
+
+# 域名条目用解析出的第一个地址测速，不必每次采样都重新解析；返回 {条目: 测速结果}
+def probe_targets(lines, resolved=None):
+    resolved = resolved or {}
+    entries = [line.split('#')[0].strip() for line in lines]
+    targets = {entry: (resolved.get(entry) or [entry])[0] for entry in entries}
+    by_target = prober.probe(list(targets.values()), samples=PROBE_SAMPLES, concurrency=PROBE_CONCURRENCY)
+    return {entry: by_target[target] for entry, target in targets.items()}
+
+def probe_entries(lines, resolved=None):
+    start = time.perf_counter()
+    results = probe_targets(lines, resolved)
+    ranked = rerank_by_probe(lines, results)
+    elapsed = time.perf_counter() - start
+    latencies = [r["latency_ms"] for r in results.values() if r["latency_ms"] is not None]
+    summary = f"存活 {len(ranked)}/{len(lines)}，中位延迟 {statistics.median(latencies):.0f}ms" if latencies else f"存活 0/{len(lines)}"
+    print(f"📡 本地测速完成（{elapsed:.1f}s）：{summary}")
+    if not ranked:
+        print("⚠️ 本地测速全部失败，保留抓取顺序")
+        return lines, summary, results
+    return ranked, summary, results
+
+# 开启本地测速时，历史评分只决定候选集合：从历史沿用的条目（本次未采集到）也要测速，
+# 不可达的剔除，最终顺序按本次实测结果，而不是历史衰减评分
+def reprobe_history(lines, results, resolved=None):
+    carried = [line for line in lines if line.split('#')[0].strip() not in results]
+    if carried:
+        results = dict(results, **probe_targets(carried, resolved))
+    ranked = rerank_by_probe(lines, results)
+    alive = sum(1 for line in carried if results[line.split('#')[0].strip()]["latency_ms"] is not None)
+    print(f"📡 历史沿用条目测速：存活 {alive}/{len(carried)}")
+    return ranked or lines
+
+CARRIER_ALIASES = {"CM": "移动", "CU": "联通", "CT": "电信"}
+
+# 从条目标签中提取地区码、运营商、速度和延迟，例如 "HKG-移动"、"US-30.46MB/s"、"SEA-CT-85ms"
+def parse_label(label):
+    info = {"colo": None, "carrier": None, "latency_ms": None, "speed_mb": None}
+    for part in label.split('-'):
+        part = part.strip()
+        speed = SPEED_PATTERN.fullmatch(part)
+        latency = LATENCY_PATTERN.fullmatch(part)
+        if speed:
+            value = float(speed.group(1))
+            info["speed_mb"] = value / 1024 if speed.group(2).upper() == 'KB' else value
+        elif latency:
+            info["latency_ms"] = float(latency.group(1))
+        elif part in CARRIERS or part.upper() in CARRIER_ALIASES:
+            info["carrier"] = part if part in CARRIERS else CARRIER_ALIASES[part.upper()]
+        elif COLO_PATTERN.fullmatch(part):
+            info["colo"] = part
+    return info
+
+# 记录本次所有来源的观测（同一IP出现在多个来源会记录多次），再按历史衰减评分输出
+# tagged: [(来源, "ip#标签")]；lines: 本次去重后的条目，提供输出标签；dead: 本地测速不可达的IP
+def rank_with_history(tagged, lines, dead=(), now=None):
+    now = now if now is not None else time.time()
+    labels = {}
+    for line in lines:
+        entry, _, label = line.partition('#')
+        labels[entry.strip()] = label
+    observations = []
+    for source, line in tagged:
+        entry, _, label = line.partition('#')
+        ip = entry.strip()
+        info = parse_label(labels.get(ip, label))
+        observations.append(dict(info, ip=ip, source=source, label=labels.get(ip, label)))
+    with history_db.HistoryStore(HISTORY_DB_FILE, HISTORY_HALF_LIFE_HOURS) as store:
+        store.record(observations, observed_at=now)
+        store.prune(now - HISTORY_RETENTION_DAYS * 86400)
+        limit = HISTORY_TOP or len(lines)
+        ranked = store.ranked(limit, since=now - HISTORY_MAX_AGE_HOURS * 3600, exclude=dead, now=now)
+        stats = store.stats()
+    carried = sum(1 for ip, _, _, _ in ranked if ip not in labels)
+    summary = f"累计 {stats['ips']} 个IP / {stats['observations']} 条观测，沿用历史 {carried} 个"
+    print(f"📈 历史评分：{summary}")
+    return [f"{ip}#{label}" if label else ip for ip, _, _, label in ranked], summary
+
+# 域名条目附带解析出的地址（JSON 输出中的 addresses 字段）
+def build_records(lines, resolved=None):
+    resolved = resolved or {}
+    records = []
+    for line in lines:
+        entry, _, label = line.partition('#')
+        record = dict(parse_label(label), ip=entry.strip(), label=label)
+        if resolved.get(record["ip"]):
+            record["addresses"] = resolved[record["ip"]]
+        records.append(record)
+    return records
+
+def load_clash_template():
+    if not CLASH_PROXY_TEMPLATE:
+        return None
+    try:
+        template = json.loads(CLASH_PROXY_TEMPLATE)
+    except ValueError as e:
+        print(f"⚠️ CLASH_PROXY_TEMPLATE 不是有效的 JSON: {e}")
+        return None
+    return template if isinstance(template, dict) else None
+
+# 只运行部分来源时结果不完整：写到 89.partial.* 而不是发布用的 89.*，也不发送 TG 通知
+def is_partial_run(source_names):
+    return bool(source_names) and set(source_names) != set(SOURCES)
+
+def output_basename(source_names=None):
+    return f"{OUTPUT_BASENAME}.partial" if is_partial_run(source_names) else OUTPUT_BASENAME
+
+# 生成各格式输出文件，返回 (89.txt 路径, 有变化的文件列表)
+def write_outputs(lines, resolved=None, basename=None):
+    basename = basename or OUTPUT_BASENAME
+    template = load_clash_template()
+    outputs = {}
+    for fmt in OUTPUT_FORMATS:
+        if fmt not in output_writer.FORMATS:
+            print(f"⚠️ 未知的输出格式: {fmt}")
+            continue
+        if fmt == "yaml" and template is None:
+            continue
+        outputs[fmt] = f"{basename}.{fmt}"
+    outputs.setdefault("txt", f"{basename}.txt")
+    changed = output_writer.write_outputs(build_records(lines, resolved), outputs, template)
+    return outputs["txt"], [path for path, updated in changed.items() if updated]
+
+TELEGRAM_CAPTION_LIMIT = 1024
+
+# 来源明细放不下时按整行截掉，末尾注明省略的条数
+def build_caption(summary, source_stats, footer, limit=TELEGRAM_CAPTION_LIMIT):
+    room = limit - len(summary) - len(footer) - len("\n📊 采集情况：\n")
+    lines = [f"• {stat}" for stat in source_stats]
+    shown = []
+    for i, line in enumerate(lines):
+        rest = len(lines) - i - 1
+        more = f"\n• … 另有 {rest} 个来源" if rest else ""
+        if len('\n'.join(shown + [line])) + len(more) > room:
+            shown.append(f"• … 另有 {len(lines) - i} 个来源")
+            break
+        shown.append(line)
+    return summary + "\n📊 采集情况：\n" + '\n'.join(shown) + "\n" + footer
+
 def send_telegram_combined_message(bot_token, chat_id, caption, file_path):
     if not all([bot_token, chat_id, file_path, os.path.exists(file_path)]):
         print("⚠️ Telegram参数缺失或文件不存在")
@@ -238,7 +1112,7 @@ def send_telegram_combined_message(bot_token, chat_id, caption, file_path):
         url = f"https://api.telegram.org/bot{bot_token}/sendDocument"
         with open(file_path, 'rb') as f:
             files = {'document': (os.path.basename(file_path), f)}
-            data = {'chat_id': chat_id, 'caption': caption[:1024], 'parse_mode': 'Markdown'}
+            data = {'chat_id': chat_id, 'caption': caption[:TELEGRAM_CAPTION_LIMIT], 'parse_mode': 'Markdown'}
             response = requests.post(url, data=data, files=files, timeout=20)
             response.raise_for_status()
             if response.json().get('ok'):
@@ -254,141 +1128,447 @@ def get_china_time():
     china_time = utc_now + datetime.timedelta(hours=8)
     return china_time.strftime("%Y-%m-%d %H:%M:%S")
 
-def extract_fastest_ips():
-    normal_speed_url = "https://ip.164746.xyz/"
-    wetest_urls = [
-        "https://www.wetest.vip/page/cloudflare/address_v4.html",
-        "https://www.wetest.vip/page/cloudflare/address_v6.html",
-        "https://www.wetest.vip/page/cloudfront/address_v4.html",
-        "https://www.wetest.vip/page/cloudfront/address_v6.html",
-    ]
-    hostmonit_urls = [
-        "https://stock.hostmonit.com/CloudFlareYes",
-        "https://stock.hostmonit.com/CloudFlareYesV6"
-    ]
-    text_url = "https://ipdb.api.030101.xyz/?type=bestcf&country=true"
+def _call_with_deadline(fetcher, url, deadline):
+    _timing.deadline = deadline
+    try:
+        return fetcher(url)
+    finally:
+        _timing.deadline = None
 
-    speed_ips_dict = {}
+# 异步抓取引擎：所有来源在同一个事件循环中并发，阻塞的 requests 调用交给共享线程池，
+# 并按主机限制并发数；需要国家代码的来源一完成就开始查询，不必等待较慢的来源
+# 同时抓取的来源数受 FETCH_CONCURRENCY 限制，排队的来源按健康调度顺序依次开始，时间预算从开始抓取时计算
+# 每个来源的等待、抓取、重试和国家代码查询都计入它的时间预算（且不超过总期限），超出即取消，结果按空处理
+# 返回 ({url: 条目列表}, {ip: 国家代码})；sources 为空时抓取注册表中的全部来源
+async def fetch_all_sources(geo_cache, geo_db, deadline=None, health=None, sources=None):
+    loop = asyncio.get_running_loop()
+    deadline = deadline if deadline is not None else time.monotonic() + RUN_DEADLINE
+    host_limits = {}
+    prepared = {}
+    # asyncio.Semaphore 按等待顺序放行，任务按 jobs 顺序创建，调度顺序即开始顺序
+    slots = asyncio.Semaphore(max(1, FETCH_CONCURRENCY))
+    jobs = [(url, source) for source in (sources or select_sources()) for url in source.urls()]
+    if health:
+        order = {url: i for i, url in enumerate(health.schedule([job[0] for job in jobs]))}
+        jobs.sort(key=lambda job: order[job[0]])
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-        futures = {
-            executor.submit(fetch_ip164746, normal_speed_url): normal_speed_url,
-            executor.submit(fetch_vps789_ips): "vps789"
-        }
-        for url in wetest_urls:
-            futures[executor.submit(fetch_wetest_ips, url)] = url
-        for url in hostmonit_urls:
-            futures[executor.submit(fetch_hostmonit_ips, url)] = url
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS)
+
+    # 对冲请求：第一份请求 HEDGE_DELAY 秒内未返回时再发一份，取先拿到非空结果的那份
+    async def fetch_hedged(url, fetcher, source_deadline, hedge):
+        def submit():
+            return asyncio.ensure_future(loop.run_in_executor(executor, _call_with_deadline, fetcher, url, source_deadline))
+        tasks = {submit()}
+        try:
+            if hedge:
+                done, _ = await asyncio.wait(tasks, timeout=HEDGE_DELAY)
+                if not done:
+                    print(f"🔁 {url} {HEDGE_DELAY:.0f}s 未返回，发送对冲请求")
+                    add_metrics(url, hedged=1)
+                    tasks.add(submit())
+            result = []
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result():
+                        return task.result()
+                    if task.exception() is not None and not tasks:
+                        raise task.exception()
+            return result
+        finally:
+            for task in tasks:
+                task.cancel()
 
-        for future in concurrent.futures.as_completed(futures):
-            url = futures[future]
+    async def run_source(url, source):
+        state = health.state(url) if health else source_health.CLOSED
+        if state == source_health.OPEN:
+            print(f"🔌 {url} 熔断中，跳过")
+            set_metrics(url, error=BREAKER_SKIPPED)
+            return url, [], {}
+        async with slots:
+            start = time.perf_counter()
+            budget = min(source.time_budget(), deadline - time.monotonic())
+            hedge = source.hedge
+            if state == source_health.HALF_OPEN:
+                print(f"🔌 {url} 熔断试探")
+                budget = min(budget, BREAKER_PROBE_BUDGET)
+                hedge = False
+            source_deadline = time.monotonic() + max(0.0, budget)
+            host = urlparse(url).hostname
+            limit = host_limits.setdefault(host, asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST))
             try:
-                speed_ips_dict[url] = future.result()
+                # 同一来源的多个 URL 共用一次准备（按需导入依赖），放在线程池中不阻塞事件循环
+                if source.prepare:
+                    if source.name not in prepared:
+                        prepared[source.name] = loop.run_in_executor(executor, source.prepare)
+                    await asyncio.wait_for(asyncio.shield(prepared[source.name]), max(0.0, source_deadline - time.monotonic()))
+                async with limit:
+                    result = await asyncio.wait_for(
+                        fetch_hedged(url, source.fetch, source_deadline, hedge),
+                        max(0.0, source_deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                print(f"⏱️ {url} {BUDGET_EXCEEDED}（{budget:.0f}s），已取消")
+                set_metrics(url, error=BUDGET_EXCEEDED)
+                result = []
             except Exception as e:
                 print(f"❌ {url} 抓取失败: {e}")
-                speed_ips_dict[url] = []
-
-    text_ips = fetch_text_ips(text_url)
-
-    all_ips = []
-    for ip, speed in speed_ips_dict.get(normal_speed_url, []):
-        all_ips.append(f"{ip}#{get_ip_country_code(ip)}-{speed}")
-    for url in wetest_urls:
-        for ip, name in speed_ips_dict.get(url, []):
-            all_ips.append(f"{ip}#{name}")
-    vps_data = speed_ips_dict.get("vps789", {"all": []})
-    for ip, name in vps_data.get("all", []):
-        all_ips.append(f"{ip}#{name}")
-    for url in hostmonit_urls:
-        for ip, name in speed_ips_dict.get(url, []):
-            all_ips.append(f"{ip}#{name}")
-    all_ips += [f"{ip}#{get_ip_country_code(ip)}" for ip in text_ips]
+                set_metrics(url, error=str(e)[:200])
+                result = []
+        if source.row_budget() is not None:
+            result = result[:source.row_budget()]
+        countries = {}
+        if source.needs_geo and result:
+            ips = [item[0] if isinstance(item, tuple) else item for item in result]
+            geo_start = time.perf_counter()
+            try:
+                countries = await asyncio.wait_for(
+                    loop.run_in_executor(executor, get_ip_country_codes, ips, geo_cache, geo_db,
+                                         GEO_MAX_WORKERS, GEO_CACHE_TTL, source_deadline),
+                    max(0.0, source_deadline - time.monotonic()) + 1)
+            except asyncio.TimeoutError:
+                print(f"⏱️ {url} 国家代码查询{BUDGET_EXCEEDED}")
+            # 未查到的IP按查询失败处理，保留部分结果
+            countries = {ip: countries.get(ip, "CF") for ip in ips}
+            add_metrics(url, geo_ms=(time.perf_counter() - geo_start) * 1000)
+        add_metrics(url, total_ms=(time.perf_counter() - start) * 1000, items=len(result))
+        return url, result, countries
+
+    try:
+        outcomes = await asyncio.gather(*(run_source(url, source) for url, source in jobs))
+    finally:
+        # 已放弃的请求不再等待；线程中的请求受截止时间约束，很快会自行结束
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    speed_ips_dict = {}
+    country_codes = {}
+    for url, result, countries in outcomes:
+        speed_ips_dict[url] = result
+        country_codes.update(countries)
+    return speed_ips_dict, country_codes
+
+# 记录本次各来源是否成功（至少一个条目）和耗时；被熔断跳过的来源不计入
+def record_source_health(health):
+    with _metrics_lock:
+        entries = [dict(entry) for entry in run_metrics.values()]
+    for entry in entries:
+        if entry["error"] != BREAKER_SKIPPED:
+            health.record(entry["url"], entry["items"] > 0, entry["total_ms"])
+    try:
+        health.save()
+    except OSError as e:
+        print(f"⚠️ 来源健康状态写入失败: {e}")
+    report = {}
+    for url in health.sources:
+        stats = health.stats(url)
+        report[source_name(url)] = stats
+        rate = f"{stats['success_rate']:.0%}" if stats["success_rate"] is not None else "-"
+        p50 = f"{stats['p50_ms'] / 1000:.1f}s" if stats["p50_ms"] is not None else "-"
+        p95 = f"{stats['p95_ms'] / 1000:.1f}s" if stats["p95_ms"] is not None else "-"
+        print(f"🩺 {source_name(url)}：成功率 {rate}，p50 {p50}，p95 {p95}，"
+              f"连续失败 {stats['consecutive_failures']} 次，{source_health.STATE_NAMES[stats['state']]}")
+    return report
+
+def format_breaker_summary(health):
+    items = []
+    for url in health.sources:
+        state = health.state(url)
+        if state != source_health.CLOSED:
+            failures = health.sources[url]["consecutive_failures"]
+            items.append(f"{source_name(url)} {source_health.STATE_NAMES[state]}（连续失败{failures}次）")
+    return '、'.join(items) or "全部正常"
+
+# state 为 None 时是一次性运行；serve 模式传入同一个 dict，会话、国家代码/HTTP 缓存、离线库和来源健康状态只加载一次
+# source_names 为要运行的来源名（如 ["wetest", "ipdb"]），为空时运行全部来源
+def extract_fastest_ips(state=None, notify=True, source_names=None):
+    sources = select_sources(source_names)
+    started_at = get_china_time()
+    run_start = time.perf_counter()
+    deadline = time.monotonic() + RUN_DEADLINE
+    reset_run_metrics()
+    reset_http_cache_stats()
+    if state and "health" in state:
+        geo_cache, geo_db, health, dns_cache = state["geo_cache"], state["geo_db"], state["health"], state["dns_cache"]
+    else:
+        geo_cache = load_geo_cache()
+        geo_db = open_geoip_db()
+        load_http_cache()
+        health = source_health.SourceHealth(SOURCE_HEALTH_FILE)
+        dns_cache = dns_resolver.DNSCache(DNS_CACHE_FILE)
+        if state is not None:
+            state.update(geo_cache=geo_cache, geo_db=geo_db, health=health, dns_cache=dns_cache)
+    try:
+        speed_ips_dict, country_codes = asyncio.run(fetch_all_sources(geo_cache, geo_db, deadline, health, sources))
+    finally:
+        if state is None:
+            close_sessions()
+    save_geo_cache(geo_cache)
+    save_http_cache()
+    print(f"🗄️ HTTP 缓存：{format_http_cache_stats()}")
+    if geo_db and state is None:
+        geo_db.close()
+
+    # (来源, 条目)，来源用于历史观测记录；按注册顺序排列，去重时先出现的条目保留
+    tagged = []
+    for source in sources:
+        for url in source.urls():
+            tag = source.name if source.merged else source_name(url)
+            tagged += [(tag, source.entry(item, country_codes)) for item in speed_ips_dict.get(url, [])]
+        if source.merged:
+            count = sum(len(speed_ips_dict.get(url, [])) for url in source.urls())
+            print(f"✅ {source.name} {'双' if len(source.urls()) == 2 else len(source.urls())}API成功获取 {count} 个条目")
+    all_ips = [line for _, line in tagged]
+
+    # 域名条目解析为真实 IP，供去重、排除和测速使用
+    resolved = {}
+    if RESOLVE_ENABLED:
+        resolved = resolve_entries(all_ips, dns_cache)
+        if state is not None:
+            state["resolved"] = resolved
+        try:
+            dns_cache.save()
+        except OSError as e:
+            print(f"⚠️ DNS 缓存写入失败: {e}")
 
     # 去重 + 记录被去重的IP
     raw_total = len(all_ips)
-    seen = set()
-    deduped_ips = []
-    duplicates = []
-    for line in all_ips:
-        entry = line.split('#')[0].strip()
-        if entry not in seen:
-            seen.add(entry)
-            deduped_ips.append(line)
+    deduped_ips, duplicates = dedup_entries(all_ips, resolved)
+    excluded = load_exclusions()
+    deduped_ips = apply_exclusions(deduped_ips, excluded, resolved)
+    probe_summary = None
+    probe_results = None
+    dead_ips = set()
+    if PROBE_ENABLED and deduped_ips and time.monotonic() >= deadline:
+        print("⏱️ 已到运行期限，跳过本地测速")
+    elif PROBE_ENABLED and deduped_ips:
+        probed_ips, probe_summary, probe_results = probe_entries(deduped_ips, resolved)
+        alive = {line.split('#')[0].strip() for line in probed_ips}
+        dead_ips = {line.split('#')[0].strip() for line in deduped_ips} - alive
+        deduped_ips = probed_ips
+    partial = is_partial_run(source_names)
+    history_summary = None
+    # 只运行部分来源时不读写历史：单个来源的调试运行不应改变下次完整运行所用的评分
+    if HISTORY_ENABLED and deduped_ips and not partial:
+        try:
+            # 本次实测延迟写在标签里，作为观测计入评分
+            deduped_ips, history_summary = rank_with_history(tagged, deduped_ips, dead_ips)
+            deduped_ips = apply_exclusions(deduped_ips, excluded, resolved)
+        except sqlite3.Error as e:
+            print(f"⚠️ 历史评分失败，按本次采集结果输出: {e}")
         else:
-            duplicates.append(entry)
+            if probe_results is not None:
+                deduped_ips = reprobe_history(deduped_ips, probe_results, resolved)
 
-    file_path = '89.txt'
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(deduped_ips))
+    file_path, changed_files = write_outputs(deduped_ips, resolved, output_basename(source_names))
+    if partial:
+        print(f"🧪 只运行了部分来源（{', '.join(source.name for source in sources)}），结果写入 {file_path}，"
+              f"不改写发布用的 {OUTPUT_BASENAME}.txt，也不发送 TG 通知")
     print(f"✅ 已保存 {len(deduped_ips)} 个条目（原始 {raw_total} 个，去重 {len(duplicates)} 个）")
+    print(f"📝 有变化的文件：{', '.join(changed_files)}" if changed_files else "📝 内容无变化，未改写输出文件")
 
-    # ==================== TG 来源详情（全部加上完整链接） ====================
+    # ==================== TG 来源详情 ====================
     source_stats = []
-
-    # ip.164746
-    ip164_count = len(speed_ips_dict.get(normal_speed_url, []))
-    source_stats.append(f"ip.164746.xyz ({normal_speed_url}): {ip164_count}个")
-
-    # wetest（全部带完整链接）
-    for url in wetest_urls:
-        count = len(speed_ips_dict.get(url, []))
-        short = url.split('/')[-1].replace('.html', '')
-        source_stats.append(f"wetest {short} ({url}): {count}个")
-
-    # vps789（两个链接）
-    vps_data = speed_ips_dict.get("vps789", {"cfIpApi_count": 0, "cfIpTop20_count": 0, "cfIpApi_url": "", "cfIpTop20_url": ""})
-    cf_api_count = vps_data.get("cfIpApi_count", 0)
-    cf_top_count = vps_data.get("cfIpTop20_count", 0)
-    source_stats.append(f"vps789 cfIpApi ({vps_data.get('cfIpApi_url')}): {cf_api_count}个")
-    source_stats.append(f"vps789 cfIpTop20 ({vps_data.get('cfIpTop20_url')}): {cf_top_count}个")
-
-    # hostmonit（全部带完整链接）
-    for url in hostmonit_urls:
-        count = len(speed_ips_dict.get(url, []))
-        short = url.split('/')[-1]
-        source_stats.append(f"hostmonit {short} ({url}): {count}个")
-
-    # ipdb.api
-    ipdb_count = len(text_ips)
-    source_stats.append(f"ipdb.api ({text_url}): {ipdb_count}个")
-
-    # 异常列表
     failed_sources = []
-    if ip164_count == 0:
-        failed_sources.append("ip.164746.xyz")
-    for url in wetest_urls:
-        if len(speed_ips_dict.get(url, [])) == 0:
-            failed_sources.append(url.split('/')[-1])
-    if cf_api_count == 0 and cf_top_count == 0:
-        failed_sources.append("vps789")
-    for url in hostmonit_urls:
-        if len(speed_ips_dict.get(url, [])) == 0:
-            failed_sources.append(url.split('/')[-1])
-    if ipdb_count == 0:
-        failed_sources.append("ipdb.api")
+    for source in sources:
+        counts = {url: len(speed_ips_dict.get(url, [])) for url in source.urls()}
+        source_stats += [f"{source_name(url)}: {count}个" for url, count in counts.items()]
+        # 异常列表（0个）；合并的来源所有 URL 都为 0 才算异常
+        if source.merged:
+            failed_sources += [source.name] if not any(counts.values()) else []
+        else:
+            failed_sources += [source_name(url) for url, count in counts.items() if count == 0]
+
+    timed_out = [entry["source"] for entry in run_metrics.values() if entry["error"] == BUDGET_EXCEEDED]
+
+    health_report = record_source_health(health)
+
+    report = build_run_report(started_at, (time.perf_counter() - run_start) * 1000)
+    report["source_health"] = health_report
+    write_run_report(report)
 
     # ==================== TG 通知（保持你想要的格式） ====================
-    caption = "IP-scraper运行完成\n\n"
-    caption += "📊 采集情况：\n" + "\n".join([f"• {stat}" for stat in source_stats]) + "\n\n"
-    caption += f"✅ 本次共采集 ：{raw_total}个\n"
+    # 汇总行在前，来源明细放在中间，超出 caption 长度时只截短来源明细
+    summary = "IP-scraper运行完成\n"
+    summary += format_latency_summary(report) + "\n"
+    summary += f"✅ 本次共采集 ：{raw_total}个\n"
     
     if duplicates:
-        caption += f"🪄 其中去重：{', '.join(duplicates[:8])}" + (" 等" if len(duplicates) > 8 else "") + "\n"
+        summary += f"🪄 其中去重：{', '.join(duplicates[:8])}" + (" 等" if len(duplicates) > 8 else "") + "\n"
     else:
-        caption += "🪄 其中去重：无\n"
+        summary += "🪄 其中去重：无\n"
     
-    caption += f"✅ 已上传（去重）：{len(deduped_ips)}个IP\n"
+    summary += f"✅ 已上传（去重）：{len(deduped_ips)}个IP" + ("" if changed_files else "（内容无变化）") + "\n"
+    summary += f"🗄️ HTTP 缓存：{format_http_cache_stats()}\n"
+    if probe_summary:
+        summary += f"📡 本地测速：{probe_summary}\n"
+    if history_summary:
+        summary += f"📈 历史评分：{history_summary}\n"
     
     if failed_sources:
-        caption += f"⚠️ 异常（0个）：{'、'.join(failed_sources)}\n"
-    caption += "\n文件地址：\nhttps://raw.githubusercontent.com/lijboys/ip-scraper/refs/heads/main/89.txt\n"
-    caption += f"⏰ {get_china_time()}"
+        summary += f"⚠️ 异常（0个）：{'、'.join(failed_sources)}\n"
+    if timed_out:
+        summary += f"⏱️ {BUDGET_EXCEEDED}：{'、'.join(timed_out)}\n"
+    summary += f"🔌 熔断：{format_breaker_summary(health)}\n"
+    footer = "\n文件地址：\nhttps://raw.githubusercontent.com/lijboys/ip-scraper/refs/heads/main/89.txt\n"
+    footer += f"⏰ {get_china_time()}"
+    caption = build_caption(summary, source_stats, footer)
 
-    bot_token = os.getenv("TELEGRAM_BOT_TOKEN", "")
-    chat_id = os.getenv("TELEGRAM_CHAT_ID", "")
-    send_telegram_combined_message(bot_token, chat_id, caption, file_path)
+    # serve 模式下只在结果有变化时通知，避免每次刷新都发消息
+    if notify and not partial and (state is None or changed_files):
+        bot_token = os.getenv("TELEGRAM_BOT_TOKEN", "")
+        chat_id = os.getenv("TELEGRAM_CHAT_ID", "")
+        send_telegram_combined_message(bot_token, chat_id, caption, file_path)
+    return deduped_ips
 
-if __name__ == "__main__":
+# ==================== serve 模式 ====================
+# 常驻进程：保留会话和缓存定时重新采集，并通过本地 HTTP 提供最新结果（支持 ETag/304 和 gzip）
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", 8080))
+SERVE_INTERVAL = float(os.getenv("SERVE_INTERVAL", 600))   # 两次采集的间隔（秒）
+SERVE_NOTIFY = os.getenv("SERVE_NOTIFY", "0") == "1"       # 结果变化时是否发送 TG 通知
+
+def _make_payload(body, content_type):
+    digest = hashlib.sha1(body).hexdigest()[:16]
+    return {
+        "body": body,
+        "gzip": gzip.compress(body, mtime=0),
+        "etag": f'"{digest}"',
+        "etag_gzip": f'"{digest}-gz"',
+        "content_type": content_type,
+        "last_modified": time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime()),
+    }
+
+class ListHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        payload = self.server.payloads.get(self.path.split('?', 1)[0])
+        if payload is None:
+            self.send_error(404)
+            return
+        use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+        etag = payload["etag_gzip"] if use_gzip else payload["etag"]
+        tags = [tag.strip().removeprefix('W/') for tag in self.headers.get('If-None-Match', '').split(',')]
+        if etag in tags or '*' in tags:
+            self.send_response(304)
+            self._send_common_headers(etag, payload)
+            self.end_headers()
+            return
+        body = payload["gzip"] if use_gzip else payload["body"]
+        self.send_response(200)
+        self._send_common_headers(etag, payload)
+        self.send_header('Content-Type', payload["content_type"])
+        self.send_header('Content-Length', str(len(body)))
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_common_headers(self, etag, payload):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', payload["last_modified"])
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+
+class ListServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, ListHandler)
+        self.payloads = {}
+        self.refreshes = 0
+
+    # 整体替换路径表，处理中的请求继续使用旧内容；内容未变的文件保留原 ETag 和 Last-Modified
+    def update(self, lines, duration_ms=None, resolved=None):
+        records = build_records(lines, resolved)
+        text = _make_payload(output_writer.render_txt(records).encode('utf-8'), 'text/plain; charset=utf-8')
+        data = _make_payload(output_writer.render_json(records).encode('utf-8'), 'application/json; charset=utf-8')
+        previous = self.payloads
+        if previous.get('/89.txt', {}).get("etag") == text["etag"]:
+            text = previous['/89.txt']
+        if previous.get('/89.json', {}).get("etag") == data["etag"]:
+            data = previous['/89.json']
+        self.refreshes += 1
+        status = json.dumps({
+            "updated_at": get_china_time(),
+            "count": len(records),
+            "duration_ms": round(duration_ms, 2) if duration_ms is not None else None,
+            "refreshes": self.refreshes,
+            "list_etag": text["etag"],
+        }, ensure_ascii=False).encode('utf-8')
+        self.payloads = {'/': text, '/89.txt': text, '/89.json': data,
+                         '/status': _make_payload(status, 'application/json; charset=utf-8')}
+
+def serve(host=SERVE_HOST, port=SERVE_PORT, interval=SERVE_INTERVAL, source_names=None):
+    server = ListServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🌐 已启动 http://{host}:{server.server_address[1]}/89.txt（每 {interval:.0f}s 重新采集）")
+    # 首次采集完成前先提供上次输出的结果
+    txt_path = f"{output_basename(source_names)}.txt"
+    if os.path.exists(txt_path):
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            server.update([line for line in f.read().splitlines() if line.strip()])
+    state = {}
+    try:
+        while True:
+            start = time.monotonic()
+            try:
+                lines = extract_fastest_ips(state, notify=SERVE_NOTIFY, source_names=source_names)
+                server.update(lines, (time.monotonic() - start) * 1000, state.get("resolved"))
+            except Exception as e:
+                print(f"❌ 本次采集失败，继续提供上次的结果: {e}")
+            time.sleep(max(0.0, interval - (time.monotonic() - start)))
+    except KeyboardInterrupt:
+        print("===== 已停止 =====")
+    finally:
+        server.shutdown()
+        server.server_close()
+        close_sessions()
+        if state.get("geo_db"):
+            state["geo_db"].close()
+
+# "wetest,ipdb" -> ["wetest", "ipdb"]，同时检查来源名是否存在
+def parse_source_names(text):
+    names = [name.strip() for name in text.split(',') if name.strip()]
+    try:
+        select_sources(names)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return names
+
+def main(argv):
+    sources_help = f"只运行指定来源，逗号分隔（可选：{', '.join(SOURCES)}）"
+    if argv[:1] == ["serve"]:
+        parser = argparse.ArgumentParser(prog='ip_scraper.py serve', description='常驻运行：定时采集并通过 HTTP 提供结果')
+        parser.add_argument('--host', default=SERVE_HOST)
+        parser.add_argument('--port', type=int, default=SERVE_PORT)
+        parser.add_argument('--interval', type=float, default=SERVE_INTERVAL, help='两次采集的间隔（秒）')
+        parser.add_argument('--sources', type=parse_source_names, help=sources_help)
+        args = parser.parse_args(argv[1:])
+        serve(args.host, args.port, args.interval, args.sources)
+        return 0
+    parser = argparse.ArgumentParser(prog='ip_scraper.py', description='采集优选 IP（serve 子命令为常驻模式）')
+    parser.add_argument('--sources', type=parse_source_names, help=sources_help)
+    parser.add_argument('--list-sources', action='store_true', help='列出已注册的来源')
+    args = parser.parse_args(argv)
+    if args.list_sources:
+        for source in SOURCES.values():
+            print(f"{source.name}\t{', '.join(source.urls())}")
+        return 0
     print("===== 开始执行IP采集任务 =====")
-    extract_fastest_ips()
+    extract_fastest_ips(source_names=args.sources)
     print("===== 任务执行完毕 =====")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
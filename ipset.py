@@ -0,0 +1,300 @@
+import bisect
+import heapq
+import ipaddress
+import random
+import socket
+import sys
+from array import array
+
+# 紧凑的 IP 集合：IPv4/IPv6 分别保存为有序、互不重叠的区间，区间端点存放在定长整数数组中
+#   IPv4 每个区间 8 字节（两个 uint32），IPv6 每个区间 32 字节（起止各两个 uint64）
+#   百万个零散地址约 8MB（IPv4）/ 32MB（IPv6），连续网段只占一个区间
+# 新加入的地址先放在待合并缓冲区中，超过 FLUSH_THRESHOLD 个或需要遍历时再批量排序合并
+FLUSH_THRESHOLD = 1 << 18
+U32 = 'I' if array('I').itemsize >= 4 else 'L'
+U64_MASK = (1 << 64) - 1
+
+class _WideKeys:
+    # 把 (高64位, 低64位) 交替存放的数组当作 128 位整数的有序序列，供 bisect 使用
+    def __init__(self, words):
+        self.words = words
+
+    def __len__(self):
+        return len(self.words) // 2
+
+    def __getitem__(self, index):
+        return (self.words[2 * index] << 64) | self.words[2 * index + 1]
+
+class _RangeList:
+    def __init__(self, version):
+        self.version = version
+        self.starts, self.ends = self._new_arrays()
+
+    def _new_arrays(self):
+        code = U32 if self.version == 4 else 'Q'
+        return array(code), array(code)
+
+    def _keys(self, words):
+        return words if self.version == 4 else _WideKeys(words)
+
+    def __len__(self):
+        return len(self._keys(self.starts))
+
+    def __iter__(self):
+        if self.version == 4:
+            return zip(self.starts, self.ends)
+        starts, ends = self._keys(self.starts), self._keys(self.ends)
+        return ((starts[index], ends[index]) for index in range(len(starts)))
+
+    def contains(self, value):
+        index = bisect.bisect_right(self._keys(self.starts), value) - 1
+        return index >= 0 and self._keys(self.ends)[index] >= value
+
+    def num_addresses(self):
+        return sum(end - start + 1 for start, end in self)
+
+    # 用已按起点排序的区间序列替换当前内容，重叠或相邻的区间合并为一个；逐个写入新数组，不生成中间列表
+    def rebuild(self, ranges):
+        starts, ends = self._new_arrays()
+        wide = self.version == 6
+        last = -2
+        for start, end in ranges:
+            if start <= last + 1:
+                if end > last:
+                    last = end
+                    if wide:
+                        ends[-2], ends[-1] = end >> 64, end & U64_MASK
+                    else:
+                        ends[-1] = end
+                continue
+            if wide:
+                starts.extend((start >> 64, start & U64_MASK))
+                ends.extend((end >> 64, end & U64_MASK))
+            else:
+                starts.append(start)
+                ends.append(end)
+            last = end
+        self.starts, self.ends = starts, ends
+
+    def merge(self, new):
+        new.sort()
+        self.rebuild(heapq.merge(iter(self), new))
+
+    def nbytes(self):
+        return self.starts.itemsize * len(self.starts) + self.ends.itemsize * len(self.ends)
+
+def _subtract(ranges, removed):
+    # 两个有序区间序列相减（双指针，一次遍历）
+    removed = iter(removed)
+    cut = next(removed, None)
+    for start, end in ranges:
+        while cut is not None and cut[1] < start:
+            cut = next(removed, None)
+        while cut is not None and cut[0] <= end:
+            if cut[0] > start:
+                yield start, cut[0] - 1
+            if cut[1] >= end:
+                break
+            start = cut[1] + 1
+            cut = next(removed, None)
+        else:
+            yield start, end
+
+def parse_range(text):
+    # 支持单个 IP、CIDR 网段和 "起始IP-结束IP"；返回 (版本, 起点, 终点)
+    text = text.strip()
+    if '/' in text:
+        network = ipaddress.ip_network(text, strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    if '-' in text:
+        first, last = (ipaddress.ip_address(part.strip()) for part in text.split('-', 1))
+        if first.version != last.version or last < first:
+            raise ValueError(f"区间无效: {text}")
+        return first.version, int(first), int(last)
+    address = ipaddress.ip_address(text)
+    return address.version, int(address), int(address)
+
+def ip_key(text):
+    # 规范化的 (版本, 整数) 键：同一 IPv6 地址的不同写法得到相同的键；不是 IP 时返回 None
+    text = text.strip()
+    try:
+        if ':' in text:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text.split('%', 1)[0]), 'big')
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), 'big')
+    except OSError:
+        return None
+
+class IPSet:
+    def __init__(self, items=()):
+        self._ranges = {4: _RangeList(4), 6: _RangeList(6)}
+        self._pending = {4: set(), 6: set()}
+        self._pending_ranges = {4: [], 6: []}
+        self._pending_count = 0
+        self.update(items)
+
+    @classmethod
+    def from_file(cls, path):
+        # 每行一个 IP / CIDR / 区间，# 之后的内容（注释或标签）忽略，无效行跳过
+        result = cls()
+        skipped = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = line.split('#', 1)[0].strip()
+                if not entry:
+                    continue
+                try:
+                    result.add(entry)
+                except ValueError:
+                    skipped += 1
+        result.skipped = skipped
+        return result
+
+    def add(self, item):
+        version, start, end = parse_range(item) if isinstance(item, str) else item
+        if start == end:
+            self._pending[version].add(start)
+        else:
+            self._pending_ranges[version].append((start, end))
+        self._pending_count += 1
+        if self._pending_count >= FLUSH_THRESHOLD:
+            self._flush()
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    # 加入单个地址并返回它之前是否不在集合中，用于按出现顺序去重
+    def add_new(self, version, value):
+        if self._pending_ranges[version]:
+            self._flush()
+        pending = self._pending[version]
+        if value in pending or self._ranges[version].contains(value):
+            return False
+        pending.add(value)
+        self._pending_count += 1
+        if self._pending_count >= FLUSH_THRESHOLD:
+            self._flush()
+        return True
+
+    def _flush(self):
+        if not self._pending_count:
+            return
+        for version in (4, 6):
+            new = [(value, value) for value in self._pending[version]]
+            new += self._pending_ranges[version]
+            if new:
+                self._ranges[version].merge(new)
+            self._pending[version] = set()
+            self._pending_ranges[version] = []
+        self._pending_count = 0
+
+    def __contains__(self, item):
+        key = ip_key(item) if isinstance(item, str) else item
+        if key is None:
+            return False
+        version, value = key
+        if self._pending_ranges[version]:
+            self._flush()
+        return value in self._pending[version] or self._ranges[version].contains(value)
+
+    def difference_update(self, other):
+        self._flush()
+        other._flush()
+        for version in (4, 6):
+            ranges = list(_subtract(iter(self._ranges[version]), iter(other._ranges[version])))
+            self._ranges[version].rebuild(ranges)
+
+    def __sub__(self, other):
+        result = IPSet()
+        result.update((version, start, end) for version, start, end in self.ranges())
+        result.difference_update(other)
+        return result
+
+    def ranges(self, version=None):
+        self._flush()
+        for ver in ((version,) if version else (4, 6)):
+            for start, end in self._ranges[ver]:
+                yield ver, start, end
+
+    def num_addresses(self, version=None):
+        self._flush()
+        return sum(self._ranges[ver].num_addresses() for ver in ((version,) if version else (4, 6)))
+
+    def range_count(self):
+        self._flush()
+        return len(self._ranges[4]) + len(self._ranges[6])
+
+    def nbytes(self):
+        self._flush()
+        return self._ranges[4].nbytes() + self._ranges[6].nbytes()
+
+    # 合并为最少的 CIDR 网段
+    def cidrs(self, version=None):
+        for ver, start, end in self.ranges(version):
+            cls = ipaddress.IPv4Address if ver == 4 else ipaddress.IPv6Address
+            yield from ipaddress.summarize_address_range(cls(start), cls(end))
+
+    # 展开为单个地址（注意大网段，尤其是 IPv6）
+    def addresses(self, version=None):
+        for ver, start, end in self.ranges(version):
+            cls = ipaddress.IPv4Address if ver == 4 else ipaddress.IPv6Address
+            for value in range(start, end + 1):
+                yield cls(value)
+
+    # 在全部地址中均匀随机抽取 k 个不重复的地址；只遍历一次区间，不展开
+    def sample(self, k, version=None, rng=random):
+        total = self.num_addresses(version)
+        k = min(k, total)
+        # IPv6 的总数可能超过 2^63，random.sample(range(total)) 会溢出；抽样数远小于总数时逐个取随机偏移去重
+        if k * 2 > total:
+            offsets = rng.sample(range(total), k)
+        else:
+            offsets = set()
+            while len(offsets) < k:
+                offsets.add(rng.randrange(total))
+        offsets = sorted(offsets)
+        result = []
+        index = 0
+        passed = 0
+        for ver, start, end in self.ranges(version):
+            size = end - start + 1
+            cls = ipaddress.IPv4Address if ver == 4 else ipaddress.IPv6Address
+            while index < len(offsets) and offsets[index] < passed + size:
+                result.append(cls(start + offsets[index] - passed))
+                index += 1
+            passed += size
+            if index >= len(offsets):
+                break
+        rng.shuffle(result)
+        return result
+
+def main(argv):
+    commands = ('count', 'collapse', 'expand', 'sample', 'exclude')
+    if len(argv) < 2 or argv[0] not in commands:
+        print("用法：python ipset.py count <文件>")
+        print("      python ipset.py collapse <文件>            # 合并为最少的 CIDR")
+        print("      python ipset.py expand <文件>              # 展开为单个 IP")
+        print("      python ipset.py sample <文件> <数量>        # 均匀随机抽样")
+        print("      python ipset.py exclude <文件> <排除文件>   # 去掉排除列表中的地址，输出 CIDR")
+        return 2
+    ips = IPSet.from_file(argv[1])
+    if argv[0] == 'count':
+        print(f"IPv4 {ips.num_addresses(4)} 个，IPv6 {ips.num_addresses(6)} 个，"
+              f"区间 {ips.range_count()} 个，占用 {ips.nbytes() / 1024 / 1024:.1f}MB，无效行 {ips.skipped} 个")
+    elif argv[0] == 'collapse':
+        for network in ips.cidrs():
+            print(network)
+    elif argv[0] == 'expand':
+        for address in ips.addresses():
+            print(address)
+    elif argv[0] == 'sample':
+        for address in ips.sample(int(argv[2]) if len(argv) > 2 else 100):
+            print(address)
+    elif argv[0] == 'exclude':
+        ips.difference_update(IPSet.from_file(argv[2]))
+        for network in ips.cidrs():
+            print(network)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+
+# 输出文件：一次遍历去重后的记录，同时生成 89.txt / JSON / CSV / Clash proxy-provider YAML
+# 每个文件先写临时文件再改名，保证读取方不会读到半截内容；
+# 只有语义内容（ip/标签 对的集合，不含顺序）变化时才替换文件：标签末尾带每次实测的延迟/速度，
+# 比较时去掉这部分，单纯的顺序或测速数值变化不会产生提交和推送，地区码、国家等标签变化仍会写出
+#
+# record: {"ip", "label", "colo", "carrier", "latency_ms", "speed_mb"}，域名条目可带 "addresses"
+CSV_FIELDS = ["ip", "label", "colo", "carrier", "latency_ms", "speed_mb"]
+VOLATILE_SUFFIX = re.compile(r'(?:-\s*\d+(?:\.\d+)?\s*(?:ms|MB/s|KB/s))+$', re.I)   # 例如 "-85ms"、"-30.46MB/s-85ms"
+
+def stable_label(label):
+    return VOLATILE_SUFFIX.sub('', (label or '').strip())
+
+def _pair(ip, label):
+    return ip.strip(), stable_label(label)
+
+def render_txt(records, template=None):
+    return '\n'.join(f"{r['ip']}#{r['label']}" if r['label'] else r['ip'] for r in records)
+
+def read_txt(text):
+    pairs = set()
+    for line in text.splitlines():
+        ip, _, label = line.partition('#')
+        if ip.strip():
+            pairs.add(_pair(ip, label))
+    return pairs
+
+# 域名条目额外带上解析出的地址
+def render_json(records, template=None):
+    items = []
+    for r in records:
+        item = {key: r.get(key) for key in CSV_FIELDS}
+        if r.get("addresses"):
+            item["addresses"] = r["addresses"]
+        items.append(item)
+    return json.dumps(items, ensure_ascii=False, indent=2) + '\n'
+
+def read_json(text):
+    return {_pair(r["ip"], r.get("label")) for r in json.loads(text)}
+
+def render_csv(records, template=None):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(CSV_FIELDS)
+    for r in records:
+        writer.writerow(['' if r.get(key) is None else r[key] for key in CSV_FIELDS])
+    return buf.getvalue()
+
+def read_csv(text):
+    return {_pair(row["ip"], row.get("label")) for row in csv.DictReader(io.StringIO(text))}
+
+# Clash/mihomo proxy-provider：每个 IP 生成一个节点，server 为该 IP，其余字段来自模板（如 vless/trojan 的端口、uuid、sni）
+# 每行一个 flow 风格的映射（JSON 即合法的 YAML），无需依赖 PyYAML
+# 生成的 YAML 含模板里的 uuid/password 等机密，只能在本地生成使用，不能提交到公开仓库
+def clash_proxies(records, template):
+    proxies = []
+    for r in records:
+        proxy = {"name": f"{r['label']} {r['ip']}" if r['label'] else r['ip']}
+        proxy.update(template)
+        proxy["server"] = r['ip']
+        proxies.append(proxy)
+    return proxies
+
+def render_yaml(records, template=None):
+    lines = ["proxies:"]
+    lines += [f"  - {json.dumps(proxy, ensure_ascii=False)}" for proxy in clash_proxies(records, template or {})]
+    return '\n'.join(lines) + '\n'
+
+# 节点名为 "标签 IP"，比较时同样去掉标签末尾的延迟/速度；模板字段也参与比较，改了模板会重新生成
+def _proxy_key(proxy):
+    key = dict(proxy)
+    name, server = key.get("name", ""), str(key.get("server", ""))
+    key["name"] = stable_label(name[:-len(server)] if server and name.endswith(server) else name)
+    return json.dumps(key, sort_keys=True, ensure_ascii=False)
+
+def read_yaml(text):
+    proxies = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('- {'):
+            proxies.add(_proxy_key(json.loads(line[2:])))
+    return proxies
+
+def yaml_semantics(records, template):
+    return {_proxy_key(proxy) for proxy in clash_proxies(records, template or {})}
+
+FORMATS = {
+    "txt": (render_txt, read_txt),
+    "json": (render_json, read_json),
+    "csv": (render_csv, read_csv),
+    "yaml": (render_yaml, read_yaml),
+}
+
+def _semantics(fmt, records, template):
+    if fmt == "yaml":
+        return yaml_semantics(records, template)
+    return {_pair(r['ip'], r.get('label')) for r in records}
+
+def _existing_semantics(fmt, path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return FORMATS[fmt][1](f.read())
+    except (OSError, ValueError, KeyError):
+        return None
+
+# 所有缓存和输出文件都经由这里写入：在同一目录下建唯一的临时文件，写完 fsync 后改名替换，
+# 读取方只会看到旧文件或完整的新文件，多个写入方也不会共用同一个临时文件；
+# 任何一步失败都删除临时文件后再抛出。data 为 str（按 UTF-8 写入）或 bytes
+def write_atomic(path, data):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp 建的文件只有属主可读，沿用原文件的权限，没有原文件时用 0644
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+# outputs: {格式: 路径}；返回 {路径: 是否替换}
+def write_outputs(records, outputs, template=None, force=False):
+    changed = {}
+    for fmt, path in outputs.items():
+        render, _ = FORMATS[fmt]
+        if not force and os.path.exists(path) and _existing_semantics(fmt, path) == _semantics(fmt, records, template):
+            changed[path] = False
+            continue
+        write_atomic(path, render(records, template))
+        changed[path] = True
+    return changed
@@ -0,0 +1,524 @@
+import argparse
+import asyncio
+import csv
+import hmac
+import io
+import ipaddress
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ipset
+import output_writer
+import prober
+
+# 分布式延迟探测：coordinator 把候选集合（cf_ddns/ips.py 下载的 ip.txt）切成分片，以租约形式分发；
+# worker（同机多进程或其他主机，走普通 HTTP）领取租约、用 prober 探测，并分批把结果流式回传，每次回传顺带续约。
+# 租约过期（worker 崩溃、断网）后，分片中还没有结果的 IP 重新排队分给其他 worker；
+# 全部 IP 都有结果后合并排序，写出与 CloudflareST 相同格式的 result.csv 和 89.txt
+CANDIDATE_FILE = os.path.join('CloudflareSpeedTestDDNS', 'cf_ddns', 'ip.txt')
+IPS_SCRIPT = os.path.join('CloudflareSpeedTestDDNS', 'cf_ddns', 'ips.py')
+CLUSTER_HOST = "127.0.0.1"       # 默认只监听本机；监听其他地址时必须设置 token
+CLUSTER_PORT = 8765
+CLUSTER_TOKEN = os.getenv("CLUSTER_TOKEN", "")   # 非空时 worker 必须带上相同的 X-Cluster-Token
+SHARD_SIZE = 256                 # 每个租约包含的 IP 数
+LEASE_TTL = 30.0                 # 租约有效期（秒），每次回传结果都会续约
+MAX_LEASE_ATTEMPTS = 3           # 同一批 IP 最多分发几次，超过后记为探测失败，避免让所有 worker 反复卡在同一批上
+RESULT_BATCH = 64                # worker 攒够多少条结果回传一次
+RESULT_INTERVAL = 1.0            # 或距上次回传超过多少秒
+WAIT_INTERVAL = 1.0              # 暂时没有可领取的分片时，worker 等待多久再来
+CONNECT_RETRIES = 10             # worker 连不上 coordinator 时的重试次数
+LINGER = 5.0                     # 全部完成后 coordinator 再等多久，让 worker 收到结束通知
+CSV_HEADER = ["IP 地址", "已发送", "已接收", "丢包率", "平均延迟", "下载速度 (MB/s)"]
+RESULT_DIR = os.path.join('.cache', 'probe_cluster')   # 默认输出位置，不覆盖当前目录下发布用的 89.txt / result.csv
+
+# 每个 IPv4 /24 随机取 per_block 个地址（0 为展开全部）；IPv6 网段太大，每个网段随机取 per_block 个（至少 1 个）
+def load_candidates(path, per_block=1, rng=random):
+    candidates = ipset.IPSet.from_file(path)
+    result = []
+    for version, start, end in candidates.ranges():
+        if version == 6:
+            count = min(max(per_block, 1), end - start + 1)
+            picks = set()
+            while len(picks) < count:
+                picks.add(start + rng.randrange(end - start + 1))
+            result.extend(ipaddress.IPv6Address(value) for value in sorted(picks))
+        elif per_block <= 0:
+            result.extend(ipaddress.IPv4Address(value) for value in range(start, end + 1))
+        else:
+            for block in range(start >> 8, (end >> 8) + 1):
+                low = max(start, block << 8)
+                high = min(end, (block << 8) | 0xFF)
+                picks = rng.sample(range(low, high + 1), min(per_block, high - low + 1))
+                result.extend(ipaddress.IPv4Address(value) for value in sorted(picks))
+    return list(dict.fromkeys(str(ip) for ip in result))
+
+def _measure(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+        raise ValueError(value)
+    return float(value)
+
+def _count(value):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(value)
+    return value
+
+# worker 回传的单条结果：字段齐全、类型和取值合理才接收，整理成 prober.summarize 的格式；否则返回 None
+def clean_result(result):
+    try:
+        cleaned = {
+            "ip": result["ip"],
+            "sent": _count(result["sent"]),
+            "received": _count(result["received"]),
+            "loss": _measure(result["loss"]),
+            "latency_ms": _measure(result["latency_ms"]),
+            "tls_ms": _measure(result.get("tls_ms")),
+            "jitter_ms": _measure(result.get("jitter_ms")),
+            "tls_failed": result.get("tls_failed", False),
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+    if (not isinstance(cleaned["ip"], str) or cleaned["loss"] is None or cleaned["loss"] > 1
+            or cleaned["received"] > cleaned["sent"] or not isinstance(cleaned["tls_failed"], bool)):
+        return None
+    return cleaned
+
+class LeaseTable:
+    def __init__(self, candidates, shard_size=SHARD_SIZE, lease_ttl=LEASE_TTL, max_attempts=MAX_LEASE_ATTEMPTS,
+                 samples=prober.PROBE_SAMPLES):
+        self.candidates = list(dict.fromkeys(candidates))
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self.samples = samples
+        # 待分发队列：(IP 列表, 已分发次数)
+        self.pending = deque((self.candidates[i:i + shard_size], 0)
+                             for i in range(0, len(self.candidates), shard_size))
+        self.leases = {}
+        # 每个发出过的租约包含哪些 IP：只接收租约内 IP 的结果，租约过期后迟到的结果也能核对
+        self.issued = {}
+        self.results = {}
+        self.rejected = 0
+        self.workers = {}
+        self.reassigned = 0
+        self.abandoned = 0
+        self.started = time.monotonic()
+        self.finished_at = None
+        self.done = threading.Event()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._check_done()
+
+    # 过期的租约：没有结果的 IP 放回队首，尽快由别的 worker 接手
+    def _reclaim(self, now):
+        for lease_id, lease in list(self.leases.items()):
+            if lease["expires"] > now:
+                continue
+            del self.leases[lease_id]
+            remaining = [ip for ip in lease["ips"] if ip not in self.results]
+            if not remaining:
+                continue
+            if lease["attempt"] >= self.max_attempts:
+                print(f"⚠️ {len(remaining)} 个 IP 已分发 {lease['attempt']} 次仍无结果，记为探测失败")
+                for ip in remaining:
+                    self.results[ip] = prober.summarize(ip, [], [], self.samples)
+                self.abandoned += len(remaining)
+                continue
+            print(f"♻️ 租约 {lease_id}（{lease['worker']}）已过期，{len(remaining)} 个 IP 重新分发")
+            self.pending.appendleft((remaining, lease["attempt"]))
+            self.reassigned += len(remaining)
+        self._check_done()
+
+    # results 只会收录候选中的 IP，数量相等即每个候选都有结果
+    def _check_done(self):
+        if len(self.results) == len(self.candidates) and not self.done.is_set():
+            self.finished_at = time.monotonic()
+            self.done.set()
+
+    # 返回 {"lease", "ips", "ttl"}、{"wait": 秒} 或 {"done": True}
+    def acquire(self, worker, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.workers[worker] = now
+            self._reclaim(now)
+            while self.pending:
+                ips, attempt = self.pending.popleft()
+                ips = [ip for ip in ips if ip not in self.results]
+                if not ips:
+                    continue
+                lease_id = str(next(self._ids))
+                self.leases[lease_id] = {"ips": ips, "worker": worker, "attempt": attempt + 1,
+                                         "expires": now + self.lease_ttl}
+                self.issued[lease_id] = set(ips)
+                return {"lease": lease_id, "ips": ips, "ttl": self.lease_ttl}
+            if self.done.is_set():
+                return {"done": True}
+            # 剩下的分片都在别的 worker 手里：等到最早的租约过期再来
+            soonest = min((lease["expires"] for lease in self.leases.values()), default=now)
+            return {"wait": max(min(soonest - now, WAIT_INTERVAL), 0.1)}
+
+    # 合并结果并续约；已过期被收回的租约迟到的结果照样接收（同一 IP 以先到的为准）
+    # 不属于该租约的 IP、未知的租约和格式不对的结果一律丢弃，计入 rejected
+    def report(self, lease_id, results, final=False, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            allowed = self.issued.get(lease_id, ())
+            accepted = 0
+            rejected = 0
+            for result in results:
+                result = clean_result(result) if isinstance(result, dict) else None
+                if result is None or result["ip"] not in allowed:
+                    rejected += 1
+                elif result["ip"] not in self.results:
+                    self.results[result["ip"]] = result
+                    accepted += 1
+            self.rejected += rejected
+            lease = self.leases.get(lease_id)
+            if lease is not None:
+                self.workers[lease["worker"]] = now
+                if final or all(ip in self.results for ip in lease["ips"]):
+                    del self.leases[lease_id]
+                    # 正常不会发生：worker 宣称完成但漏了 IP，放回队列而不是让整轮卡住
+                    missing = [ip for ip in lease["ips"] if ip not in self.results]
+                    if missing:
+                        self.pending.append((missing, lease["attempt"]))
+                else:
+                    lease["expires"] = now + self.lease_ttl
+            self._check_done()
+            return {"accepted": accepted, "rejected": rejected, "active": lease is not None}
+
+    def reclaim(self, now=None):
+        with self._lock:
+            self._reclaim(time.monotonic() if now is None else now)
+
+    def status(self):
+        with self._lock:
+            elapsed = (self.finished_at or time.monotonic()) - self.started
+            return {
+                "candidates": len(self.candidates),
+                "probed": len(self.results),
+                "alive": sum(1 for r in self.results.values() if r["latency_ms"] is not None),
+                "pending_shards": len(self.pending),
+                "active_leases": len(self.leases),
+                "workers": len(self.workers),
+                "reassigned": self.reassigned,
+                "abandoned": self.abandoned,
+                "rejected": self.rejected,
+                "elapsed_s": round(elapsed, 2),
+                "done": self.done.is_set(),
+            }
+
+class ClusterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # 在读取请求体之前校验，未授权的请求不读取、不解析请求体，回复后直接断开连接
+    def _authorized(self):
+        if not self.server.token:
+            return True
+        supplied = (self.headers.get('X-Cluster-Token') or '').encode('utf-8')
+        if hmac.compare_digest(supplied, self.server.token.encode('utf-8')):
+            return True
+        self.close_connection = True
+        self._reply(403, {"error": "token 不匹配"})
+        return False
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/status':
+            self._reply(404, {"error": "not found"})
+            return
+        self._reply(200, self.server.table.status())
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._reply(400, {"error": "请求体不是有效的 JSON"})
+            return
+        path = self.path.split('?', 1)[0]
+        table = self.server.table
+        if path == '/lease':
+            worker = str(payload.get("worker") or self.client_address[0])
+            reply = table.acquire(worker)
+            if "lease" in reply:
+                reply["probe"] = self.server.probe_options
+            elif reply.get("done"):
+                self.server.notified.add(worker)
+            self._reply(200, reply)
+        elif path == '/results':
+            results = payload.get("results")
+            if not isinstance(results, list):
+                self._reply(400, {"error": "results 必须是列表"})
+                return
+            self._reply(200, table.report(str(payload.get("lease")), results, bool(payload.get("final"))))
+        else:
+            self._reply(404, {"error": "not found"})
+
+class ClusterServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, table, probe_options, token=CLUSTER_TOKEN):
+        super().__init__(address, ClusterHandler)
+        self.table = table
+        self.probe_options = probe_options
+        self.token = token
+        self.notified = set()
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+# 启动 HTTP 服务并阻塞到全部 IP 都有结果；定期收回过期租约并打印进度
+# 监听非本机地址时任何人都能领取租约、回传结果，必须设置 token
+def coordinate(table, probe_options, host=CLUSTER_HOST, port=CLUSTER_PORT, token=CLUSTER_TOKEN, on_ready=None):
+    if not token and not is_loopback(host):
+        raise ValueError(f"监听 {host} 需要设置 token（--token 或环境变量 CLUSTER_TOKEN）")
+    server = ClusterServer((host, port), table, probe_options, token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🌐 coordinator 已启动 http://{host}:{server.server_address[1]}（{len(table.candidates)} 个 IP，"
+          f"{len(table.pending)} 个分片）")
+    try:
+        if on_ready:
+            on_ready(server.server_address[1])
+        last_report = time.monotonic()
+        while not table.done.wait(1.0):
+            table.reclaim()
+            if time.monotonic() - last_report >= 10:
+                status = table.status()
+                print(f"⏳ 已探测 {status['probed']}/{status['candidates']}，活跃租约 {status['active_leases']}，"
+                      f"worker {status['workers']}")
+                last_report = time.monotonic()
+        # 给还在轮询的 worker 留点时间收到结束通知（一个租约有效期内没出现过的视为已退出）
+        deadline = time.monotonic() + LINGER
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            if {w for w, seen in table.workers.items() if now - seen < table.lease_ttl} <= server.notified:
+                break
+            time.sleep(0.1)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return table.results
+
+class Coordinator:
+    def __init__(self, base_url, token=CLUSTER_TOKEN, timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def call(self, path, payload):
+        request = urllib.request.Request(f"{self.base_url}{path}", data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        if self.token:
+            request.add_header('X-Cluster-Token', self.token)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+# 探测一个租约：结果按完成顺序攒批回传，回传同时续约
+async def run_lease(coordinator, lease, concurrency=prober.PROBE_CONCURRENCY):
+    loop = asyncio.get_running_loop()
+    options = lease.get("probe") or {}
+    semaphore = asyncio.Semaphore(concurrency)
+    ssl_context = prober._make_ssl_context() if options.get("tls", True) else None
+    tasks = [asyncio.ensure_future(prober.probe_ip(
+        ip, semaphore, options.get("samples", prober.PROBE_SAMPLES), options.get("port", prober.PROBE_PORT),
+        options.get("timeout", prober.PROBE_TIMEOUT), ssl_context, options.get("sni", prober.PROBE_SNI)))
+        for ip in lease["ips"]]
+    batch = []
+    last_sent = loop.time()
+    for future in asyncio.as_completed(tasks):
+        batch.append(await future)
+        if len(batch) >= RESULT_BATCH or loop.time() - last_sent >= RESULT_INTERVAL:
+            await loop.run_in_executor(None, coordinator.call, '/results',
+                                       {"lease": lease["lease"], "results": batch, "final": False})
+            batch = []
+            last_sent = loop.time()
+    await loop.run_in_executor(None, coordinator.call, '/results',
+                               {"lease": lease["lease"], "results": batch, "final": True})
+    return len(tasks)
+
+def work(base_url, name=None, token=CLUSTER_TOKEN, concurrency=prober.PROBE_CONCURRENCY):
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    coordinator = Coordinator(base_url, token)
+    probed = 0
+    leases = 0
+    failures = 0
+    while True:
+        try:
+            reply = coordinator.call('/lease', {"worker": name})
+            failures = 0
+        except urllib.error.HTTPError as e:
+            print(f"❌ [{name}] coordinator 拒绝请求: {e.code}")
+            return 1
+        except OSError as e:
+            failures += 1
+            if failures > CONNECT_RETRIES:
+                # 之前已经领过租约的，大概率是 coordinator 完成后已退出
+                print(f"{'⚠️' if not leases else '👋'} [{name}] 无法连接 coordinator: {e}")
+                return 1 if not leases else 0
+            time.sleep(min(2 ** failures * 0.1, 5.0))
+            continue
+        if reply.get("done"):
+            print(f"✅ [{name}] 完成 {leases} 个租约，共探测 {probed} 个 IP")
+            return 0
+        if "wait" in reply:
+            time.sleep(reply["wait"])
+            continue
+        try:
+            probed += asyncio.run(run_lease(coordinator, reply, concurrency))
+        except OSError as e:
+            # 回传失败：这个租约会过期后被重新分发
+            print(f"⚠️ [{name}] 回传结果失败，放弃租约 {reply['lease']}: {e}")
+            continue
+        leases += 1
+
+def ranked(results, max_loss=1.0):
+    alive = [r for r in results.values() if r["latency_ms"] is not None and r["loss"] <= max_loss]
+    return sorted(alive, key=prober.rank_key)
+
+# 与 CloudflareST / speed_test.py 的 result.csv 列一致；只测了延迟，下载速度列写 "-"（DDNS 脚本只跳过 0.00）
+def write_result_csv(results, path):
+    buf = io.StringIO(newline='')
+    writer = csv.writer(buf)
+    writer.writerow(CSV_HEADER)
+    for r in results:
+        writer.writerow([r["ip"], r["sent"], r["received"], f"{r['loss']:.2f}", f"{r['latency_ms']:.2f}", "-"])
+    output_writer.write_atomic(path, buf.getvalue())
+
+def write_results(results, csv_path=None, txt_path=None, top=0, max_loss=1.0):
+    best = ranked(results, max_loss)
+    if top:
+        best = best[:top]
+    if csv_path:
+        write_result_csv(best, csv_path)
+        print(f"📄 {csv_path}：{len(best)} 个 IP")
+    if txt_path:
+        records = [{"ip": r["ip"], "label": f"{r['latency_ms']:.0f}ms", "latency_ms": r["latency_ms"]} for r in best]
+        changed = output_writer.write_outputs(records, {"txt": txt_path})
+        print(f"📄 {txt_path}：{len(best)} 个 IP{'' if changed[txt_path] else '（内容未变化）'}")
+    return best
+
+def probe_options(args):
+    return {"samples": args.samples, "port": args.port, "timeout": args.timeout, "tls": not args.no_tls, "sni": args.sni}
+
+def _prepare(args):
+    if args.download:
+        subprocess.run([sys.executable, IPS_SCRIPT, '--output', args.candidates], check=True)
+    candidates = load_candidates(args.candidates, args.per_block)
+    if args.limit:
+        candidates = candidates[:args.limit]
+    print(f"📥 {args.candidates}：{len(candidates)} 个候选 IP")
+    return LeaseTable(candidates, args.shard_size, args.lease_ttl, samples=args.samples)
+
+def _finish(table, args):
+    status = table.status()
+    print(f"🏁 探测完成：{status['probed']} 个 IP，存活 {status['alive']}，用时 {status['elapsed_s']:.1f}s，"
+          f"worker {status['workers']} 个，重新分发 {status['reassigned']} 个")
+    write_results(table.results, args.csv, args.txt, args.top, args.max_loss)
+    return 0
+
+def run_local(args):
+    table = _prepare(args)
+    workers = []
+
+    def spawn(port):
+        url = f"http://127.0.0.1:{port}"
+        for index in range(args.workers):
+            workers.append(subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), 'worker', url, '--name', f"local-{index + 1}",
+                 '--concurrency', str(args.concurrency)],
+                env=dict(os.environ, CLUSTER_TOKEN=args.token)))
+
+    try:
+        coordinate(table, probe_options(args), '127.0.0.1', 0, args.token, on_ready=spawn)
+    finally:
+        for process in workers:
+            try:
+                process.wait(timeout=LINGER)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return _finish(table, args)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='分布式延迟探测：coordinator 分发租约，worker 探测并回传结果')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_coordinator_args(sub):
+        sub.add_argument('candidates', nargs='?', default=CANDIDATE_FILE, help='候选 IP / CIDR 列表（ips.py 的输出）')
+        sub.add_argument('--download', action='store_true', help='先运行 ips.py 更新候选列表')
+        sub.add_argument('--per-block', type=int, default=1, help='每个 /24 取几个 IP，0 为展开全部')
+        sub.add_argument('--limit', type=int, default=0, help='只探测前 N 个候选（0 为不限）')
+        sub.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+        sub.add_argument('--lease-ttl', type=float, default=LEASE_TTL)
+        sub.add_argument('--samples', type=int, default=prober.PROBE_SAMPLES)
+        sub.add_argument('--timeout', type=float, default=prober.PROBE_TIMEOUT)
+        sub.add_argument('--port', type=int, default=prober.PROBE_PORT)
+        sub.add_argument('--sni', default=prober.PROBE_SNI)
+        sub.add_argument('--no-tls', action='store_true', help='只测 TCP 连接')
+        sub.add_argument('--csv', default=os.path.join(RESULT_DIR, 'result.csv'),
+                         help='CloudflareST 格式的结果（空字符串为不写）')
+        sub.add_argument('--txt', default=os.path.join(RESULT_DIR, '89.txt'), help='IP#延迟 列表（空字符串为不写）')
+        sub.add_argument('--top', type=int, default=0, help='只输出前 N 个（0 为全部存活 IP）')
+        sub.add_argument('--max-loss', type=float, default=1.0, help='丢包率上限，超过的不输出')
+        sub.add_argument('--token', default=CLUSTER_TOKEN)
+
+    coordinator_parser = commands.add_parser('coordinator', help='分发租约并合并结果')
+    add_coordinator_args(coordinator_parser)
+    coordinator_parser.add_argument('--host', default=CLUSTER_HOST)
+    coordinator_parser.add_argument('--listen-port', type=int, default=CLUSTER_PORT)
+
+    worker_parser = commands.add_parser('worker', help='领取租约并探测')
+    worker_parser.add_argument('url', help='coordinator 地址，如 http://10.0.0.1:8765')
+    worker_parser.add_argument('--name', help='worker 名称（默认 主机名-进程号）')
+    worker_parser.add_argument('--concurrency', type=int, default=prober.PROBE_CONCURRENCY)
+    worker_parser.add_argument('--token', default=CLUSTER_TOKEN)
+
+    local_parser = commands.add_parser('local', help='本机启动 coordinator 和多个 worker 进程')
+    add_coordinator_args(local_parser)
+    local_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    local_parser.add_argument('--concurrency', type=int, default=prober.PROBE_CONCURRENCY, help='每个 worker 的并发连接数')
+
+    args = parser.parse_args(argv)
+    if args.command == 'worker':
+        return work(args.url, args.name, args.token, args.concurrency)
+    if args.command == 'local':
+        return run_local(args)
+    if not args.token and not is_loopback(args.host):
+        print(f"❌ 监听 {args.host} 需要设置 token（--token 或环境变量 CLUSTER_TOKEN）")
+        return 2
+    table = _prepare(args)
+    coordinate(table, probe_options(args), args.host, args.listen_port, args.token)
+    return _finish(table, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
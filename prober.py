@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import ssl
+import statistics
+import sys
+
+# 本地 TCP/TLS 延迟探测：对每个候选 IP 多次建立 TCP 连接并完成 TLS 握手，
+# 用信号量限制同时进行的连接数，统计延迟中位数、抖动和丢包率
+PROBE_PORT = 443
+PROBE_SNI = "www.cloudflare.com"
+PROBE_SAMPLES = 3
+PROBE_TIMEOUT = 2.0              # 单次连接/握手超时（秒）
+PROBE_CONCURRENCY = 256          # 同时进行的连接数上限
+PROBE_INTERVAL = 0.05            # 同一 IP 两次采样之间的间隔（秒）
+
+def _make_ssl_context():
+    # 只测握手耗时，不校验证书（CloudFront 等节点的证书与 SNI 不一定匹配）
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+async def probe_once(ip, port=PROBE_PORT, timeout=PROBE_TIMEOUT, ssl_context=None, sni=PROBE_SNI):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    tcp_ms = (loop.time() - start) * 1000
+    tls_ms = None
+    transport = writer.transport
+    try:
+        if ssl_context is not None:
+            tls_start = loop.time()
+            try:
+                transport = await asyncio.wait_for(
+                    loop.start_tls(transport, transport.get_protocol(), ssl_context, server_hostname=sni), timeout)
+                tls_ms = (loop.time() - tls_start) * 1000
+            except (ssl.SSLError, ConnectionError, asyncio.TimeoutError):
+                tls_ms = None
+    finally:
+        if transport is not None:
+            transport.close()
+    return tcp_ms, tls_ms
+
+def summarize(ip, tcp_samples, tls_samples, attempts, tls_attempted=False):
+    received = len(tcp_samples)
+    result = {
+        "ip": ip,
+        "sent": attempts,
+        "received": received,
+        "loss": round(1 - received / attempts, 4) if attempts else 1.0,
+        "latency_ms": None,
+        "tls_ms": None,
+        "jitter_ms": None,
+        "tls_failed": bool(tls_attempted and received and not tls_samples),
+    }
+    if tcp_samples:
+        result["latency_ms"] = round(statistics.median(tcp_samples), 2)
+        result["jitter_ms"] = round(statistics.pstdev(tcp_samples), 2) if len(tcp_samples) > 1 else 0.0
+    if tls_samples:
+        result["tls_ms"] = round(statistics.median(tls_samples), 2)
+    return result
+
+async def probe_ip(ip, semaphore, samples=PROBE_SAMPLES, port=PROBE_PORT, timeout=PROBE_TIMEOUT,
+                   ssl_context=None, sni=PROBE_SNI, interval=PROBE_INTERVAL):
+    tcp_samples = []
+    tls_samples = []
+    for attempt in range(samples):
+        if attempt:
+            await asyncio.sleep(interval)
+        async with semaphore:
+            try:
+                tcp_ms, tls_ms = await probe_once(ip, port, timeout, ssl_context, sni)
+            except (OSError, asyncio.TimeoutError):
+                continue
+        tcp_samples.append(tcp_ms)
+        if tls_ms is not None:
+            tls_samples.append(tls_ms)
+    return summarize(ip, tcp_samples, tls_samples, samples, ssl_context is not None)
+
+async def probe_all(ips, samples=PROBE_SAMPLES, concurrency=PROBE_CONCURRENCY, port=PROBE_PORT,
+                    timeout=PROBE_TIMEOUT, tls=True, sni=PROBE_SNI):
+    semaphore = asyncio.Semaphore(concurrency)
+    ssl_context = _make_ssl_context() if tls else None
+    unique = list(dict.fromkeys(ips))
+    results = await asyncio.gather(*(
+        probe_ip(ip, semaphore, samples, port, timeout, ssl_context, sni) for ip in unique))
+    return {result["ip"]: result for result in results}
+
+def probe(ips, **kwargs):
+    return asyncio.run(probe_all(ips, **kwargs))
+
+# 排序：先按丢包率，TLS 握手全部失败的靠后，再按延迟中位数和抖动；全部失败的排在最后
+def rank_key(result):
+    if not result or result["latency_ms"] is None:
+        return (1.0, True, float('inf'), float('inf'))
+    return (result["loss"], result["tls_failed"], result["latency_ms"], result["jitter_ms"] or 0.0)
+
+def read_candidates(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.split('#')[0].strip() for line in f if line.strip() and not line.startswith('#')]
+
+def main():
+    parser = argparse.ArgumentParser(description='并发 TCP/TLS 延迟探测')
+    parser.add_argument('file', help='候选列表文件（每行一个 IP，可带 #备注）')
+    parser.add_argument('--samples', type=int, default=PROBE_SAMPLES)
+    parser.add_argument('--concurrency', type=int, default=PROBE_CONCURRENCY)
+    parser.add_argument('--timeout', type=float, default=PROBE_TIMEOUT)
+    parser.add_argument('--port', type=int, default=PROBE_PORT)
+    parser.add_argument('--sni', default=PROBE_SNI)
+    parser.add_argument('--no-tls', action='store_true', help='只测 TCP 连接')
+    args = parser.parse_args()
+    results = probe(read_candidates(args.file), samples=args.samples, concurrency=args.concurrency,
+                    port=args.port, timeout=args.timeout, tls=not args.no_tls, sni=args.sni)
+    for result in sorted(results.values(), key=rank_key):
+        latency = f"{result['latency_ms']:.1f}ms" if result["latency_ms"] is not None else "超时"
+        tls_ms = f"{result['tls_ms']:.1f}ms" if result["tls_ms"] is not None else "-"
+        print(f"{result['ip']}\t延迟 {latency}\tTLS {tls_ms}\t丢包 {result['loss']:.0%}\t抖动 {result['jitter_ms'] or 0:.1f}ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
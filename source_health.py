@@ -0,0 +1,91 @@
+import json
+import statistics
+import time
+
+import output_writer
+
+# 跨运行的来源健康状态：最近若干次的成功与否和耗时、连续失败次数、熔断状态
+# 熔断器：连续失败 FAILURE_THRESHOLD 次后打开（open），冷却期内直接跳过该来源；
+# 冷却期过后进入试探（half_open），只用很短的预算请求一次，成功则恢复（closed），失败则重新打开
+HISTORY_SIZE = 20                # 每个来源保留的最近记录数
+FAILURE_THRESHOLD = 3            # 连续失败多少次后熔断
+COOLDOWN = 16 * 3600             # 熔断后跳过多久再试探（秒），约两次定时运行
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_NAMES = {CLOSED: "正常", OPEN: "熔断中", HALF_OPEN: "试探中"}
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+class SourceHealth:
+    def __init__(self, path, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, history_size=HISTORY_SIZE):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.history_size = history_size
+        self.sources = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        output_writer.write_atomic(self.path, json.dumps(self.sources, ensure_ascii=False, separators=(',', ':')))
+
+    def _entry(self, key):
+        return self.sources.setdefault(key, {"samples": [], "consecutive_failures": 0, "opened_at": None})
+
+    def state(self, key, now=None):
+        entry = self.sources.get(key)
+        if not entry or entry.get("opened_at") is None:
+            return CLOSED
+        now = now if now is not None else time.time()
+        return OPEN if now - entry["opened_at"] < self.cooldown else HALF_OPEN
+
+    def record(self, key, ok, latency_ms, now=None):
+        now = now if now is not None else time.time()
+        entry = self._entry(key)
+        entry["samples"] = (entry["samples"] + [[round(now), bool(ok), round(latency_ms, 1)]])[-self.history_size:]
+        if ok:
+            entry["consecutive_failures"] = 0
+            entry["opened_at"] = None
+            return
+        entry["consecutive_failures"] += 1
+        # 试探失败或连续失败达到阈值：（重新）打开熔断器，冷却期从现在算起
+        if entry["opened_at"] is not None or entry["consecutive_failures"] >= self.failure_threshold:
+            entry["opened_at"] = now
+
+    # 耗时统计只用成功的记录，失败（多为超时）单独体现在成功率里
+    def stats(self, key, now=None):
+        entry = self.sources.get(key) or {"samples": [], "consecutive_failures": 0}
+        samples = entry["samples"]
+        latencies = sorted(latency for _, ok, latency in samples if ok)
+        return {
+            "runs": len(samples),
+            "success_rate": sum(1 for _, ok, _ in samples if ok) / len(samples) if samples else None,
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "consecutive_failures": entry["consecutive_failures"],
+            "state": self.state(key, now),
+        }
+
+    # 调度顺序：健康但较慢的来源优先开始，其次是没有记录的，试探中的排在最后
+    def schedule(self, keys, now=None):
+        def order(key):
+            stats = self.stats(key, now)
+            if stats["state"] != CLOSED:
+                return (2, 0.0)
+            if stats["p50_ms"] is None:
+                return (1, 0.0)
+            return (0, -stats["p50_ms"])
+        return sorted(keys, key=order)
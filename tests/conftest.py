@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 顶层模块与 cf_ddns 下的独立脚本都按脚本方式导入（cf_ddns 脚本之间用同目录导入）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'CloudflareSpeedTestDDNS', 'cf_ddns')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
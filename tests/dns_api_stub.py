@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 本地 DNS 提供商 API 替身：Cloudflare（REST，page/per_page 分页）和 DNSPod（表单 POST，offset/length 分页）
+# 记录保存在内存中，每个请求连同时间戳记在 requests 里，可用 throttle_once 让下一个请求返回一次 429
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.next_id = 1
+        threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def new_id(self):
+        self.next_id += 1
+        return str(self.next_id)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+class CloudflareStub(_StubServer):
+    # zones: {根域名: 区域 ID}；records: {区域 ID: [{"id", "name", "type", "content"}]}
+    def __init__(self, zones, records=None):
+        self.zones = dict(zones)
+        self.records = {zone_id: [] for zone_id in self.zones.values()}
+        self.throttle_once = False
+        super().__init__(CloudflareHandler)
+        for zone_id, items in (records or {}).items():
+            for item in items:
+                self.records[zone_id].append(dict(item, id=self.new_id()))
+
+    def contents(self, zone_id, name=None):
+        return sorted((r['name'], r['type'], r['content']) for r in self.records[zone_id] if name in (None, r['name']))
+
+    def calls(self, method=None, prefix=''):
+        return [(m, path) for m, path, _ in self.requests if (method in (None, m)) and path.startswith(prefix)]
+
+class CloudflareHandler(_Handler):
+    def _handle(self, method):
+        stub = self.server
+        parsed = urlparse(self.path)
+        path = parsed.path
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        body = json.loads(self._body() or b'{}')
+        with stub.lock:
+            stub.requests.append((method, path, time.monotonic()))
+            if stub.throttle_once:
+                stub.throttle_once = False
+                return self._send(429, {'success': False, 'errors': [{'message': 'rate limited'}]}, {'Retry-After': '0.1'})
+            parts = path.strip('/').split('/')
+            if method == 'GET' and parts == ['zones']:
+                zone_id = stub.zones.get(query.get('name'))
+                return self._send(200, {'success': True, 'result': [{'id': zone_id}] if zone_id else []})
+            if len(parts) >= 3 and parts[0] == 'zones' and parts[2] == 'dns_records' and parts[1] in stub.records:
+                records = stub.records[parts[1]]
+                if method == 'GET':
+                    per_page = int(query.get('per_page', 100))
+                    page = int(query.get('page', 1))
+                    total_pages = max(1, -(-len(records) // per_page))
+                    result = records[(page - 1) * per_page:page * per_page]
+                    return self._send(200, {'success': True, 'result': result,
+                                            'result_info': {'page': page, 'total_pages': total_pages}})
+                if method == 'POST':
+                    record = {'id': stub.new_id(), 'name': body['name'], 'type': body['type'], 'content': body['content']}
+                    records.append(record)
+                    return self._send(200, {'success': True, 'result': record})
+                for record in records:
+                    if len(parts) == 4 and record['id'] == parts[3]:
+                        if method == 'PATCH':
+                            record['content'] = body['content']
+                        elif method == 'DELETE':
+                            records.remove(record)
+                        return self._send(200, {'success': True, 'result': record})
+        return self._send(404, {'success': False, 'errors': [{'message': 'not found'}]})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+class DnspodStub(_StubServer):
+    # records: {根域名: [{"name"(子域名或 @), "type", "value", "line"}]}
+    def __init__(self, records=None):
+        self.records = {}
+        super().__init__(DnspodHandler)
+        for zone, items in (records or {}).items():
+            self.records[zone] = [dict(item, id=self.new_id()) for item in items]
+
+class DnspodHandler(_Handler):
+    def do_POST(self):
+        stub = self.server
+        action = urlparse(self.path).path.strip('/')
+        params = {key: values[0] for key, values in parse_qs(self._body().decode()).items()}
+        with stub.lock:
+            stub.requests.append((action, params, time.monotonic()))
+            records = stub.records.setdefault(params.get('domain'), [])
+            if action == 'Record.List':
+                if not records:
+                    return self._send(200, {'status': {'code': '10', 'message': 'No records'}})
+                offset = int(params.get('offset', 0))
+                length = int(params.get('length', 100))
+                return self._send(200, {'status': {'code': '1'}, 'info': {'records_num': str(len(records))},
+                                        'records': records[offset:offset + length]})
+            if action == 'Record.Create':
+                records.append({'id': stub.new_id(), 'name': params['sub_domain'], 'type': params['record_type'],
+                                'value': params['value'], 'line': params['record_line']})
+                return self._send(200, {'status': {'code': '1'}})
+            for record in records:
+                if record['id'] == params.get('record_id'):
+                    if action == 'Record.Modify':
+                        record['value'] = params['value']
+                    elif action == 'Record.Remove':
+                        records.remove(record)
+                    return self._send(200, {'status': {'code': '1'}})
+        return self._send(200, {'status': {'code': '8', 'message': 'Record id invalid'}})
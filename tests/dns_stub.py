@@ -0,0 +1,126 @@
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+# 本地 DNS 桩服务：同一端口同时监听 UDP 和 TCP
+#   records:  {(域名, 类型): ([地址...], TTL)}
+#   nxdomain: 返回 NXDOMAIN（带 SOA，minimum 为 negative_ttl）的域名
+#   servfail: 返回 SERVFAIL 的域名；drop: 不回应的域名
+#   truncate: UDP 只回带 TC 标志的空应答，须改用 TCP 才能拿到记录
+#   delay:    {域名: 秒}，回应前等待
+# queries 记录每个 (传输方式, 域名, 类型)
+TYPE_A = 1
+TYPE_SOA = 6
+TYPE_AAAA = 28
+
+def _encode_name(name):
+    return b''.join(bytes([len(label)]) + label.encode() for label in name.split('.')) + b'\0'
+
+def _parse_question(data):
+    offset = 12
+    labels = []
+    while data[offset]:
+        length = data[offset]
+        labels.append(data[offset + 1:offset + 1 + length].decode())
+        offset += length + 1
+    qtype = struct.unpack('!H', data[offset + 1:offset + 3])[0]
+    return '.'.join(labels).lower(), qtype, data[12:offset + 5]
+
+class DNSStub:
+    def __init__(self, negative_ttl=120):
+        self.records = {}
+        self.nxdomain = set()
+        self.servfail = set()
+        self.drop = set()
+        self.truncate = set()
+        self.delay = {}
+        self.negative_ttl = negative_ttl
+        self.queries = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class UDPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                reply = stub.answer(data, 'udp')
+                if reply:
+                    sock.sendto(reply, self.client_address)
+
+        class TCPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                header = self.request.recv(2)
+                if len(header) < 2:
+                    return
+                length = struct.unpack('!H', header)[0]
+                data = b''
+                while len(data) < length:
+                    chunk = self.request.recv(length - len(data))
+                    if not chunk:
+                        return
+                    data += chunk
+                reply = stub.answer(data, 'tcp')
+                if reply:
+                    self.request.sendall(struct.pack('!H', len(reply)) + reply)
+
+        # UDP 随机端口对应的 TCP 端口可能已被占用，换一个端口重试
+        for _ in range(20):
+            self.udp = socketserver.ThreadingUDPServer(('127.0.0.1', 0), UDPHandler)
+            try:
+                self.tcp = socketserver.ThreadingTCPServer(('127.0.0.1', self.udp.server_address[1]), TCPHandler)
+                break
+            except OSError:
+                self.udp.server_close()
+        else:
+            raise OSError("找不到 UDP 和 TCP 都空闲的端口")
+        for server in (self.udp, self.tcp):
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    @property
+    def server(self):
+        return f"127.0.0.1:{self.udp.server_address[1]}"
+
+    def count(self, name=None, transport=None):
+        return sum(1 for t, n, _ in self.queries if name in (None, n) and transport in (None, t))
+
+    def answer(self, data, transport):
+        query_id = struct.unpack('!H', data[:2])[0]
+        name, qtype, question = _parse_question(data)
+        with self.lock:
+            self.queries.append((transport, name, qtype))
+        if name in self.delay:
+            time.sleep(self.delay[name])
+        if name in self.drop:
+            return None
+        flags = 0x8180
+        answers = []
+        authority = []
+        if name in self.servfail:
+            flags |= 2
+        elif name in self.nxdomain:
+            flags |= 3
+            authority.append(self._soa(name))
+        elif transport == 'udp' and name in self.truncate:
+            flags |= 0x0200
+        else:
+            addresses, ttl = self.records.get((name, qtype), ([], 0))
+            family, rtype = (socket.AF_INET, TYPE_A) if qtype == TYPE_A else (socket.AF_INET6, TYPE_AAAA)
+            for address in addresses:
+                rdata = socket.inet_pton(family, address)
+                answers.append(b'\xc0\x0c' + struct.pack('!HHIH', rtype, 1, ttl, len(rdata)) + rdata)
+            if not addresses:
+                authority.append(self._soa(name))
+        header = struct.pack('!HHHHHH', query_id, flags, 1, len(answers), len(authority), 0)
+        return header + question + b''.join(answers) + b''.join(authority)
+
+    def _soa(self, name):
+        zone = '.'.join(name.split('.')[-2:])
+        rdata = _encode_name(f"ns.{zone}") + _encode_name(f"admin.{zone}") + struct.pack('!IIIII', 1, 3600, 600, 86400, self.negative_ttl)
+        return _encode_name(zone) + struct.pack('!HHIH', TYPE_SOA, 1, 3600, len(rdata)) + rdata
+
+    def close(self):
+        for server in (self.udp, self.tcp):
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import socket
+import ssl
+import struct
+import threading
+
+# socks / proxy 检测用的本地替身：每个服务在自己的线程里跑一个 asyncio 事件循环，
+# 检测代码可以在另一个事件循环（或 asyncio.run）中连接它们
+CERT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'localhost.pem')
+
+class _LoopServer:
+    def __init__(self, ssl_context=None):
+        self.connections = 0
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def start():
+            self.server = await asyncio.start_server(self._accept, '127.0.0.1', 0, ssl=ssl_context)
+            started.set()
+
+        self.thread = threading.Thread(target=self._run, args=(start,), daemon=True)
+        self.thread.start()
+        started.wait(5)
+
+    def _run(self, start):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(start())
+        self.loop.run_forever()
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _accept(self, reader, writer):
+        self.connections += 1
+        try:
+            await self.handle(reader, writer)
+        except (OSError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, reader, writer):
+        raise NotImplementedError
+
+    def close(self):
+        async def stop():
+            self.server.close()
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+# SOCKS5 服务（RFC 1928 / 1929）：users 为空时不需要认证，否则只接受用户名密码认证；
+# reject_connect 时 CONNECT 返回 REP=2（规则不允许）；delay 为每次应答前的等待（秒）
+class Socks5Stub(_LoopServer):
+    def __init__(self, users=None, reject_connect=False, delay=0.0):
+        self.users = users or {}
+        self.reject_connect = reject_connect
+        self.delay = delay
+        self.targets = []
+        super().__init__()
+
+    async def _reply(self, writer, data):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        writer.write(data)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        version, count = await reader.readexactly(2)
+        methods = await reader.readexactly(count)
+        wanted = 0x02 if self.users else 0x00
+        if version != 5 or wanted not in methods:
+            await self._reply(writer, b'\x05\xff')
+            return
+        await self._reply(writer, bytes([5, wanted]))
+        if self.users:
+            _, length = await reader.readexactly(2)
+            username = (await reader.readexactly(length)).decode()
+            length = (await reader.readexactly(1))[0]
+            password = (await reader.readexactly(length)).decode()
+            ok = self.users.get(username) == password
+            await self._reply(writer, bytes([1, 0 if ok else 1]))
+            if not ok:
+                return
+        _, command, _, atyp = await reader.readexactly(4)
+        if atyp == 3:
+            host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+        else:
+            host = socket.inet_ntop(socket.AF_INET if atyp == 1 else socket.AF_INET6,
+                                    await reader.readexactly(4 if atyp == 1 else 16))
+        port = struct.unpack('!H', await reader.readexactly(2))[0]
+        self.targets.append((host, port))
+        rep = 2 if self.reject_connect or command != 1 else 0
+        await self._reply(writer, bytes([5, rep, 0, 1]) + socket.inet_aton('0.0.0.0') + struct.pack('!H', 0))
+
+# 只接受 TCP 连接、立即关闭的监听端口（TLS 握手会失败）
+class TCPStub(_LoopServer):
+    async def handle(self, reader, writer):
+        pass
+
+# 使用自签名证书完成 TLS 握手的监听端口
+class TLSStub(_LoopServer):
+    def __init__(self):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(CERT_FILE)
+        super().__init__(context)
+
+    async def handle(self, reader, writer):
+        await reader.read(1)
+
+# 一个当前没有监听的本地端口
+def closed_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地 Git Data API 替身：对象存在内存里，树按目录嵌套，支持 ref/commit/tree/blob 的读写、
+# 递归树截断（truncate_recursive）和在下一次更新引用前插入一次外部推送（race_once）
+
+def _sha(kind, payload):
+    return hashlib.sha1(kind.encode() + b'\0' + json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def git_blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+class GitDataStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, files=None, branch='main'):
+        super().__init__(('127.0.0.1', 0), GitDataHandler)
+        self.lock = threading.Lock()
+        self.branch = branch
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.requests = []
+        self.truncate_recursive = False
+        self.race_once = False
+        tree = self.build_tree(files or {})
+        self.refs = {branch: self.add_commit('init', tree, [])}
+        threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def add_blob(self, data):
+        sha = git_blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def add_tree(self, entries):
+        sha = _sha('tree', entries)
+        self.trees[sha] = entries
+        return sha
+
+    def add_commit(self, message, tree, parents):
+        sha = _sha('commit', {'message': message, 'tree': tree, 'parents': parents, 'n': len(self.commits)})
+        self.commits[sha] = {'message': message, 'tree': tree, 'parents': parents}
+        return sha
+
+    # files: {路径: bytes}；base 为基础树 SHA，路径映射到 None 表示删除
+    def build_tree(self, files, base=None):
+        flat = self.flatten(base) if base else {}
+        for path, data in files.items():
+            flat[path] = self.add_blob(data) if isinstance(data, bytes) else data
+        return self._nest({path: sha for path, sha in flat.items() if sha})
+
+    def _nest(self, flat):
+        entries = {}
+        subdirs = {}
+        for path, sha in flat.items():
+            head, _, rest = path.partition('/')
+            if rest:
+                subdirs.setdefault(head, {})[rest] = sha
+            else:
+                entries[head] = {'type': 'blob', 'sha': sha}
+        for name, sub in subdirs.items():
+            entries[name] = {'type': 'tree', 'sha': self._nest(sub)}
+        return self.add_tree(entries)
+
+    def flatten(self, tree_sha, prefix=''):
+        flat = {}
+        for name, item in self.trees[tree_sha].items():
+            if item['type'] == 'tree':
+                flat.update(self.flatten(item['sha'], f"{prefix}{name}/"))
+            else:
+                flat[f"{prefix}{name}"] = item['sha']
+        return flat
+
+    def listing(self, tree_sha, recursive, prefix=''):
+        items = []
+        for name, item in sorted(self.trees[tree_sha].items()):
+            items.append({'path': f"{prefix}{name}", 'type': item['type'], 'sha': item['sha'], 'mode': '100644'})
+            if recursive and item['type'] == 'tree':
+                items += self.listing(item['sha'], True, f"{prefix}{name}/")
+        return items
+
+    def head_files(self):
+        head = self.refs[self.branch]
+        return {path: self.blobs[sha] for path, sha in self.flatten(self.commits[head]['tree']).items()}
+
+    # 模拟另一个客户端推进分支
+    def push_external(self, path, data):
+        head = self.refs[self.branch]
+        tree = self.build_tree({path: data}, self.commits[head]['tree'])
+        self.refs[self.branch] = self.add_commit('external', tree, [head])
+
+class GitDataHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+    def _handle(self, method):
+        stub = self.server
+        path, _, query = self.path.partition('?')
+        match = re.match(r'^/repos/[^/]+/[^/]+(.*)$', path)
+        if not match:
+            return self._send(404, {'message': 'Not Found'})
+        route = match.group(1)
+        with stub.lock:
+            stub.requests.append((method, route))
+            if method == 'GET' and route == '':
+                return self._send(200, {'default_branch': stub.branch})
+            if method == 'GET' and route.startswith('/git/ref/heads/'):
+                branch = route[len('/git/ref/heads/'):]
+                return self._send(200, {'object': {'sha': stub.refs[branch]}})
+            if method == 'GET' and route.startswith('/git/commits/'):
+                commit = stub.commits[route[len('/git/commits/'):]]
+                return self._send(200, {'tree': {'sha': commit['tree']}, 'parents': [{'sha': p} for p in commit['parents']]})
+            if method == 'GET' and route.startswith('/git/trees/'):
+                recursive = 'recursive=1' in query
+                items = stub.listing(route[len('/git/trees/'):], recursive)
+                truncated = recursive and stub.truncate_recursive
+                # 截断时只返回顶层条目，子目录内容需要客户端逐级读取
+                if truncated:
+                    items = [item for item in items if '/' not in item['path']]
+                return self._send(200, {'tree': items, 'truncated': truncated})
+            if method == 'POST' and route == '/git/blobs':
+                body = self._body()
+                return self._send(201, {'sha': stub.add_blob(base64.b64decode(body['content']))})
+            if method == 'POST' and route == '/git/trees':
+                body = self._body()
+                files = {item['path']: item['content'].encode() if 'content' in item else item['sha'] for item in body['tree']}
+                return self._send(201, {'sha': stub.build_tree(files, body.get('base_tree'))})
+            if method == 'POST' and route == '/git/commits':
+                body = self._body()
+                return self._send(201, {'sha': stub.add_commit(body['message'], body['tree'], body['parents'])})
+            if method == 'PATCH' and route.startswith('/git/refs/heads/'):
+                branch = route[len('/git/refs/heads/'):]
+                body = self._body()
+                if stub.race_once:
+                    stub.race_once = False
+                    stub.push_external('external.txt', b'pushed meanwhile\n')
+                if not body.get('force') and stub.refs[branch] not in stub.commits[body['sha']]['parents']:
+                    return self._send(422, {'message': 'Update is not a fast forward'})
+                stub.refs[branch] = body['sha']
+                return self._send(200, {'object': {'sha': body['sha']}})
+        return self._send(404, {'message': 'Not Found'})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
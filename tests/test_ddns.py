@@ -0,0 +1,183 @@
+import threading
+import time
+
+import pytest
+
+import ddns
+from dns_api_stub import CloudflareStub, DnspodStub
+
+ZONE = 'example.com'
+ZONE_ID = 'zone-1'
+
+def rec(name, content, record_id=None):
+    return {'id': record_id or content, 'name': name, 'type': ddns.record_type(content), 'content': content}
+
+@pytest.fixture
+def cloudflare():
+    stub = CloudflareStub({ZONE: ZONE_ID})
+    yield stub
+    stub.stop()
+
+def provider(stub, **kwargs):
+    return ddns.CloudflareProvider(api_token='token', api_base=stub.url, **kwargs)
+
+# ==================== plan_changes ====================
+
+def test_plan_creates_missing_records():
+    assert ddns.plan_changes('a.example.com', [], ['1.1.1.1', '2606:4700::1']) == [
+        ('create', 'a.example.com', None, '1.1.1.1'),
+        ('create', 'a.example.com', None, '2606:4700::1'),
+    ]
+
+def test_plan_updates_stale_records_before_deleting():
+    old = [rec('a.example.com', '9.9.9.9'), rec('a.example.com', '8.8.8.8'), rec('a.example.com', '1.1.1.1')]
+    ops = ddns.plan_changes('a.example.com', old, ['1.1.1.1', '2.2.2.2'])
+    assert ops == [('update', 'a.example.com', old[0], '2.2.2.2'), ('delete', 'a.example.com', old[1], None)]
+
+def test_plan_is_noop_when_records_match():
+    old = [rec('A.example.com', '1.1.1.1'), rec('a.example.com', '2606:4700::1'), rec('b.example.com', '3.3.3.3')]
+    assert ddns.plan_changes('a.example.com', old, ['2606:4700::1', '1.1.1.1', '1.1.1.1']) == []
+
+def test_plan_removes_duplicate_records():
+    old = [rec('a.example.com', '1.1.1.1', 'x'), rec('a.example.com', '1.1.1.1', 'y')]
+    assert ddns.plan_changes('a.example.com', old, ['1.1.1.1']) == [('delete', 'a.example.com', old[1], None)]
+
+def test_plan_keeps_record_types_apart():
+    old = [rec('a.example.com', '2606:4700::1')]
+    ops = ddns.plan_changes('a.example.com', old, ['1.1.1.1'])
+    assert ops == [('create', 'a.example.com', None, '1.1.1.1'), ('delete', 'a.example.com', old[0], None)]
+
+# ==================== 对接模拟 API ====================
+
+def test_sync_applies_minimal_changes(cloudflare):
+    cloudflare.records[ZONE_ID] += [rec('a.example.com', '1.1.1.1', 'r1'), rec('a.example.com', '9.9.9.9', 'r2'),
+                                    rec('b.example.com', '5.5.5.5', 'r3'), rec('b.example.com', '6.6.6.6', 'r4')]
+    results = ddns.sync(provider(cloudflare), {'a.example.com': ['1.1.1.1', '2.2.2.2'], 'b.example.com': ['5.5.5.5']})
+    assert all(ok for ok, _ in results)
+    assert cloudflare.contents(ZONE_ID) == [('a.example.com', 'A', '1.1.1.1'), ('a.example.com', 'A', '2.2.2.2'),
+                                            ('b.example.com', 'A', '5.5.5.5')]
+    assert cloudflare.calls('PATCH') == [('PATCH', f'/zones/{ZONE_ID}/dns_records/r2')]
+    assert cloudflare.calls('DELETE') == [('DELETE', f'/zones/{ZONE_ID}/dns_records/r4')]
+    assert cloudflare.calls('POST') == []
+    # 两个域名在同一区域，只列出一次记录
+    assert len(cloudflare.calls('GET', f'/zones/{ZONE_ID}/dns_records')) == 1
+
+def test_sync_without_changes_makes_no_writes(cloudflare):
+    cloudflare.records[ZONE_ID].append(rec('a.example.com', '1.1.1.1'))
+    results = ddns.sync(provider(cloudflare), {'a.example.com': ['1.1.1.1']})
+    assert results == [(True, 'a.example.com记录无需更新')]
+    # 区域查询（a.example.com、example.com）加一次列出记录，没有写入
+    assert [method for method, _ in cloudflare.calls()] == ['GET', 'GET', 'GET']
+
+def test_cloudflare_pagination(cloudflare, monkeypatch):
+    monkeypatch.setattr(ddns, 'CLOUDFLARE_PAGE_SIZE', 2)
+    cloudflare.records[ZONE_ID] += [rec(f'h{i}.example.com', f'10.0.0.{i}') for i in range(5)]
+    cloudflare.records[ZONE_ID].append({'id': 'cname', 'name': 'c.example.com', 'type': 'CNAME', 'content': 'x'})
+    records = provider(cloudflare).list_records(ZONE_ID)
+    assert sorted(r['content'] for r in records) == [f'10.0.0.{i}' for i in range(5)]
+    assert len(cloudflare.calls('GET', f'/zones/{ZONE_ID}/dns_records')) == 3
+
+def test_dnspod_pagination(monkeypatch):
+    monkeypatch.setattr(ddns, 'DNSPOD_PAGE_SIZE', 3)
+    stub = DnspodStub({ZONE: [{'name': f'h{i}', 'type': 'A', 'value': f'10.0.0.{i}', 'line': '默认'} for i in range(7)]
+                             + [{'name': '@', 'type': 'A', 'value': '10.0.1.1', 'line': '电信'}]})
+    try:
+        dnspod = ddns.DnspodProvider('token', api_base=stub.url)
+        records = dnspod.list_records(ZONE)
+        assert sorted(r['name'] for r in records) == [f'h{i}.example.com' for i in range(7)]
+        assert [params['offset'] for _, params, _ in stub.requests] == ['0', '3', '6']
+        results = ddns.sync(dnspod, {'h0.example.com': ['10.0.0.0'], 'new.example.com': ['10.0.2.2']})
+        assert all(ok for ok, _ in results)
+        assert any(r['name'] == 'new' and r['value'] == '10.0.2.2' for r in stub.records[ZONE])
+    finally:
+        stub.stop()
+
+def test_dnspod_empty_zone():
+    stub = DnspodStub()
+    try:
+        assert ddns.DnspodProvider('token', api_base=stub.url).list_records(ZONE) == []
+    finally:
+        stub.stop()
+
+def test_zone_id_is_cached(cloudflare, tmp_path):
+    cache = {}
+    first = provider(cloudflare, zone_cache=cache)
+    assert first.zone_for('a.b.example.com') == ZONE_ID
+    # 从最长的后缀开始查询，直到命中根域名
+    assert [path for _, path, _ in cloudflare.requests] == ['/zones', '/zones', '/zones']
+    assert cache == {'cloudflare': {ZONE: ZONE_ID}}
+
+    path = tmp_path / 'zone_cache.json'
+    ddns.save_zone_cache(cache, str(path))
+    second = provider(cloudflare, zone_cache=ddns.load_zone_cache(str(path)))
+    assert second.zone_for('c.example.com') == ZONE_ID
+    assert len(cloudflare.requests) == 3
+
+def test_native_run_uses_zone_cache_on_second_run(cloudflare, tmp_path, monkeypatch):
+    # 与 cf_ddns_cloudflare.sh 在 DDNS_NATIVE=true 时的调用方式相同：只传根域名和凭据，不传 zone_id
+    monkeypatch.setattr(ddns, 'ZONE_CACHE_FILE', str(tmp_path / '.zone_cache.json'))
+    monkeypatch.setenv('api_token', 'token')
+    monkeypatch.setenv('zone_id', '')
+    result = tmp_path / 'result.csv'
+    result.write_text('IP 地址,已发送,已接收,丢包率,平均延迟,下载速度 (MB/s)\n1.1.1.1,4,4,0.00,10.00,5.00\n',
+                      encoding='utf-8')
+    argv = ['--zone', ZONE, '--result', str(result), '--api-base', cloudflare.url, '--rate', '0', 'a.example.com']
+
+    assert ddns.main(argv) == 0
+    assert [path for _, path in cloudflare.calls('GET') if path == '/zones'] == ['/zones']
+    assert ddns.load_zone_cache() == {'cloudflare': {ZONE: ZONE_ID}}
+
+    del cloudflare.requests[:]
+    assert ddns.main(argv) == 0
+    assert not [path for _, path in cloudflare.calls() if path == '/zones']
+    assert cloudflare.calls() == [('GET', f'/zones/{ZONE_ID}/dns_records')]
+    assert cloudflare.contents(ZONE_ID) == [('a.example.com', 'A', '1.1.1.1')]
+
+def test_unknown_zone_raises(cloudflare):
+    with pytest.raises(ddns.DDNSError):
+        provider(cloudflare).zone_for('a.example.org')
+
+def test_retries_after_429(cloudflare):
+    cloudflare.throttle_once = True
+    assert provider(cloudflare).zone_for('example.com') == ZONE_ID
+    assert len(cloudflare.requests) == 2
+
+# ==================== 限速 ====================
+
+def test_rate_limiter_spaces_requests_across_threads():
+    limiter = ddns.RateLimiter(50)
+    stamps = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(4):
+            limiter.wait()
+            with lock:
+                stamps.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stamps.sort()
+    # 12 次请求之间共 11 个间隔，每个至少 1/50 秒（允许少量计时误差）
+    assert stamps[-1] - stamps[0] >= 11 * 0.02 * 0.9
+    assert min(b - a for a, b in zip(stamps, stamps[1:])) >= 0.02 * 0.5
+
+def test_rate_limiter_disabled():
+    limiter = ddns.RateLimiter(0)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.wait()
+    assert time.monotonic() - start < 0.05
+
+def test_rate_limit_applies_to_concurrent_sync(cloudflare):
+    rate = 20
+    desired = {f'h{i}.example.com': [f'10.0.0.{i}'] for i in range(6)}
+    results = ddns.sync(provider(cloudflare, limiter=ddns.RateLimiter(rate)), desired, workers=4)
+    assert all(ok for ok, _ in results)
+    stamps = sorted(stamp for _, _, stamp in cloudflare.requests)
+    # 两次区域查询、一次列出记录、六次新增
+    assert len(stamps) == 9
+    assert stamps[-1] - stamps[0] >= (len(stamps) - 1) / rate * 0.9
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+import dns_resolver
+from dns_stub import DNSStub
+
+@pytest.fixture
+def stub():
+    server = DNSStub()
+    yield server
+    server.close()
+
+def resolver(stub, cache=None, **kwargs):
+    kwargs.setdefault('timeout', 0.3)
+    kwargs.setdefault('attempts', 1)
+    return dns_resolver.Resolver([stub.server], cache or dns_resolver.DNSCache(min_ttl=0), **kwargs)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_resolves_a_and_aaaa(stub):
+    stub.records[('edge.example.com', 1)] = (['104.16.1.1', '104.16.1.2'], 300)
+    stub.records[('edge.example.com', 28)] = (['2606:4700::1'], 300)
+    assert run(resolver(stub).resolve('Edge.Example.com.')) == ['104.16.1.1', '104.16.1.2', '2606:4700::1']
+
+def test_literal_ip_is_not_queried(stub):
+    assert run(resolver(stub).resolve('1.1.1.1')) == ['1.1.1.1']
+    assert stub.queries == []
+
+def test_truncated_reply_falls_back_to_tcp(stub):
+    stub.records[('big.example.com', 1)] = ([f'10.0.0.{i}' for i in range(1, 40)], 300)
+    stub.truncate.add('big.example.com')
+    addresses = run(resolver(stub).resolve('big.example.com'))
+    assert addresses == [f'10.0.0.{i}' for i in range(1, 40)]
+    # A 和 AAAA 各先走 UDP，被截断后各走一次 TCP
+    assert stub.count('big.example.com', 'udp') == 2
+    assert stub.count('big.example.com', 'tcp') == 2
+
+def test_answers_expire_after_ttl(stub, monkeypatch):
+    stub.records[('ttl.example.com', 1)] = (['10.0.0.1'], 30)
+    cache = dns_resolver.DNSCache(min_ttl=0)
+    r = resolver(stub, cache)
+    assert run(r.resolve('ttl.example.com')) == ['10.0.0.1']
+    assert run(r.resolve('ttl.example.com')) == ['10.0.0.1']
+    assert stub.count('ttl.example.com') == 2
+
+    stub.records[('ttl.example.com', 1)] = (['10.0.0.2'], 30)
+    now = time.time()
+    monkeypatch.setattr(dns_resolver.time, 'time', lambda: now + 31)
+    assert run(r.resolve('ttl.example.com')) == ['10.0.0.2']
+    # 只有 A 记录过期；AAAA 的无记录应答按 SOA 缓存 120 秒，仍然有效
+    assert stub.count('ttl.example.com') == 3
+
+def test_ttl_is_clamped(stub):
+    stub.records[('short.example.com', 1)] = (['10.0.0.1'], 1)
+    cache = dns_resolver.DNSCache(min_ttl=60, max_ttl=600)
+    before = time.time()
+    run(resolver(stub, cache).resolve('short.example.com'))
+    expires, addresses = cache.entries['short.example.com/1']
+    assert addresses == ['10.0.0.1']
+    assert before + 60 <= expires <= time.time() + 60
+
+def test_nxdomain_is_cached_with_soa_ttl(stub):
+    stub.nxdomain.add('missing.example.com')
+    cache = dns_resolver.DNSCache(min_ttl=0)
+    r = resolver(stub, cache)
+    before = time.time()
+    assert run(r.resolve('missing.example.com')) == []
+    assert run(r.resolve('missing.example.com')) == []
+    assert stub.count('missing.example.com') == 2
+    expires, addresses = cache.entries['missing.example.com/1']
+    assert addresses == []
+    assert before + stub.negative_ttl <= expires <= time.time() + stub.negative_ttl
+
+def test_concurrent_lookups_share_one_query(stub):
+    stub.records[('slow.example.com', 1)] = (['10.0.0.1'], 300)
+    stub.delay['slow.example.com'] = 0.2
+    r = resolver(stub, timeout=1.0)
+
+    async def many():
+        return await asyncio.gather(*(r.resolve('slow.example.com') for _ in range(10)))
+
+    assert run(many()) == [['10.0.0.1']] * 10
+    assert stub.count('slow.example.com') == 2
+
+def test_cache_survives_restart(stub, tmp_path):
+    stub.records[('disk.example.com', 1)] = (['10.0.0.1'], 300)
+    path = str(tmp_path / 'dns_cache.json')
+    cache = dns_resolver.DNSCache(path, min_ttl=0)
+    run(resolver(stub, cache).resolve('disk.example.com'))
+    cache.save()
+    assert run(resolver(stub, dns_resolver.DNSCache(path, min_ttl=0)).resolve('disk.example.com')) == ['10.0.0.1']
+    assert stub.count('disk.example.com') == 2
+
+# ==================== 系统解析兜底 ====================
+
+def with_fake_system(r, answers):
+    calls = []
+
+    async def system(name, qtype):
+        calls.append((name, qtype))
+        return answers.get(qtype, [])
+
+    r._system = system
+    return calls
+
+def test_servfail_falls_back_to_system_and_caches_it(stub):
+    stub.servfail.add('broken.example.com')
+    cache = dns_resolver.DNSCache(min_ttl=0)
+    r = resolver(stub, cache)
+    calls = with_fake_system(r, {1: ['192.0.2.1']})
+    assert run(r.resolve('broken.example.com')) == ['192.0.2.1']
+    assert run(r.resolve('broken.example.com')) == ['192.0.2.1']
+    assert sorted(calls) == [('broken.example.com', 1), ('broken.example.com', 28)]
+    assert r.failures == 2
+    assert cache.entries['broken.example.com/1'][1] == ['192.0.2.1']
+
+def test_timeout_falls_back_to_system(stub):
+    stub.drop.add('silent.example.com')
+    r = resolver(stub, timeout=0.1)
+    calls = with_fake_system(r, {1: ['192.0.2.2']})
+    assert run(r.resolve('silent.example.com')) == ['192.0.2.2']
+    assert len(calls) == 2
+
+def test_nxdomain_and_nodata_do_not_fall_back(stub):
+    stub.nxdomain.add('missing.example.com')
+    stub.records[('v4only.example.com', 1)] = (['10.0.0.1'], 300)
+    r = resolver(stub)
+    calls = with_fake_system(r, {1: ['192.0.2.3'], 28: ['2001:db8::3']})
+    assert run(r.resolve('missing.example.com')) == []
+    assert run(r.resolve('v4only.example.com')) == ['10.0.0.1']
+    assert calls == []
+    assert r.failures == 0
+
+def test_fallback_can_be_disabled(stub):
+    stub.servfail.add('broken.example.com')
+    r = resolver(stub, system_fallback=False)
+    calls = with_fake_system(r, {1: ['192.0.2.1']})
+    assert run(r.resolve('broken.example.com')) == []
+    assert calls == []
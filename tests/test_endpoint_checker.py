@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+
+import endpoint_checker
+from endpoint_stubs import Socks5Stub, TCPStub, TLSStub, closed_port
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(server):
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.close()
+
+def endpoint(port, username=None, password=''):
+    entry = f"{username}:{password}@127.0.0.1:{port}" if username else f"127.0.0.1:{port}"
+    return {"line": entry, "entry": entry, "host": "127.0.0.1", "port": port, "username": username, "password": password}
+
+def socks(ep, target=endpoint_checker.SOCKS_TARGET, samples=2):
+    return asyncio.run(endpoint_checker.check_socks(ep, '127.0.0.1', asyncio.Semaphore(4), samples, target, 1.0))
+
+def proxy(ep, samples=2):
+    async def run():
+        return await endpoint_checker.check_proxy(ep, '127.0.0.1', asyncio.Semaphore(4), samples, 1.0,
+                                                  endpoint_checker.prober._make_ssl_context(), 'localhost')
+    return asyncio.run(run())
+
+# ==================== SOCKS5 ====================
+
+def test_socks_without_auth(servers):
+    stub = servers(Socks5Stub())
+    result = socks(endpoint(stub.port), target='example.com:8443')
+    assert result["error"] is None
+    assert result["received"] == 2 and result["loss"] == 0
+    assert result["latency_ms"] >= result["connect_ms"] >= 0
+    assert stub.targets == [('example.com', 8443)] * 2
+
+def test_socks_username_password(servers):
+    stub = servers(Socks5Stub(users={'alice': 's3cret'}))
+    result = socks(endpoint(stub.port, 'alice', 's3cret'))
+    assert result["error"] is None and result["received"] == 2
+
+def test_socks_wrong_password(servers):
+    stub = servers(Socks5Stub(users={'alice': 's3cret'}))
+    result = socks(endpoint(stub.port, 'alice', 'wrong'))
+    assert result["error"] == "用户名或密码错误"
+    assert result["latency_ms"] is None and result["loss"] == 1.0
+    assert stub.targets == []
+
+def test_socks_requires_auth_but_none_given(servers):
+    stub = servers(Socks5Stub(users={'alice': 's3cret'}))
+    assert socks(endpoint(stub.port))["error"] == "认证方式被拒绝"
+
+def test_socks_rejected_connect(servers):
+    stub = servers(Socks5Stub(reject_connect=True))
+    result = socks(endpoint(stub.port))
+    assert result["error"] == "CONNECT 失败（REP=2）"
+    assert result["received"] == 0
+
+def test_socks_refused(servers):
+    result = socks(endpoint(closed_port()))
+    assert result["error"] and result["latency_ms"] is None
+
+# ==================== ProxyIP（TCP + TLS） ====================
+
+def test_proxy_tls_handshake(servers):
+    stub = servers(TLSStub())
+    result = proxy(endpoint(stub.port))
+    assert result["error"] is None and not result["tls_failed"]
+    assert result["latency_ms"] > result["connect_ms"] >= 0
+
+def test_proxy_without_tls(servers):
+    stub = servers(TCPStub())
+    result = proxy(endpoint(stub.port))
+    assert result["error"] == "TLS 握手失败"
+    assert result["tls_failed"] and result["latency_ms"] is None
+
+def test_proxy_refused():
+    result = proxy(endpoint(closed_port()))
+    assert result["error"] == "连接失败" and result["loss"] == 1.0
+
+# ==================== 排序与输出 ====================
+
+def test_ranked_alive_orders_by_loss_then_latency():
+    endpoints = [endpoint(port) for port in (1, 2, 3, 4)]
+    results = [
+        {"loss": 0.0, "tls_failed": False, "latency_ms": 50.0, "jitter_ms": 1.0, "error": None},
+        {"loss": 0.5, "tls_failed": False, "latency_ms": 5.0, "jitter_ms": 0.0, "error": None},
+        {"loss": 1.0, "tls_failed": False, "latency_ms": None, "jitter_ms": None, "error": "连接失败"},
+        {"loss": 0.0, "tls_failed": False, "latency_ms": 10.0, "jitter_ms": 3.0, "error": None},
+    ]
+    assert endpoint_checker.ranked_alive(endpoints, results) == [endpoints[3]["line"], endpoints[0]["line"], endpoints[1]["line"]]
+
+def test_main_writes_ranked_alive_lists(servers, tmp_path, monkeypatch):
+    fast = servers(Socks5Stub(users={'alice': 's3cret'}))
+    slow = servers(Socks5Stub(delay=0.05))
+    rejecting = servers(Socks5Stub(reject_connect=True))
+    tls = servers(TLSStub())
+    plain = servers(TCPStub())
+    dead = closed_port()
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'socks').write_text('\n'.join([
+        f"127.0.0.1:{slow.port}  # 慢",
+        f"alice:wrong@127.0.0.1:{fast.port}",
+        f"alice:s3cret@127.0.0.1:{fast.port}  # 快",
+        f"127.0.0.1:{rejecting.port}",
+        "# 注释行",
+        f"127.0.0.1:{dead}",
+    ]) + '\n', encoding='utf-8')
+    (tmp_path / 'proxy').write_text(f"127.0.0.1:{plain.port}\n127.0.0.1:{tls.port}\n127.0.0.1:{dead}\n", encoding='utf-8')
+
+    assert endpoint_checker.main(['--samples', '2', '--timeout', '1', '--sni', 'localhost']) == 0
+
+    assert (tmp_path / 'socks_alive.txt').read_text(encoding='utf-8').splitlines() == [
+        f"alice:s3cret@127.0.0.1:{fast.port}  # 快",
+        f"127.0.0.1:{slow.port}  # 慢",
+    ]
+    assert (tmp_path / 'proxy_alive.txt').read_text(encoding='utf-8').splitlines() == [f"127.0.0.1:{tls.port}"]
+    stats = json.loads((tmp_path / endpoint_checker.STATS_FILE).read_text(encoding='utf-8'))
+    errors = {item["entry"]: item["error"] for item in stats["socks"] + stats["proxy"]}
+    assert errors[f"alice:wrong@127.0.0.1:{fast.port}"] == "用户名或密码错误"
+    assert errors[f"127.0.0.1:{rejecting.port}"] == "CONNECT 失败（REP=2）"
+    assert errors[f"127.0.0.1:{plain.port}"] == "TLS 握手失败"
+    assert errors[f"127.0.0.1:{tls.port}"] is None
+    assert len(stats["socks"]) == 5 and len(stats["proxy"]) == 3
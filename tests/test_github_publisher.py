@@ -0,0 +1,73 @@
+import pytest
+
+from git_api_stub import GitDataStub
+from github_publisher import GitHubPublisher, PublishError, git_blob_sha
+
+FILES = {
+    'README.md': b'# repo\n',
+    'cf_ddns/result.csv': b'IP,Speed\n1.1.1.1,10\n',
+    'cf_ddns/ip.txt': b'1.1.1.1\n',
+}
+
+@pytest.fixture
+def stub():
+    server = GitDataStub(FILES)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def publisher(stub):
+    return GitHubPublisher('owner/repo', 'token', api_base=stub.url)
+
+def writes(stub):
+    return [(method, route) for method, route in stub.requests if method != 'GET']
+
+def test_blob_sha_matches_git():
+    # git hash-object 对空文件和 "hello\n" 的结果
+    assert git_blob_sha(b'') == 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+    assert git_blob_sha(b'hello\n') == 'ce013625030ba8dba906f756967f9e9ca394464a'
+
+def test_unchanged_files_are_skipped(stub):
+    head = stub.refs['main']
+    assert publisher(stub).publish(dict(FILES), 'update') == (None, [])
+    assert writes(stub) == []
+    assert stub.refs['main'] == head
+
+def test_many_files_in_a_single_commit(stub):
+    head = stub.refs['main']
+    files = dict(FILES)
+    files['cf_ddns/result.csv'] = b'IP,Speed\n2.2.2.2,20\n'
+    files.update({f'out/{i}.txt': f'{i}\n'.encode() for i in range(20)})
+    files['out/bin.dat'] = b'\xff\x00\xfe'
+    sha, changed = publisher(stub).publish(files, 'update')
+    assert sha == stub.refs['main']
+    assert stub.commits[sha]['parents'] == [head]
+    assert sorted(changed) == sorted(['cf_ddns/result.csv', 'out/bin.dat'] + [f'out/{i}.txt' for i in range(20)])
+    assert [route for _, route in writes(stub)].count('/git/commits') == 1
+    assert [route for _, route in writes(stub)].count('/git/trees') == 1
+    assert stub.head_files() == files
+
+def test_retries_when_branch_moved(stub):
+    stub.race_once = True
+    files = dict(FILES, **{'cf_ddns/ip.txt': b'3.3.3.3\n'})
+    sha, changed = publisher(stub).publish(files, 'update')
+    assert changed == ['cf_ddns/ip.txt']
+    assert [route for _, route in writes(stub)].count('/git/commits') == 2
+    head_files = stub.head_files()
+    assert head_files['external.txt'] == b'pushed meanwhile\n'
+    assert head_files['cf_ddns/ip.txt'] == b'3.3.3.3\n'
+    assert stub.commits[stub.commits[sha]['parents'][0]]['message'] == 'external'
+
+def test_gives_up_after_retries(stub):
+    stub.race_once = True
+    with pytest.raises(PublishError) as error:
+        publisher(stub).publish(dict(FILES, **{'README.md': b'new\n'}), 'update', retries=0)
+    assert error.value.status == 422
+
+def test_truncated_tree_falls_back_to_per_path_lookup(stub):
+    stub.truncate_recursive = True
+    assert publisher(stub).publish(dict(FILES), 'update') == (None, [])
+    files = dict(FILES, **{'cf_ddns/result.csv': b'changed\n', 'new/dir/file.txt': b'x\n'})
+    sha, changed = publisher(stub).publish(files, 'update')
+    assert sorted(changed) == ['cf_ddns/result.csv', 'new/dir/file.txt']
+    assert stub.head_files() == files
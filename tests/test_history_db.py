@@ -0,0 +1,25 @@
+import history_db
+
+def observation(ip, latency_ms=50):
+    return {"ip": ip, "source": "test", "latency_ms": latency_ms, "label": f"HKG-{latency_ms}ms"}
+
+def test_prune_drops_old_observations_and_stale_scores(tmp_path):
+    with history_db.HistoryStore(str(tmp_path / 'history.sqlite3')) as store:
+        store.record([observation('1.1.1.1'), observation('2.2.2.2')], observed_at=1000)
+        store.record([observation('1.1.1.1')], observed_at=5000)
+        store.record([observation('3.3.3.3')], observed_at=9000)
+
+        assert store.prune(before=4000) == (2, 1)
+        assert store.stats() == {"observations": 2, "ips": 2}
+        # 仍在保留期内的 IP 保留全部累计评分和出现次数
+        assert {ip: count for ip, _, count, _ in store.ranked(now=9000)} == {'1.1.1.1': 2, '3.3.3.3': 1}
+
+def test_ranked_orders_by_decayed_score(tmp_path):
+    with history_db.HistoryStore(str(tmp_path / 'history.sqlite3'), half_life_hours=1) as store:
+        store.record([observation('1.1.1.1')], observed_at=0)
+        store.record([observation('2.2.2.2')], observed_at=7200)
+        ranked = store.ranked(now=7200)
+        assert [ip for ip, _, _, _ in ranked] == ['2.2.2.2', '1.1.1.1']
+        assert abs(ranked[1][1] * 4 - ranked[0][1]) < 1e-9
+        assert store.ranked(since=3600, now=7200)[0][0] == '2.2.2.2'
+        assert len(store.ranked(since=3600, now=7200)) == 1
@@ -0,0 +1,75 @@
+import gzip
+import http.server
+import threading
+
+import pytest
+import requests
+
+import ips
+
+BODY = ''.join(f"10.0.{i // 256}.{i % 256}\n" for i in range(20000)).encode()
+
+# 模拟 Fission_ip.txt：客户端接受 gzip 就压缩；cut 大于 0 时第一次响应只发前 cut 字节就断开
+class FissionStub:
+    def __init__(self, cut=0):
+        self.cut = cut
+        self.requests = []
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requests.append({key: self.headers.get(key) for key in ('Accept-Encoding', 'Range', 'If-Range')})
+                data, status, start = BODY, 200, 0
+                range_header = self.headers.get('Range')
+                if range_header and self.headers.get('If-Range') == '"v1"':
+                    start = int(range_header.split('=')[1].rstrip('-'))
+                    data, status = BODY[start:], 206
+                gzipped = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+                if gzipped:
+                    data = gzip.compress(data)
+                self.send_response(status)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', str(len(data)))
+                if status == 206:
+                    self.send_header('Content-Range', f"bytes {start}-{len(BODY) - 1}/{len(BODY)}")
+                if gzipped:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.end_headers()
+                if stub.cut and len(stub.requests) == 1:
+                    self.wfile.write(data[:stub.cut])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/Fission_ip.txt"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ips.time, 'sleep', lambda seconds: None)
+
+def test_resume_requests_uncompressed_bytes(tmp_path):
+    # 断开前收满两个完整的块，第三个块不完整被丢弃，续传从 2 * CHUNK_SIZE 开始
+    stub = FissionStub(cut=2 * ips.CHUNK_SIZE + 1000)
+    try:
+        target = str(tmp_path / 'ip.txt')
+        stats = ips.CandidateDownload(stub.url, target).run(requests.Session())
+    finally:
+        stub.stop()
+    assert [r['Accept-Encoding'] for r in stub.requests] == ['identity', 'identity']
+    assert stub.requests[1]['Range'] == f"bytes={2 * ips.CHUNK_SIZE}-"
+    assert stats['valid'] == 20000
+    with open(target, 'rb') as f:
+        assert f.read() == BODY
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['.ip_txt_cache.json', 'ip.txt']
@@ -0,0 +1,85 @@
+import os
+import threading
+
+import pytest
+
+import atomic_file
+import output_writer
+
+# cf_ddns 目录单独部署，带有自己的 write_atomic，两份实现跑同样的用例
+writers = pytest.mark.parametrize("write_atomic", [output_writer.write_atomic, atomic_file.write_atomic])
+
+@writers
+def test_write_atomic_replaces_file(tmp_path, write_atomic):
+    path = tmp_path / 'sub' / 'out.txt'
+    write_atomic(str(path), '第一版\n')
+    write_atomic(str(path), b'\x00binary')
+    assert path.read_bytes() == b'\x00binary'
+    assert os.listdir(path.parent) == ['out.txt']
+
+@writers
+def test_write_atomic_keeps_old_file_and_mode_on_error(tmp_path, monkeypatch, write_atomic):
+    path = tmp_path / 'out.txt'
+    path.write_text('old', encoding='utf-8')
+    os.chmod(path, 0o640)
+    write_atomic(str(path), 'new')
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+    def fail(*args):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(os, 'fsync', fail)
+    with pytest.raises(OSError):
+        write_atomic(str(path), 'newer')
+    assert path.read_text(encoding='utf-8') == 'new'
+    assert os.listdir(tmp_path) == ['out.txt']
+
+@writers
+def test_concurrent_writers_do_not_share_temp_file(tmp_path, write_atomic):
+    path = str(tmp_path / 'out.json')
+    payloads = [str(i) * 200000 for i in range(8)]
+    errors = []
+
+    def write(data):
+        try:
+            write_atomic(path, data)
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(data,)) for data in payloads]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    with open(path, encoding='utf-8') as f:
+        assert f.read() in payloads
+    assert os.listdir(tmp_path) == ['out.json']
+
+def test_outputs_rewritten_only_when_stable_pairs_change(tmp_path):
+    outputs = {fmt: str(tmp_path / f'89.{fmt}') for fmt in output_writer.FORMATS}
+    template = {"type": "vless", "port": 443}
+
+    def records(ips, latency, colo='HKG'):
+        return [{"ip": ip, "label": f"{colo}-{latency}ms", "latency_ms": latency} for ip in ips]
+
+    assert all(output_writer.write_outputs(records(['1.1.1.1', '2.2.2.2'], 10), outputs, template).values())
+    assert not any(output_writer.write_outputs(records(['2.2.2.2', '1.1.1.1'], 25), outputs, template).values())
+    assert all(output_writer.write_outputs(records(['2.2.2.2', '3.3.3.3'], 25), outputs, template).values())
+    changed = output_writer.write_outputs(records(['2.2.2.2', '3.3.3.3'], 25), outputs, dict(template, port=8443))
+    assert [path for path, updated in changed.items() if updated] == [outputs["yaml"]]
+
+def test_label_change_without_ip_change_is_written(tmp_path):
+    outputs = {fmt: str(tmp_path / f'89.{fmt}') for fmt in output_writer.FORMATS}
+    template = {"type": "vless", "port": 443}
+    output_writer.write_outputs([{"ip": "1.1.1.1", "label": "US-30.46MB/s-85ms"}], outputs, template)
+    assert not any(output_writer.write_outputs([{"ip": "1.1.1.1", "label": "US-12MB/s-40ms"}], outputs, template).values())
+    assert all(output_writer.write_outputs([{"ip": "1.1.1.1", "label": "JP-12MB/s-40ms"}], outputs, template).values())
+    with open(outputs["txt"], encoding='utf-8') as f:
+        assert f.read() == '1.1.1.1#JP-12MB/s-40ms'
+
+def test_stable_label():
+    assert output_writer.stable_label("SEA-CT-85ms") == "SEA-CT"
+    assert output_writer.stable_label("US-30.46MB/s") == "US"
+    assert output_writer.stable_label("HKG-移动") == "HKG-移动"
+    assert output_writer.stable_label(None) == ""
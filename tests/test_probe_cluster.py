@@ -0,0 +1,103 @@
+import os
+import socket
+import threading
+import urllib.error
+
+import pytest
+
+import probe_cluster
+import prober
+
+def result(ip, latency=10.0, **extra):
+    return dict(prober.summarize(ip, [latency] if latency is not None else [], [], 1), **extra)
+
+def test_rejects_unknown_lease_and_foreign_ips():
+    table = probe_cluster.LeaseTable(['1.1.1.1', '2.2.2.2'], shard_size=1)
+    lease = table.acquire('w1', now=0)
+    assert table.report('bogus', [result('6.6.6.6')], now=0) == {"accepted": 0, "rejected": 1, "active": False}
+    reply = table.report(lease["lease"], [result('6.6.6.6'), result('2.2.2.2'), result(lease["ips"][0])], now=0)
+    assert reply["accepted"] == 1 and reply["rejected"] == 2
+    assert set(table.results) == set(lease["ips"])
+    assert table.status()["rejected"] == 3
+    assert not table.done.is_set()
+
+def test_rejects_malformed_results():
+    table = probe_cluster.LeaseTable(['1.1.1.1'])
+    lease = table.acquire('w1', now=0)
+    bad = [
+        {"ip": '1.1.1.1'},
+        dict(result('1.1.1.1'), latency_ms='fast'),
+        dict(result('1.1.1.1'), loss=2),
+        dict(result('1.1.1.1'), received=5),
+        dict(result('1.1.1.1'), sent=True),
+        dict(result('1.1.1.1'), latency_ms=float('nan')),
+        'not a dict',
+    ]
+    assert table.report(lease["lease"], bad, now=0)["rejected"] == len(bad)
+    assert table.results == {}
+    assert table.report(lease["lease"], [result('1.1.1.1', 12.5)], final=True, now=0)["accepted"] == 1
+    assert table.done.is_set()
+    assert [r["ip"] for r in probe_cluster.ranked(table.results)] == ['1.1.1.1']
+
+def test_done_only_when_every_candidate_has_a_result():
+    table = probe_cluster.LeaseTable(['1.1.1.1', '2.2.2.2', '3.3.3.3'], shard_size=2)
+    first = table.acquire('w1', now=0)
+    table.report(first["lease"], [result(ip) for ip in first["ips"]], final=True, now=0)
+    assert not table.done.is_set()
+    second = table.acquire('w1', now=0)
+    table.report(second["lease"], [result(ip, None) for ip in second["ips"]], final=True, now=0)
+    assert table.done.is_set()
+    assert table.acquire('w1', now=0) == {"done": True}
+
+def test_late_results_of_reclaimed_lease_are_accepted():
+    table = probe_cluster.LeaseTable(['1.1.1.1', '2.2.2.2'], lease_ttl=5)
+    stale = table.acquire('w1', now=0)
+    fresh = table.acquire('w2', now=10)
+    assert fresh["ips"] == stale["ips"]
+    assert table.report(stale["lease"], [result('1.1.1.1')], now=11)["accepted"] == 1
+    table.report(fresh["lease"], [result('1.1.1.1', 99.0), result('2.2.2.2')], final=True, now=12)
+    assert table.results['1.1.1.1']["latency_ms"] == 10.0
+    assert table.done.is_set()
+
+def test_non_loopback_bind_requires_token():
+    table = probe_cluster.LeaseTable(['1.1.1.1'])
+    with pytest.raises(ValueError):
+        probe_cluster.coordinate(table, {}, '0.0.0.0', 0, '')
+    assert probe_cluster.main(['coordinator', '--host', '0.0.0.0', '--token', '', 'missing.txt']) == 2
+    assert probe_cluster.CLUSTER_HOST == '127.0.0.1'
+    assert probe_cluster.is_loopback('localhost') and probe_cluster.is_loopback('::1')
+
+@pytest.fixture
+def server():
+    table = probe_cluster.LeaseTable(['1.1.1.1'])
+    srv = probe_cluster.ClusterServer(('127.0.0.1', 0), table, {"samples": 1}, token='secret')
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+def test_wrong_token_is_rejected_before_reading_body(server):
+    # 声明了很大的请求体但一个字节也不发：先校验 token 的话不必等待请求体就能拿到 403
+    with socket.create_connection(server.server_address, timeout=2) as sock:
+        sock.sendall(b'POST /lease HTTP/1.1\r\nHost: x\r\nX-Cluster-Token: guess\r\n'
+                     b'Content-Type: application/json\r\nContent-Length: 10000000\r\n\r\n')
+        reply = sock.recv(4096)
+    assert reply.startswith(b'HTTP/1.1 403')
+    assert server.table.workers == {}
+
+def test_right_token_gets_a_lease(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    reply = probe_cluster.Coordinator(url, 'secret').call('/lease', {"worker": "w1"})
+    assert reply["ips"] == ['1.1.1.1'] and reply["probe"] == {"samples": 1}
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        probe_cluster.Coordinator(url, 'secreT').call('/lease', {"worker": "w2"})
+    assert excinfo.value.code == 403
+
+def test_default_outputs_stay_out_of_published_files(monkeypatch):
+    seen = {}
+    monkeypatch.setattr(probe_cluster, '_prepare', lambda args: probe_cluster.LeaseTable([]))
+    monkeypatch.setattr(probe_cluster, 'coordinate', lambda *args, **kwargs: {})
+    monkeypatch.setattr(probe_cluster, '_finish', lambda table, args: seen.update(csv=args.csv, txt=args.txt) or 0)
+    assert probe_cluster.main(['coordinator']) == 0
+    assert seen == {"csv": os.path.join('.cache', 'probe_cluster', 'result.csv'),
+                    "txt": os.path.join('.cache', 'probe_cluster', '89.txt')}